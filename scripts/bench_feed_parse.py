@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+フィードパースのベンチマーク（feedparser vs ストリーミングパーサ）
+
+記録済みフィード（*.xml）を読み込み、1 フィードあたりのパース時間を比較する。
+  - feedparser : 旧 parse_entries（全件 + reverse）
+  - stream/all : feed_parser.parse_feed（打ち切りなし = 初回巡回相当）
+  - stream/new1: feed_parser.parse_feed（2 番目の動画で打ち切り = 新着 1 本の典型ケース）
+
+使い方:
+  # フィードを記録（rss_channels から N 件取得して data/feeds/ に保存）
+  python scripts/bench_feed_parse.py --record 200 --db data/rss_watch.sqlite --feeds-dir data/feeds
+  # 計測
+  python scripts/bench_feed_parse.py --feeds-dir data/feeds --repeat 20
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from ytanalyzer.services.feed_parser import parse_feed
+from ytanalyzer.services.rss_watcher import HEADERS_BASE, parse_entries_feedparser
+
+
+def record(db: str, feeds_dir: str, n: int) -> int:
+    import httpx
+
+    os.makedirs(feeds_dir, exist_ok=True)
+    con = sqlite3.connect(db)
+    ids = [r[0] for r in con.execute("select channel_id from rss_channels where disabled=0 order by random() limit ?", (n,))]
+    con.close()
+    saved = 0
+    with httpx.Client(headers=HEADERS_BASE, timeout=20.0) as client:
+        for cid in ids:
+            try:
+                r = client.get(f"https://www.youtube.com/feeds/videos.xml?channel_id={cid}")
+            except httpx.HTTPError:
+                continue
+            if r.status_code != 200:
+                continue
+            with open(os.path.join(feeds_dir, f"{cid}.xml"), "wb") as f:
+                f.write(r.content)
+            saved += 1
+            time.sleep(0.2)
+    print(f"recorded {saved}/{len(ids)} feeds -> {feeds_dir}")
+    return saved
+
+
+def _time_per_call(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def bench(feeds_dir: str, repeat: int) -> None:
+    files = sorted(glob.glob(os.path.join(feeds_dir, "*.xml")))
+    if not files:
+        print(f"no feeds in {feeds_dir} (use --record)")
+        return
+    res = {"feedparser": [], "stream/all": [], "stream/new1": []}
+    for fp in files:
+        with open(fp, "rb") as f:
+            body = f.read()
+        text = body.decode("utf-8", errors="replace")
+        entries, _ = parse_feed(body)
+        # 新しい→古いの 2 番目（= 前回の最新）で打ち切る
+        stop = entries[-2]["video_id"] if len(entries) >= 2 else None
+        res["feedparser"].append(_time_per_call(lambda: parse_entries_feedparser(text), repeat))
+        res["stream/all"].append(_time_per_call(lambda: parse_feed(body), repeat))
+        res["stream/new1"].append(_time_per_call(lambda: parse_feed(body, stop_at=stop), repeat))
+
+    base = statistics.mean(res["feedparser"])
+    print(f"feeds={len(files)} repeat={repeat}")
+    print(f"{'parser':<12} {'mean_us':>10} {'p50_us':>10} {'p95_us':>10} {'speedup':>8}")
+    for name, xs in res.items():
+        xs_sorted = sorted(xs)
+        p95 = xs_sorted[min(len(xs_sorted) - 1, int(len(xs_sorted) * 0.95))]
+        mean = statistics.mean(xs)
+        print(
+            f"{name:<12} {mean * 1e6:>10.1f} {statistics.median(xs) * 1e6:>10.1f} {p95 * 1e6:>10.1f} {base / mean:>7.1f}x"
+        )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark feed parsing on recorded YouTube feeds")
+    ap.add_argument("--feeds-dir", default=os.path.join("data", "feeds"))
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--record", type=int, default=0, help="rss_channels から N 件のフィードを記録してから計測")
+    ap.add_argument("--db", default=os.path.join("data", "rss_watch.sqlite"))
+    args = ap.parse_args()
+    if args.record:
+        record(args.db, args.feeds_dir, args.record)
+    bench(args.feeds_dir, max(1, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
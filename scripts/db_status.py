@@ -10,6 +10,7 @@ if _ROOT not in sys.path:
     sys.path.insert(0, _ROOT)
 
 from ytanalyzer.config import Config
+from ytanalyzer.services.stats_counters import get_counters, hourly_since, row_count
 
 
 def main():
@@ -21,7 +22,9 @@ def main():
 
     def show_latest(table: str, ts_col: str = "published_at"):
         try:
-            cnt = cur.execute(f"select count(*) from {table}").fetchone()[0]
+            cnt = row_count(con, table)
+            if cnt is None:
+                cnt = cur.execute(f"select count(*) from {table}").fetchone()[0]
             latest = cur.execute(f"select max({ts_col}) from {table}").fetchone()[0]
             print(f"{table}: count={cnt}, latest_{ts_col}={latest}")
         except Exception as e:
@@ -65,26 +68,39 @@ def main():
             return -1
 
     print("last_1h:")
+    # 件数の多いテーブルは stats_hourly（トリガで維持）から。時単位なので直近 1〜2 時間分
     for col in ("discovered_at", "created_at", "updated_at"):
         n = since_1h("rss_videos", col)
         if n >= 0:
             print(f"  rss_videos.{col}: {n}")
             break
-    for col in ("polled_at", "updated_at", "fetched_at"):
-        n = since_1h("ytapi_snapshots", col)
-        if n >= 0:
-            print(f"  ytapi_snapshots.{col}: {n}")
-            break
+    n = hourly_since(con, "snapshots", 1)
+    if n is not None:
+        print(f"  ytapi_snapshots (stats_hourly): {n}")
+    else:
+        for col in ("polled_at", "updated_at", "fetched_at"):
+            n = since_1h("ytapi_snapshots", col)
+            if n >= 0:
+                print(f"  ytapi_snapshots.{col}: {n}")
+                break
     for col in ("updated_at", "published_at"):
         n = since_1h("trending_ranks", col)
         if n >= 0:
             print(f"  trending_ranks.{col}: {n}")
             break
-    for col in ("discovered_at", "created_at"):
-        n = since_1h("rss_videos_discovered", col)
-        if n >= 0:
-            print(f"  rss_videos_discovered.{col}: {n}")
-            break
+    n = hourly_since(con, "discovered", 1)
+    if n is not None:
+        print(f"  rss_videos_discovered (stats_hourly): {n}")
+    else:
+        for col in ("discovered_at", "created_at"):
+            n = since_1h("rss_videos_discovered", col)
+            if n >= 0:
+                print(f"  rss_videos_discovered.{col}: {n}")
+                break
+
+    polls = get_counters(con, "poll:")
+    if polls:
+        print("poll_status: " + ", ".join(f"{k}={v}" for k, v in sorted(polls.items())))
 
     con.close()
 
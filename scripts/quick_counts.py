@@ -8,6 +8,7 @@ if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 
 from ytanalyzer.config import Config
+from ytanalyzer.services.stats_counters import row_count
 
 
 def main():
@@ -24,8 +25,13 @@ def main():
     ]
     for t in tables:
         try:
-            n = cur.execute(f"select count(*) from {t}").fetchone()[0]
-            print(f"{t}: {n}")
+            # stats_counters があればそれを使う（全件 count(*) は遅い）
+            n = row_count(con, t)
+            src = "counter"
+            if n is None:
+                n = cur.execute(f"select count(*) from {t}").fetchone()[0]
+                src = "count(*)"
+            print(f"{t}: {n} ({src})")
         except Exception as e:
             print(f"{t}: (missing) {e}")
     con.close()
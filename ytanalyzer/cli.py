@@ -22,6 +22,33 @@ def rss_watch(
     tick: int = typer.Option(5, help="Tick seconds"),
     once: bool = typer.Option(False, help="Run a single batch and exit"),
     limit: int = typer.Option(0, help="Max channels when --once"),
+    scheduler: str = typer.Option("db", help="db (query per tick) or heap (in-memory min-heap)"),
+    lease_sec: int = typer.Option(900, help="Reservation lease seconds (expired leases are reclaimed)"),
+    commit_ms: int = typer.Option(200, help="Writer thread commit interval (ms)"),
+    commit_ops: int = typer.Option(2000, help="Max operations per commit"),
+    processes: int = typer.Option(1, help="Shard channels across N processes sharing the --rps budget"),
+    aimd: bool = typer.Option(True, help="Adapt the global rate to 429/5xx (AIMD); --no-aimd to disable"),
+    min_rps: float = typer.Option(1.0, help="Lower bound for AIMD rate cuts"),
+    adaptive_workers: bool = typer.Option(False, help="Size in-flight requests from observed latency"),
+    upload_profile: bool = typer.Option(True, help="Poll around each channel's usual upload hours"),
+    seed_interval: int = typer.Option(60, help="Seconds between picking up channels appended to the NDJSON (0=off)"),
+    metrics_port: int = typer.Option(0, help="Expose Prometheus metrics on this port (0=off)"),
+    parse_workers: int = typer.Option(0, help="Feed parse pool size (0=parse on the event loop)"),
+    parse_pool: str = typer.Option("thread", help="thread or process"),
+    feed_url: Optional[str] = typer.Option(None, help="Override the feed base URL (e.g. a local fake feed server)"),
+    known_cache: bool = typer.Option(True, help="Check video IDs against an in-memory set + Bloom filter before SQLite"),
+    known_hot_days: int = typer.Option(7, help="Days of recent videos kept in the exact known-ID set"),
+    push_poll_sec: int = typer.Option(43200, help="Min poll interval for channels with an active WebSub lease (0=ignore push)"),
+    watch_share: float = typer.Option(0.3, help="Request share guaranteed to rss_watchlist channels under contention (0=no lanes)"),
+    watch_max_interval: int = typer.Option(900, help="Max poll interval (s) for rss_watchlist channels (0=no cap)"),
+    retire_after: int = typer.Option(3, help="Disable a channel after this many consecutive 403/404/410 (0=never)"),
+    revalidate_days: float = typer.Option(7.0, help="Days before re-checking a retired channel (doubles each time it is still gone)"),
+    pipeline: bool = typer.Option(False, help="Send newly discovered videos straight to videos.list (no rss-export/api-fetch hop)"),
+    api_key: Optional[str] = typer.Option(None, help="YouTube API key for --pipeline (defaults to env YOUTUBE_API_KEY)"),
+    pipeline_batch: int = typer.Option(50, help="IDs per videos.list call in pipeline mode (<=50)"),
+    pipeline_wait: float = typer.Option(10.0, help="Send a partial batch this many seconds after its first ID"),
+    pipeline_qps: float = typer.Option(1.0, help="videos.list requests per second in pipeline mode"),
+    pipeline_audit_dir: Optional[str] = typer.Option(None, help="Append pipelined IDs to rss_pipeline_YYYYMMDD.jsonl here"),
 ):
     from .services import rss_watcher
     argv = [
@@ -31,7 +58,42 @@ def rss_watch(
         "--rps", str(rps),
         "--batch", str(batch),
         "--tick", str(tick),
+        "--scheduler", scheduler,
+        "--lease-sec", str(lease_sec),
+        "--commit-ms", str(commit_ms),
+        "--commit-ops", str(commit_ops),
+        "--processes", str(processes),
+        "--min-rps", str(min_rps),
+        "--seed-interval", str(seed_interval),
+        "--metrics-port", str(metrics_port),
+        "--parse-workers", str(parse_workers),
+        "--parse-pool", parse_pool,
+        "--known-hot-days", str(known_hot_days),
+        "--push-poll-sec", str(push_poll_sec),
+        "--watch-share", str(watch_share),
+        "--watch-max-interval", str(watch_max_interval),
+        "--retire-after", str(retire_after),
+        "--revalidate-days", str(revalidate_days),
+        "--pipeline-batch", str(pipeline_batch),
+        "--pipeline-wait", str(pipeline_wait),
+        "--pipeline-qps", str(pipeline_qps),
     ]
+    if pipeline:
+        argv.append("--pipeline")
+    if api_key:
+        argv += ["--api-key", api_key]
+    if pipeline_audit_dir:
+        argv += ["--pipeline-audit-dir", pipeline_audit_dir]
+    if not known_cache:
+        argv.append("--no-known-cache")
+    if feed_url:
+        argv += ["--feed-url", feed_url]
+    if not aimd:
+        argv.append("--no-aimd")
+    if adaptive_workers:
+        argv.append("--adaptive-workers")
+    if not upload_profile:
+        argv.append("--no-upload-profile")
     if once:
         argv.append("--once")
         if limit:
@@ -46,6 +108,8 @@ def rss_export(
     window_minutes: int = typer.Option(10),
     loop: bool = typer.Option(False),
     min_published_hours: int = typer.Option(48),
+    max_rows: int = typer.Option(50000, help="Max rows per export file"),
+    from_rowid: Optional[int] = typer.Option(None, help="Reset the export cursor to this rowid first (0 = re-export all)"),
 ):
     from .services import rss_export
     argv = [
@@ -53,7 +117,10 @@ def rss_export(
         "--out-dir", out_dir,
         "--window-minutes", str(window_minutes),
         "--min-published-hours", str(min_published_hours),
+        "--max-rows", str(max_rows),
     ]
+    if from_rowid is not None:
+        argv += ["--from-rowid", str(from_rowid)]
     if loop:
         argv.append("--loop")
     rss_export.main(argv)
@@ -63,9 +130,13 @@ def rss_export(
 def api_fetch(
     db: str = typer.Option("data/rss_watch.sqlite"),
     in_dir: str = typer.Option("exports"),
-    api_key: Optional[str] = typer.Option(None, help="YouTube API key (env YOUTUBE_API_KEY as default)"),
+    api_key: Optional[str] = typer.Option(None, help="YouTube API key, comma-separated for several (env YOUTUBE_API_KEY as default)"),
     batch_size: int = typer.Option(50),
-    qps: float = typer.Option(1.0),
+    qps: float = typer.Option(1.0, help="Requests per second per key"),
+    concurrency: int = typer.Option(4, help="Requests in flight at once"),
+    daily_units: int = typer.Option(10000, help="Per-key daily unit budget (resets at Pacific midnight)"),
+    deadline_sec: int = typer.Option(1200, help="How long new IDs may wait to share a full 50-ID request"),
+    horizon_sec: int = typer.Option(600, help="Seconds until the next run; partial batches due before then are sent now"),
     all_files: bool = typer.Option(False),
     max_files: int = typer.Option(0),
 ):
@@ -75,6 +146,10 @@ def api_fetch(
         "--in-dir", in_dir,
         "--batch-size", str(batch_size),
         "--qps", str(qps),
+        "--concurrency", str(concurrency),
+        "--daily-units", str(daily_units),
+        "--deadline-sec", str(deadline_sec),
+        "--horizon-sec", str(horizon_sec),
     ]
     if api_key:
         argv += ["--api-key", api_key]
@@ -88,8 +163,11 @@ def api_fetch(
 @app.command("api-refetch")
 def api_refetch(
     db: str = typer.Option("data/rss_watch.sqlite"),
-    api_key: Optional[str] = typer.Option(None, help="YouTube API key (env YOUTUBE_API_KEY as default)"),
-    qps: float = typer.Option(1.5),
+    api_key: Optional[str] = typer.Option(None, help="YouTube API key, comma-separated for several (env YOUTUBE_API_KEY as default)"),
+    qps: float = typer.Option(1.5, help="Requests per second per key"),
+    concurrency: int = typer.Option(4, help="Requests in flight at once"),
+    daily_units: int = typer.Option(10000, help="Per-key daily unit budget (resets at Pacific midnight)"),
+    horizon_sec: int = typer.Option(300, help="Seconds until the next run; partial batches due before then are sent now"),
     tol_minutes: int = typer.Option(15),
     window_hours: int = typer.Option(30),
     max_ids: int = typer.Option(0),
@@ -99,6 +177,9 @@ def api_refetch(
     argv = [
         "--db", db,
         "--qps", str(qps),
+        "--concurrency", str(concurrency),
+        "--daily-units", str(daily_units),
+        "--horizon-sec", str(horizon_sec),
         "--tol-minutes", str(tol_minutes),
         "--window-hours", str(window_hours),
         "--batch-size", str(batch_size),
@@ -127,6 +208,121 @@ def growth_rank(
     growth_ranker.main(argv)
 
 
+@app.command("latency-report")
+def latency_report(
+    db: str = typer.Option("data/rss_watch.sqlite"),
+    hours: int = typer.Option(24, help="Videos discovered within the last N hours"),
+    backfill_days: int = typer.Option(0, help="Load the last N days from existing tables first"),
+    json_out: bool = typer.Option(False, "--json", help="Print JSON"),
+):
+    from .services import latency_ledger
+    argv = [
+        "--db", db,
+        "--hours", str(hours),
+        "--backfill-days", str(backfill_days),
+    ]
+    if json_out:
+        argv.append("--json")
+    latency_ledger.main(argv)
+
+
+@app.command("quota-report")
+def quota_report(
+    db: str = typer.Option("data/rss_watch.sqlite"),
+    day: Optional[str] = typer.Option(None, help="Pacific date YYYY-MM-DD (default: today)"),
+    json_out: bool = typer.Option(False, "--json", help="Print JSON"),
+):
+    from .services import quota_ledger
+    argv = ["--db", db]
+    if day:
+        argv += ["--day", day]
+    if json_out:
+        argv.append("--json")
+    quota_ledger.main(argv)
+
+
+@app.command("snapshot-compact")
+def snapshot_compact(
+    db: str = typer.Option("data/rss_watch.sqlite"),
+    keep_hours: float = typer.Option(72, help="Keep raw snapshots newer than this (growth-rank needs 48h)"),
+    batch_rows: int = typer.Option(5000, help="ytapi_snapshots rows examined per transaction"),
+    vacuum_pages: int = typer.Option(0, help="Max pages returned by incremental_vacuum (0=all)"),
+    enable_auto_vacuum: bool = typer.Option(False, help="Switch to auto_vacuum=INCREMENTAL first (runs VACUUM once)"),
+):
+    from .services import snapshot_compactor
+    argv = ["--db", db, "--keep-hours", str(keep_hours), "--batch-rows", str(batch_rows), "--vacuum-pages", str(vacuum_pages)]
+    if enable_auto_vacuum:
+        argv.append("--enable-auto-vacuum")
+    snapshot_compactor.main(argv)
+
+
+@app.command("websub")
+def websub(
+    callback_url: str = typer.Option(..., help="Public callback URL the hub can reach (e.g. https://example.com/websub)"),
+    db: str = typer.Option("data/rss_watch.sqlite"),
+    hub_url: str = typer.Option("https://pubsubhubbub.appspot.com/subscribe"),
+    host: str = typer.Option("127.0.0.1"),
+    port: int = typer.Option(8088),
+    secret: Optional[str] = typer.Option(None, help="hub.secret used to verify X-Hub-Signature"),
+    lease_sec: int = typer.Option(432000, help="Requested lease seconds"),
+    max_subscriptions: int = typer.Option(200000, help="Subscribe at most N channels (most recently active first)"),
+    subscribe_rps: float = typer.Option(5.0, help="Max subscribe requests per second"),
+    no_subscribe: bool = typer.Option(False, help="Only receive; do not send subscribe/renew requests"),
+):
+    from .services import websub as ws
+    argv = [
+        "--callback-url", callback_url,
+        "--db", db,
+        "--hub-url", hub_url,
+        "--host", host,
+        "--port", str(port),
+        "--lease-sec", str(lease_sec),
+        "--max-subscriptions", str(max_subscriptions),
+        "--subscribe-rps", str(subscribe_rps),
+    ]
+    if secret:
+        argv += ["--secret", secret]
+    if no_subscribe:
+        argv.append("--no-subscribe")
+    ws.main(argv)
+
+
+@app.command("bench-watch")
+def bench_watch(
+    channels: int = typer.Option(5000, help="Synthetic channels served by the fake feed server"),
+    duration: float = typer.Option(30.0, help="Seconds to run the watcher"),
+    rps: float = typer.Option(1000.0),
+    concurrency: int = typer.Option(200),
+    scheduler: str = typer.Option("heap", help="db or heap"),
+    parse_workers: int = typer.Option(0),
+    parse_pool: str = typer.Option("thread", help="thread or process"),
+    upload_rate: float = typer.Option(0.5, help="Uploads per channel per hour"),
+    etag: str = typer.Option("on", help="on, off or unstable"),
+    p429: float = typer.Option(0.0, help="Probability of a 429 response"),
+    p5xx: float = typer.Option(0.0, help="Probability of a 5xx response"),
+    latency_ms: float = typer.Option(0.0, help="Mean response latency (ms)"),
+    json_out: bool = typer.Option(False, "--json", help="Print JSON"),
+):
+    from .tools import bench_watch as bench
+    argv = [
+        "--channels", str(channels),
+        "--duration", str(duration),
+        "--rps", str(rps),
+        "--concurrency", str(concurrency),
+        "--scheduler", scheduler,
+        "--parse-workers", str(parse_workers),
+        "--parse-pool", parse_pool,
+        "--upload-rate", str(upload_rate),
+        "--etag", etag,
+        "--p429", str(p429),
+        "--p5xx", str(p5xx),
+        "--latency-ms", str(latency_ms),
+    ]
+    if json_out:
+        argv.append("--json")
+    bench.main(argv)
+
+
 @app.command("yutura-day-scrape")
 def yutura_day_scrape(
     db: str = typer.Option("data/rss_watch.sqlite"),
@@ -147,8 +343,10 @@ def yutura_day_scrape(
 @app.command("channel-fetch")
 def channel_fetch(
     db: str = typer.Option("data/rss_watch.sqlite"),
-    api_key: Optional[str] = typer.Option(None),
-    qps: float = typer.Option(1.0),
+    api_key: Optional[str] = typer.Option(None, help="YouTube API key, comma-separated for several"),
+    qps: float = typer.Option(1.0, help="Requests per second per key"),
+    concurrency: int = typer.Option(4),
+    daily_units: int = typer.Option(10000, help="Per-key daily unit budget"),
     batch_size: int = typer.Option(50),
     max_channels: int = typer.Option(0),
 ):
@@ -156,6 +354,8 @@ def channel_fetch(
     argv = [
         "--db", db,
         "--qps", str(qps),
+        "--concurrency", str(concurrency),
+        "--daily-units", str(daily_units),
         "--batch-size", str(batch_size),
     ]
     if api_key:
@@ -5,10 +5,15 @@ YouTube Data API v3 フェッチャ（Step②）
 入力: exports/rss_discovered_*.jsonl（NDJSON; 1行=1動画）
 処理: video_id を最大 50 件ずつ videos.list に投入し、スナップショット保存
 保存: data/rss_watch.sqlite のテーブル ytapi_snapshots / api_imported_files
+      同じレスポンスのタグ・説明文・長さ・サムネイルを rss_videos（keywords_json / description_snip /
+      length_seconds / thumb_hq / thumb_maxres）にも同じトランザクションで書く（追加のユニットは使わない）
 
 注意:
-- APIキー: 環境変数 YOUTUBE_API_KEY または CLI --api-key で指定
-- QPS 制御: --qps で 1〜2 などから安全運用
+- APIキー: 環境変数 YOUTUBE_API_KEY または CLI --api-key で指定（「,」区切りで複数可、順に使い分ける）
+- QPS 制御: --qps（キーごと）で 1〜2 などから安全運用。--concurrency 件まで同時に送る（ytapi_client.py）
+- 失敗したチャンクは ytapi_retry_queue に残り、次回の実行で先に再送される
+- ID は id_broker（ytapi_id_queue）に新規検出の優先度で積み、api-refetch などの積み残しと合わせて
+  50 件ずつ詰めて送る。端数は締め切り（--deadline-sec）が次回の実行（--horizon-sec）までに来るときだけ送る
 """
 from __future__ import annotations
 
@@ -20,12 +25,30 @@ import time
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from glob import glob
-from typing import Dict, Iterable, List, Optional, Tuple
-
-import requests
-
-
-API_URL = "https://www.googleapis.com/youtube/v3/videos"
+from typing import Dict, List, Optional, Tuple
+
+from .id_broker import PRIORITY_NEW, IdBroker, flush
+from .latency_ledger import ensure_latency_ledger
+from .stats_counters import ensure_counters
+from .ytapi_client import CONCURRENCY_DEFAULT, DAILY_UNITS_DEFAULT, parse_keys
+
+
+VIDEO_PARTS = "snippet,statistics,contentDetails"
+DESCRIPTION_SNIP_LEN = 500
+
+# rss_videos のメタデータ（watcher が RSS から作った行だけを更新する。値が同じなら書かない）
+_META_UPDATE_SQL = """
+update rss_videos set
+  length_seconds=coalesce(?, length_seconds),
+  keywords_json=?,
+  description_snip=?,
+  thumb_hq=coalesce(?, thumb_hq),
+  thumb_maxres=coalesce(?, thumb_maxres)
+where video_id=? and (
+  length_seconds is not coalesce(?, length_seconds) or keywords_json is not ? or description_snip is not ?
+  or thumb_hq is not coalesce(?, thumb_hq) or thumb_maxres is not coalesce(?, thumb_maxres)
+)
+"""
 
 
 def utcnow_iso() -> str:
@@ -65,6 +88,8 @@ def ensure_tables(con: sqlite3.Connection) -> None:
     if "channel_title" not in cols:
         cur.execute("alter table ytapi_snapshots add column channel_title text")
     con.commit()
+    ensure_counters(con, ("ytapi_snapshots",))
+    ensure_latency_ledger(con)
 
 
 def open_db(path: str) -> sqlite3.Connection:
@@ -110,11 +135,6 @@ def parse_jsonl(path: str) -> List[Dict]:
     return out
 
 
-def chunks(lst: List[str], n: int) -> Iterable[List[str]]:
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
-
-
 def parse_iso8601_duration_to_seconds(s: Optional[str]) -> Optional[int]:
     # very small parser for PT#H#M#S
     if not s:
@@ -130,29 +150,38 @@ def parse_iso8601_duration_to_seconds(s: Optional[str]) -> Optional[int]:
     return h * 3600 + m_ * 60 + s_
 
 
-def fetch_videos(api_key: str, video_ids: List[str], qps: float = 1.0, session: Optional[requests.Session] = None) -> List[Dict]:
-    if not video_ids:
-        return []
-    sess = session or requests.Session()
-    url = API_URL
-    params = {
-        "part": "snippet,statistics,contentDetails",
-        "id": ",".join(video_ids),
-        "key": api_key,
-        "maxResults": 50,
-    }
-    # QPS 制御（単純スリープ）
-    time.sleep(max(0.0, 1.0 / max(qps, 0.1)))
-    r = sess.get(url, params=params, timeout=30)
-    r.raise_for_status()
-    data = r.json()
-    return data.get("items", [])
+def _thumb_urls(snip: Dict) -> Tuple[Optional[str], Optional[str]]:
+    """(hq, 最大サイズ)。maxres が無い動画は standard → high の順で代わりにする"""
+    th = snip.get("thumbnails") or {}
+
+    def url(name: str) -> Optional[str]:
+        return (th.get(name) or {}).get("url")
+
+    hq = url("high")
+    return hq, url("maxres") or url("standard") or hq
+
+
+def video_meta_row(it: Dict, duration: Optional[int]) -> Optional[Tuple]:
+    """videos.list の 1 件 → _META_UPDATE_SQL のパラメータ（snippet が無ければ None）"""
+    vid = it.get("id")
+    snip = it.get("snippet")
+    if not vid or not snip:
+        return None
+    tags = json.dumps([t for t in snip.get("tags") or [] if t], ensure_ascii=False)
+    desc = (snip.get("description") or "")[:DESCRIPTION_SNIP_LEN] or None
+    hq, big = _thumb_urls(snip)
+    return (duration, tags, desc, hq, big, vid, duration, tags, desc, hq, big)
+
+
+def _has_rss_videos(con: sqlite3.Connection) -> bool:
+    return con.execute("select 1 from sqlite_master where type='table' and name='rss_videos'").fetchone() is not None
 
 
 def save_snapshots(con: sqlite3.Connection, items: List[Dict], id_to_channel: Dict[str, str]) -> int:
     cur = con.cursor()
     now_iso = utcnow_iso()
     n = 0
+    meta: List[Tuple] = []
     for it in items:
         vid = it.get("id")
         if not vid:
@@ -176,7 +205,12 @@ def save_snapshots(con: sqlite3.Connection, items: List[Dict], id_to_channel: Di
             """,
             (vid, ch, ch_title, now_iso, vc, lc, cc, duration, category_id, live_flag),
         )
+        row = video_meta_row(it, duration)
+        if row is not None:
+            meta.append(row)
         n += 1
+    if meta and _has_rss_videos(con):
+        cur.executemany(_META_UPDATE_SQL, meta)
     con.commit()
     return n
 
@@ -189,56 +223,54 @@ def run_once(
     batch_size: int = 50,
     qps: float = 1.0,
     max_files: Optional[int] = None,
+    concurrency: int = CONCURRENCY_DEFAULT,
+    daily_units: int = DAILY_UNITS_DEFAULT,
+    deadline_sec: int = 1200,
+    horizon_sec: int = 600,
 ) -> int:
     con = open_db(db_path)
     files = list_unprocessed(in_dir, con) if only_new_files else sorted(glob(os.path.join(in_dir, "rss_discovered_*.jsonl")))
     if max_files:
         files = files[:max_files]
-    if not files:
-        print("No input files to process.")
-        return 0
-    sess = requests.Session()
-    total_vids = 0
+    # 未処理ファイルの video_id をまとめてユニーク化し、channel_id のマップを作る
+    id_to_channel: Dict[str, str] = {}
     for fp in files:
-        rows = parse_jsonl(fp)
-        # video_id をユニーク化し、channel_id のマップを作る
-        id_to_channel: Dict[str, str] = {}
-        vids: List[str] = []
-        for r in rows:
+        for r in parse_jsonl(fp):
             vid = r.get("video_id")
-            if not vid:
-                continue
-            if vid not in id_to_channel:
+            if vid and vid not in id_to_channel:
                 id_to_channel[vid] = r.get("channel_id")
-                vids.append(vid)
-
-        count = 0
-        for chunk in chunks(vids, max(1, min(batch_size, 50))):
-            try:
-                items = fetch_videos(api_key, chunk, qps=qps, session=sess)
-            except requests.HTTPError as e:
-                print(f"HTTP error: {e}; ids={chunk}")
-                # 軽いバックオフ
-                time.sleep(5)
-                continue
-            except requests.RequestException as e:
-                print(f"Request error: {e}")
-                time.sleep(5)
-                continue
-            count += save_snapshots(con, items, id_to_channel)
-        print(f"Processed {os.path.basename(fp)}: videos={len(vids)}, saved={count}")
-        total_vids += len(vids)
+    # ブローカに積んだ時点でファイルは処理済みにしてよい（送信は ytapi_id_queue / ytapi_retry_queue が引き継ぐ）
+    IdBroker(con).submit("videos", id_to_channel, PRIORITY_NEW, time.time() + deadline_sec, "api_fetch")
+    for fp in files:
         mark_processed(con, fp)
-    return total_vids
+    res = flush(
+        con, parse_keys(api_key), "videos", VIDEO_PARTS,
+        lambda items, ctx: save_snapshots(con, items, ctx),
+        horizon_sec=horizon_sec, batch_size=batch_size,
+        qps=qps, daily_units=daily_units, concurrency=concurrency,
+    )
+    if not files and not res["ids"] and not res["retried_chunks"]:
+        print("No input files to process.")
+        return 0
+    print(
+        f"Processed {len(files)} files: videos={len(id_to_channel)}, sent_ids={res['ids']}, saved={res['saved']}, "
+        f"requests={res['requests']}, pending={res['pending']}, retried_chunks={res['retried_chunks']}, "
+        f"failed_chunks={res['failed_chunks']}"
+    )
+    return len(id_to_channel)
 
 
 def build_arg_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser(description="Fetch YouTube video stats into snapshots")
     ap.add_argument("--db", default="data/rss_watch.sqlite", help="RSS連携DB (rss_watch.sqlite)")
     ap.add_argument("--in-dir", default="exports", help="NDJSON入力ディレクトリ")
-    ap.add_argument("--api-key", default=os.getenv("YOUTUBE_API_KEY"), help="YouTube API key (env YOUTUBE_API_KEY)")
+    ap.add_argument("--api-key", default=os.getenv("YOUTUBE_API_KEY"), help="YouTube API key（「,」区切りで複数可） (env YOUTUBE_API_KEY)")
     ap.add_argument("--batch-size", type=int, default=50, help="videos.list の 1 リクエスト本数 (<=50)")
-    ap.add_argument("--qps", type=float, default=1.0, help="毎秒リクエスト数の上限")
+    ap.add_argument("--qps", type=float, default=1.0, help="キーごとの毎秒リクエスト数の上限")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY_DEFAULT, help="同時に送るリクエスト数")
+    ap.add_argument("--daily-units", type=int, default=DAILY_UNITS_DEFAULT, help="キーごとの 1 日のユニット上限（太平洋時間で日替わり）")
+    ap.add_argument("--deadline-sec", type=int, default=1200, help="新規 ID を送るまでの締め切り（秒）。端数はそれまで相乗り待ち")
+    ap.add_argument("--horizon-sec", type=int, default=600, help="次回の実行までの秒数（締め切りがこの範囲に入る端数は今回送る）")
     ap.add_argument("--all-files", action="store_true", help="未処理限定でなく全ファイルを処理")
     ap.add_argument("--max-files", type=int, default=0, help="処理ファイル数の上限（0=無制限）")
     return ap
@@ -258,6 +290,10 @@ def main(argv: Optional[List[str]] = None) -> int:
         batch_size=args.batch_size,
         qps=args.qps,
         max_files=(args.max_files or None),
+        concurrency=args.concurrency,
+        daily_units=args.daily_units,
+        deadline_sec=args.deadline_sec,
+        horizon_sec=args.horizon_sec,
     )
 
 
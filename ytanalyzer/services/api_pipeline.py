@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+プロセス内パイプライン: rss_watcher が新規に検出した動画 ID をそのまま videos.list に渡す
+
+従来の経路（watcher → SQLite → rss_export が 10 分ごとに JSONL → api_fetcher が 10 分ごとに取り込み）では
+最初のスナップショットまで最大 20 分かかる。--pipeline を付けると、FeedWriter がコミットした新規 ID を
+VideoBatcher が受け取り、batch_size 件（既定 50 = videos.list の上限）そろった時点か、
+最初の ID から max_wait_sec 秒（既定 10 秒）経った時点で videos.list を呼んで ytapi_snapshots に保存する。
+
+- 専用スレッドで動く（FeedWriter と同じくキュー + スレッド。イベントループは待たされない）
+- API 呼び出しは ytapi_client.YtApiClient（スレッド専用のイベントループで動かす。複数キー・クォータ切れのキー外しも同じ）
+- batch_size に満たないバッチは、id_broker（ytapi_id_queue）に積まれている他のフェッチャの ID
+  （api-refetch の再取得など）で空き枠を埋めて送る。送った ID はブローカに送信済みとして残し、直後の重複を防ぐ
+- 再試行しても失敗したバッチは ytapi_retry_queue に残し、retry_interval_sec ごとに期限の来た分を再送する
+- 保存時の SQLite のエラー（database is locked など）はバッチ単位でロールバックして ytapi_retry_queue に回し、
+  スレッドは止めない（止まると FeedWriter からの submit が誰にも処理されなくなる）
+- rss_export と同じく、公開から min_published_hours 時間より古い動画は対象外（初回巡回のノイズ対策）
+- audit_dir を指定すると、送った ID を rss_pipeline_YYYYMMDD.jsonl に追記する（監査用。api_fetcher の入力にはならない）
+パイプライン使用時は rss-export / api-fetch を動かす必要はない（動かすと同じ動画を二重に取得する）。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from .api_fetcher import VIDEO_PARTS, open_db, save_snapshots
+from .id_broker import IdBroker
+from .metrics import REGISTRY
+from .quota_ledger import QuotaLedger
+from .rss_export import parse_any_dt, to_iso_z
+from .ytapi_client import (
+    DAILY_UNITS_DEFAULT,
+    RETRY_MAX_ATTEMPTS,
+    ApiError,
+    QuotaExhausted,
+    RetryQueue,
+    YtApiClient,
+    next_pacific_reset,
+    parse_keys,
+)
+
+BATCH_SIZE_DEFAULT = 50
+MAX_WAIT_SEC_DEFAULT = 10.0
+MIN_PUBLISHED_HOURS_DEFAULT = 48
+RETRY_INTERVAL_SEC = 60.0
+
+M_PIPE = REGISTRY.counter("rss_pipeline_ids_total", "Video IDs handled by the in-process videos.list pipeline", ["result"])
+M_PIPE_REQ = REGISTRY.counter("rss_pipeline_requests_total", "videos.list requests sent by the pipeline", ["result"])
+
+# (video_id, channel_id, title, published_at, discovered_at)
+Discovered = Tuple[str, Optional[str], Optional[str], Optional[str], str]
+
+
+class VideoBatcher:
+    def __init__(
+        self,
+        db: str,
+        api_key: str,
+        batch_size: int = BATCH_SIZE_DEFAULT,
+        max_wait_sec: float = MAX_WAIT_SEC_DEFAULT,
+        qps: float = 1.0,
+        min_published_hours: int = MIN_PUBLISHED_HOURS_DEFAULT,
+        audit_dir: Optional[str] = None,
+        daily_units: int = DAILY_UNITS_DEFAULT,
+    ):
+        self.db = db
+        self.keys = parse_keys(api_key)
+        if not self.keys:
+            raise ValueError("pipeline needs at least one API key")
+        self.batch_size = max(1, min(int(batch_size), 50))
+        self.max_wait = max(0.0, float(max_wait_sec))
+        self.qps = qps
+        self.min_published_hours = min_published_hours
+        self.audit_dir = audit_dir
+        self.daily_units = daily_units
+        self.q: "queue.Queue[Optional[Discovered]]" = queue.Queue()
+        self.counts: Dict[str, int] = {"submitted": 0, "skipped_old": 0, "requests": 0, "saved": 0, "errors": 0, "queued_retry": 0, "filled": 0, "dropped": 0}
+        self.failed: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="rss-pipeline", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def close(self) -> None:
+        """溜まっている分を送り切ってからスレッドを止める"""
+        if self._thread.is_alive():
+            self.q.put(None)
+            self._thread.join()
+        if self.failed is not None:
+            print(f"pipeline: thread had stopped ({self.failed!r}); {self.q.qsize()} queued ids were not sent")
+
+    def submit(self, rows: Iterable[Discovered]) -> None:
+        """コミット済みの新規動画を受け取る（FeedWriter のスレッドから呼ぶ）"""
+        threshold = datetime.now(timezone.utc) - timedelta(hours=max(0, self.min_published_hours))
+        if self.failed is not None:
+            rows = list(rows)
+            self.counts["dropped"] += len(rows)
+            M_PIPE.inc(len(rows), result="dropped")
+            return
+        for row in rows:
+            pub = parse_any_dt(row[3])
+            if pub is not None and pub < threshold:
+                self.counts["skipped_old"] += 1
+                M_PIPE.inc(result="skipped_old")
+                continue
+            self.counts["submitted"] += 1
+            self.q.put(row)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counts, "queue": self.q.qsize()}
+
+    # --- 専用スレッド ---
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._serve())
+        except Exception as e:
+            # 想定外のエラーでスレッドが終わったことを隠さない（以降の submit は dropped として数える）
+            self.failed = e
+            traceback.print_exc()
+            print(f"pipeline: thread stopped: {e!r}")
+        finally:
+            loop.close()
+
+    async def _serve(self) -> None:
+        con = open_db(self.db)
+        rq = RetryQueue(con)
+        broker = IdBroker(con)
+        next_retry = time.monotonic()
+        stop = False
+        # 同時に送るのは 1 件ずつ（QPS はキーごとに YtApiClient が守る）
+        ledger = QuotaLedger(con)
+        async with YtApiClient(
+            self.keys, qps_per_key=self.qps, daily_units=self.daily_units, concurrency=1, ledger=ledger
+        ) as api:
+            while not stop:
+                if time.monotonic() >= next_retry:
+                    try:
+                        await self._drain_retries(con, rq, api)
+                    except sqlite3.Error as e:
+                        _rollback(con)
+                        print(f"pipeline: draining the retry queue failed: {e}")
+                    next_retry = time.monotonic() + RETRY_INTERVAL_SEC
+                try:
+                    row = self.q.get(timeout=max(0.1, next_retry - time.monotonic()))
+                except queue.Empty:
+                    continue
+                if row is None:
+                    break
+                # 最初の ID から max_wait 秒、または batch_size 件そろうまで待つ（重複 ID はまとめる）
+                batch: "OrderedDict[str, Discovered]" = OrderedDict([(row[0], row)])
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.batch_size:
+                    wait = deadline - time.monotonic()
+                    if wait <= 0:
+                        break
+                    try:
+                        row = self.q.get(timeout=wait)
+                    except queue.Empty:
+                        break
+                    if row is None:
+                        stop = True
+                        break
+                    batch[row[0]] = row
+                try:
+                    await self._flush(con, rq, broker, api, list(batch.values()))
+                except sqlite3.Error as e:
+                    _rollback(con)
+                    self.counts["errors"] += 1
+                    print(f"pipeline: batch of {len(batch)} ids failed on the database: {e}")
+        con.close()
+
+    async def _flush(self, con, rq: RetryQueue, broker: IdBroker, api: YtApiClient, rows: List[Discovered]) -> None:
+        ctx: Dict[str, Optional[str]] = {r[0]: r[1] for r in rows}
+        # 空き枠はブローカの積み残しで埋める（どのみち 1 ユニット使うので）
+        try:
+            fill = {k: v for k, v in broker.take_fill("videos", self.batch_size - len(ctx)).items() if k not in ctx}
+        except sqlite3.Error as e:
+            _rollback(con)
+            print(f"pipeline: taking fill ids from the broker failed, sending without them: {e}")
+            fill = {}
+        self.counts["filled"] += len(fill)
+        ctx.update(fill)
+        ids = list(ctx)
+        self.counts["requests"] += 1
+        try:
+            items = await api.list("videos", ids, VIDEO_PARTS)
+        except (ApiError, QuotaExhausted, httpx.HTTPError) as e:
+            self.counts["errors"] += 1
+            M_PIPE_REQ.inc(result="error")
+            M_PIPE.inc(len(ids), result="error")
+            # 捨てずに ytapi_retry_queue へ（クォータ切れなら次のリセット後）
+            next_ts = next_pacific_reset() if isinstance(e, QuotaExhausted) else None
+            self._queue_retry(con, rq, ctx, str(e), next_ts)
+            try:
+                broker.drop_unsent("videos", list(fill))
+            except sqlite3.Error:
+                _rollback(con)
+            print(f"pipeline: videos.list failed for {len(ids)} ids, queued for retry: {e}")
+            self._audit(rows, saved=False)
+            return
+        try:
+            n = save_snapshots(con, items, ctx)
+            broker.mark_sent("videos", ids)
+        except sqlite3.Error as e:
+            # 取得はできたが書けなかった。ロールバックして同じ ID を再送に回す（ユニットは使ったが取りこぼさない）
+            _rollback(con)
+            self.counts["errors"] += 1
+            M_PIPE_REQ.inc(result="db_error")
+            self._queue_retry(con, rq, ctx, f"db: {e}", None)
+            print(f"pipeline: saving {len(ids)} ids failed, queued for retry: {e}")
+            self._audit(rows, saved=False)
+            return
+        self.counts["saved"] += n
+        M_PIPE_REQ.inc(result="ok")
+        M_PIPE.inc(n, result="saved")
+        M_PIPE.inc(len(ids) - n, result="missing")
+        self._audit(rows, saved=True)
+
+    async def _drain_retries(self, con, rq: RetryQueue, api: YtApiClient) -> None:
+        """ytapi_retry_queue の videos 分で期限の来たものを再送する（api_fetcher の積み残しも拾う）"""
+        for row_id, ctx, attempts in rq.due("videos", limit=20):
+            try:
+                items = await api.list("videos", list(ctx), VIDEO_PARTS)
+            except (ApiError, QuotaExhausted, httpx.HTTPError) as e:
+                if attempts + 1 >= RETRY_MAX_ATTEMPTS:
+                    rq.done(row_id)
+                else:
+                    rq.reschedule(row_id, attempts + 1, str(e), next_pacific_reset() if isinstance(e, QuotaExhausted) else None)
+                con.commit()
+                M_PIPE_REQ.inc(result="error")
+                if isinstance(e, QuotaExhausted):
+                    return
+                continue
+            try:
+                n = save_snapshots(con, items, ctx)
+                rq.done(row_id)
+                con.commit()
+            except sqlite3.Error as e:
+                # この行は残っているので次回また拾う
+                _rollback(con)
+                self.counts["errors"] += 1
+                M_PIPE_REQ.inc(result="db_error")
+                print(f"pipeline: saving retried batch {row_id} failed: {e}")
+                continue
+            self.counts["saved"] += n
+            M_PIPE_REQ.inc(result="retry_ok")
+            M_PIPE.inc(n, result="saved")
+
+    def _queue_retry(self, con, rq: RetryQueue, ctx: Dict[str, Optional[str]], error: str, next_ts: Optional[float]) -> None:
+        try:
+            rq.push("videos", ctx, error, next_ts)
+            con.commit()
+        except sqlite3.Error as e:
+            _rollback(con)
+            M_PIPE.inc(len(ctx), result="lost")
+            print(f"pipeline: could not queue {len(ctx)} ids for retry, dropped: {e}")
+            return
+        self.counts["queued_retry"] += 1
+
+    def _audit(self, rows: List[Discovered], saved: bool) -> None:
+        if not self.audit_dir:
+            return
+        os.makedirs(self.audit_dir, exist_ok=True)
+        path = os.path.join(self.audit_dir, f"rss_pipeline_{datetime.now(timezone.utc):%Y%m%d}.jsonl")
+        with open(path, "a", encoding="utf-8", newline="\n") as f:
+            for vid, cid, title, pub, disc in rows:
+                pub_dt, disc_dt = parse_any_dt(pub), parse_any_dt(disc)
+                rec = {
+                    "video_id": vid,
+                    "channel_id": cid,
+                    "title": title or "",
+                    "discovered_at": to_iso_z(disc_dt) if disc_dt else None,
+                    "published_at": to_iso_z(pub_dt) if pub_dt else None,
+                    "saved": saved,
+                }
+                f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")))
+                f.write("\n")
+
+
+def _rollback(con) -> None:
+    try:
+        con.rollback()
+    except sqlite3.Error:
+        pass
@@ -7,9 +7,16 @@ YouTube API (videos.list) を叩いてスナップショットを追加取得す
 
 要件:
 - 対象時刻からの許容誤差: ±15分（デフォルト）
-- QPS は 1.0〜2.0 程度の低め (デフォルト 1.5)
-- 失敗時は指数バックオフでリトライ（チャンク単位）
-- 必要なら ytapi_refetch_tasks テーブルを用意（簡易ログ用途）
+- QPS は 1.0〜2.0 程度の低め (デフォルト 1.5、キーごと)
+- 失敗時は指数バックオフでリトライ（チャンク単位、ytapi_client.py）。諦めたチャンクは ytapi_retry_queue で次回に再送
+- ytapi_refetch_tasks に再取得の記録を残す（簡易ログ用途）。ブローカが新たに受け付けた ID だけ queued で 1 行入れ、
+  保存できたら ok、取り出したのに保存できなかったら failed に更新する（後の再送で保存できれば ok に戻る）。
+  他のフェッチャのリクエストに相乗りして取れた分は、次回の実行でスナップショットを見て ok にする
+- クォータの残りは ytapi_quota_ledger（quota_ledger.py）から引く。--max-daily-units はキーごとの上限で、
+  他のフェッチャ（api-fetch / channel-fetch / --pipeline）が同じ日に使った分も差し引かれる。
+  ブローカの積み残しの相乗り分や ytapi_retry_queue の再送分も含め、この実行で送るリクエストすべてに効く
+- 再取得する ID は id_broker（ytapi_id_queue）に再取得の優先度・締め切り（目標時刻 + 許容誤差）で積み、
+  新規検出の積み残しと合わせて 50 件ずつ詰めて送る
 
 実行例:
   python -m ytanalyzer.services.api_refetch --db data/rss_watch.sqlite --qps 1.5
@@ -25,13 +32,14 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Iterable, List, Optional, Tuple
 
-import requests
-
 from .api_fetcher import (
+    VIDEO_PARTS,
     open_db as open_api_db,
-    fetch_videos,
     save_snapshots,
 )
+from .id_broker import PRIORITY_REFETCH, IdBroker, flush
+from .quota_ledger import QuotaLedger, key_id
+from .ytapi_client import CONCURRENCY_DEFAULT, DAILY_UNITS_DEFAULT, pacific_day, parse_keys
 
 
 TARGET_OFFSETS = [1, 3, 6, 24]  # hours
@@ -51,7 +59,7 @@ def to_iso_z(dt: datetime) -> str:
 
 def ensure_tables(con: sqlite3.Connection) -> None:
     cur = con.cursor()
-    # 簡易ログ用（任意）
+    # 簡易ログ用（queued → ok / failed）
     cur.execute(
         """
         create table if not exists ytapi_refetch_tasks(
@@ -64,9 +72,37 @@ def ensure_tables(con: sqlite3.Connection) -> None:
         )
         """
     )
+    cur.execute(
+        "create index if not exists idx_ytapi_refetch_tasks_queued on ytapi_refetch_tasks(video_id) where status='queued'"
+    )
+    con.commit()
+
+
+def mark_tasks(con: sqlite3.Connection, ids: Iterable[str], status: str, note: Optional[str] = None) -> None:
+    """ytapi_refetch_tasks の未完了（ok 以外）の行を status にする"""
+    now_iso = to_iso_z(utcnow())
+    con.executemany(
+        "update ytapi_refetch_tasks set status=?, attempted_at=?, note=? where video_id=? and status!='ok'",
+        [(status, now_iso, note, vid) for vid in ids],
+    )
     con.commit()
 
 
+def reconcile_tasks(con: sqlite3.Connection) -> int:
+    """queued のまま、積んだ後にスナップショットが入った行（他のフェッチャが送った分）を ok にする"""
+    cur = con.execute(
+        """
+        update ytapi_refetch_tasks set status='ok', note='shared'
+        where status='queued' and exists(
+          select 1 from ytapi_snapshots s
+          where s.video_id=ytapi_refetch_tasks.video_id and s.polled_at >= replace(ytapi_refetch_tasks.attempted_at, 'Z', '+00:00')
+        )
+        """
+    )
+    con.commit()
+    return max(0, cur.rowcount)
+
+
 def list_due_videos(
     con: sqlite3.Connection,
     now: datetime,
@@ -76,13 +112,23 @@ def list_due_videos(
     """発見から window_hours 以内の動画で、今まさに ±tol 分のウィンドウにある目標
     スナップショットが欠けているものを抽出して video_id を返す。
     """
+    return list(list_due_deadlines(con, now, tol_minutes, window_hours))
+
+
+def list_due_deadlines(
+    con: sqlite3.Connection,
+    now: datetime,
+    tol_minutes: int,
+    window_hours: int,
+) -> Dict[str, datetime]:
+    """list_due_videos と同じ抽出で、video_id → 締め切り（目標時刻 + tol 分）を返す"""
     cur = con.cursor()
     start_iso = (now - timedelta(hours=window_hours)).isoformat()
     rows = cur.execute(
         "select video_id, discovered_at from rss_videos_discovered where discovered_at >= ?",
         (start_iso,),
     ).fetchall()
-    due: List[str] = []
+    due: Dict[str, datetime] = {}
     for vid, disc_iso in rows:
         try:
             t0 = iso_to_utc(str(disc_iso))
@@ -102,16 +148,11 @@ def list_due_videos(
             ).fetchone()
             if hit:
                 continue
-            due.append(vid)
+            due[vid] = tgt + timedelta(minutes=tol_minutes)
             break  # 1 本につき 1 回の再取得で十分
     return due
 
 
-def chunks(lst: List[str], n: int) -> Iterable[List[str]]:
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
-
-
 def run_once(
     db_path: str,
     api_key: str,
@@ -121,21 +162,27 @@ def run_once(
     max_ids: Optional[int] = None,
     batch_size: int = 50,
     max_daily_units: int = 9000,
+    concurrency: int = CONCURRENCY_DEFAULT,
+    daily_units: int = DAILY_UNITS_DEFAULT,
+    horizon_sec: int = 300,
 ) -> int:
     con = open_api_db(db_path)
     ensure_tables(con)
+    reconcile_tasks(con)
     now = utcnow()
-    due = list_due_videos(con, now, tol_minutes=tol_minutes, window_hours=window_hours)
+    deadlines = list_due_deadlines(con, now, tol_minutes=tol_minutes, window_hours=window_hours)
+    due = list(deadlines)
     if max_ids:
         due = due[:max_ids]
-    # Quota guard: estimate today's used units from snapshots
-    cur = con.cursor()
-    used_snaps = cur.execute("select count(*) from ytapi_snapshots where date(polled_at)=date('now')").fetchone()[0]
-    used_units = (used_snaps + 49) // 50
-    remain_units = max(0, int(max_daily_units) - int(used_units))
-    allow_ids = remain_units * 50
+    # Quota guard: 台帳（キー × 太平洋時間の日付）から今日の残りユニットを引く
+    keys = parse_keys(api_key)
+    budget = min(int(daily_units), int(max_daily_units))
+    ledger = QuotaLedger(con)
+    day = pacific_day()
+    remain_units = sum(ledger.remaining(key_id(k), day, budget) for k in keys)
+    allow_ids = remain_units * max(1, min(int(batch_size), 50))
     if allow_ids <= 0:
-        print(f"quota guard: used_units={used_units} >= max_daily_units={max_daily_units}; skip refetch")
+        print(f"quota guard: no units left today (max_daily_units={budget} per key x {len(keys)} keys); skip refetch")
         return 0
     if max_ids:
         allow_ids = min(allow_ids, max_ids)
@@ -143,61 +190,62 @@ def run_once(
         due = due[:allow_ids]
         print(f"quota guard: limiting due to {len(due)} ids (remain_units={remain_units})")
 
-    if not due:
+    # ブローカに積む（同じ動画が積み残しにあれば 1 件にまとまる）。締め切りは動画ごとのウィンドウの終わり
+    accepted = IdBroker(con).submit(
+        "videos", {v: None for v in due}, PRIORITY_REFETCH, time.time(), "api_refetch",
+        deadlines={v: deadlines[v].timestamp() for v in due},
+    )
+    if accepted:
+        # ログは新たに積んだ分だけ（前回までに積んだ分はその行を更新していく）。
+        # 同じ目標で failed になっている行は、入れ直さずに queued へ戻す
+        for vid in accepted:
+            target, at = to_iso_z(deadlines[vid]), to_iso_z(now)
+            cur = con.execute(
+                "update ytapi_refetch_tasks set status='queued', attempted_at=?, note=null where video_id=? and target_time=? and status='failed'",
+                (at, vid, target),
+            )
+            if cur.rowcount <= 0:
+                con.execute(
+                    "insert into ytapi_refetch_tasks(video_id, target_offset_hours, target_time, attempted_at, status, note) values(?,?,?,?,?,?)",
+                    (vid, None, target, at, "queued", None),
+                )
+        con.commit()
+
+    def save(items: List[Dict], ctx: Dict[str, Optional[str]]) -> int:
+        n = save_snapshots(con, items, ctx)
+        mark_tasks(con, ctx, "ok")
+        return n
+
+    # --max-daily-units は相乗り・再送分も含めて効かせる（キーごとの日次上限として渡す）
+    res = flush(
+        con, keys, "videos", VIDEO_PARTS, save,
+        horizon_sec=horizon_sec, batch_size=batch_size,
+        on_unsent=lambda ids: mark_tasks(con, ids, "failed", "queued for retry"),
+        qps=qps, daily_units=budget, concurrency=concurrency,
+    )
+    if not due and not res["ids"] and not res["retried_chunks"]:
         print("No due videos in window.")
         return 0
-
-    sess = requests.Session()
-    saved = 0
-    backoff_base = 2.0
-    for ids in chunks(due, max(1, min(batch_size, 50))):
-        tries = 0
-        while True:
-            try:
-                items = fetch_videos(api_key, ids, qps=qps, session=sess)
-                saved += save_snapshots(con, items, {v: None for v in ids})
-                # ログ
-                cur = con.cursor()
-                for vid in ids:
-                    cur.execute(
-                        "insert into ytapi_refetch_tasks(video_id, target_offset_hours, target_time, attempted_at, status, note) values(?,?,?,?,?,?)",
-                        (
-                            vid,
-                            None,
-                            None,
-                            to_iso_z(now),
-                            "ok",
-                            None,
-                        ),
-                    )
-                con.commit()
-                break
-            except requests.HTTPError as e:
-                tries += 1
-                wait = min(60.0, (backoff_base ** tries))
-                print(f"HTTP error: {e}; retrying in {wait:.1f}s (try={tries})")
-                time.sleep(wait)
-                continue
-            except requests.RequestException as e:
-                tries += 1
-                wait = min(60.0, (backoff_base ** tries))
-                print(f"Request error: {e}; retrying in {wait:.1f}s (try={tries})")
-                time.sleep(wait)
-                continue
-    print(f"refetched snapshots: {saved}")
+    saved = res["saved"]
+    if res["failed_chunks"]:
+        print(f"refetch: {res['failed_chunks']} chunks queued for retry")
+    print(f"refetched snapshots: {saved} (due={len(due)}, new={len(accepted)}, sent_ids={res['ids']}, pending={res['pending']})")
     return saved
 
 
 def build_arg_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser(description="Refetch YouTube video stats at 1h/3h/6h/24h after discovery")
     ap.add_argument("--db", default="data/rss_watch.sqlite", help="SQLite DB (rss_watch.sqlite)")
-    ap.add_argument("--api-key", default=os.getenv("YOUTUBE_API_KEY"), help="YouTube API key (env YOUTUBE_API_KEY)")
-    ap.add_argument("--qps", type=float, default=1.5, help="Requests per second upper bound")
+    ap.add_argument("--api-key", default=os.getenv("YOUTUBE_API_KEY"), help="YouTube API key, comma-separated for several (env YOUTUBE_API_KEY)")
+    ap.add_argument("--qps", type=float, default=1.5, help="Requests per second upper bound (per key)")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY_DEFAULT, help="Requests in flight at once")
+    ap.add_argument("--daily-units", type=int, default=DAILY_UNITS_DEFAULT, help="Per-key daily unit budget (resets at Pacific midnight)")
+    ap.add_argument("--horizon-sec", type=int, default=300, help="Seconds until the next run; partial batches due before then are sent now")
     ap.add_argument("--tol-minutes", type=int, default=15, help="Tolerance minutes around target time")
     ap.add_argument("--window-hours", type=int, default=30, help="Discovery window hours to consider")
     ap.add_argument("--max-ids", type=int, default=0, help="Max number of videos to refetch in one run (0=all)")
     ap.add_argument("--batch-size", type=int, default=50, help="videos.list batch size (<=50)")
-    ap.add_argument("--max-daily-units", type=int, default=9000, help="Quota guard: max units per day (estimate)")
+    ap.add_argument("--max-daily-units", type=int, default=9000, help="Quota guard: max units per key per Pacific day (counts every fetcher's usage)")
     return ap
 
 
@@ -216,6 +264,9 @@ def main(argv: Optional[List[str]] = None) -> int:
         max_ids=(args.max_ids or None),
         batch_size=args.batch_size,
         max_daily_units=args.max_daily_units,
+        concurrency=args.concurrency,
+        daily_units=args.daily_units,
+        horizon_sec=args.horizon_sec,
     )
 
 
@@ -11,6 +11,9 @@ YouTube Data API v3 channels.list で統計をスナップショット保存す
   channel_id TEXT, title TEXT, polled_at TEXT,
   view_count INTEGER, subscriber_count INTEGER, video_count INTEGER
 
+API 呼び出しは ytapi_client.py（複数キー・並行送信・失敗チャンクの永続リトライ）。
+channel_id は id_broker（ytapi_id_queue）にバックフィルの優先度で積んでから送る（重複はまとまる）。
+
 使い方:
   python -m ytanalyzer.services.channel_fetcher --db data/rss_watch.sqlite --api-key $YOUTUBE_API_KEY \
       --qps 1.0 --batch-size 50 --max-channels 50000
@@ -20,13 +23,15 @@ import argparse
 import os
 import sqlite3
 import time
-from typing import Iterable, List, Optional, Dict
+from typing import List, Optional, Dict
 
-import requests
 from datetime import datetime, timezone
 
+from .id_broker import PRIORITY_BACKFILL, IdBroker, flush
+from .ytapi_client import CONCURRENCY_DEFAULT, DAILY_UNITS_DEFAULT, parse_keys
+
 
-API_URL = "https://www.googleapis.com/youtube/v3/channels"
+CHANNEL_PARTS = "statistics,snippet"
 
 
 def utcnow_iso() -> str:
@@ -63,27 +68,6 @@ def list_channels(con: sqlite3.Connection, max_channels: Optional[int] = None) -
     return ids
 
 
-def chunks(lst: List[str], n: int) -> Iterable[List[str]]:
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
-
-
-def fetch_channels(api_key: str, ids: List[str], session: Optional[requests.Session] = None, qps: float = 1.0) -> List[Dict]:
-    if not ids:
-        return []
-    sess = session or requests.Session()
-    params = {
-        "part": "statistics,snippet",
-        "id": ",".join(ids),
-        "key": api_key,
-        "maxResults": 50,
-    }
-    time.sleep(max(0.0, 1.0 / max(qps, 0.1)))
-    r = sess.get(API_URL, params=params, timeout=30)
-    r.raise_for_status()
-    return r.json().get("items", [])
-
-
 def save_snapshots(con: sqlite3.Connection, items: List[Dict]) -> int:
     cur = con.cursor()
     now = utcnow_iso()
@@ -110,27 +94,28 @@ def save_snapshots(con: sqlite3.Connection, items: List[Dict]) -> int:
     return n
 
 
-def run_once(db: str, api_key: str, qps: float, batch_size: int, max_channels: Optional[int]) -> int:
+def run_once(
+    db: str,
+    api_key: str,
+    qps: float,
+    batch_size: int,
+    max_channels: Optional[int],
+    concurrency: int = CONCURRENCY_DEFAULT,
+    daily_units: int = DAILY_UNITS_DEFAULT,
+) -> int:
     con = open_db(db)
     ids = list_channels(con, max_channels)
     if not ids:
         print("No channels in rss_channels.")
         return 0
-    sess = requests.Session()
-    saved = 0
-    for group in chunks(ids, max(1, min(batch_size, 50))):
-        try:
-            items = fetch_channels(api_key, group, session=sess, qps=qps)
-        except requests.HTTPError as e:
-            print(f"HTTP error: {e}; ids={group[:2]}...")
-            time.sleep(5)
-            continue
-        except requests.RequestException as e:
-            print(f"Request error: {e}")
-            time.sleep(5)
-            continue
-        saved += save_snapshots(con, items)
-    print(f"channel snapshots saved: {saved}")
+    IdBroker(con).submit("channels", {c: None for c in ids}, PRIORITY_BACKFILL, time.time(), "channel_fetch")
+    # 一括取得なので端数も送り切る
+    res = flush(
+        con, parse_keys(api_key), "channels", CHANNEL_PARTS, lambda items, ctx: save_snapshots(con, items),
+        force=True, batch_size=batch_size, qps=qps, daily_units=daily_units, concurrency=concurrency,
+    )
+    saved = res["saved"]
+    print(f"channel snapshots saved: {saved} (requests={res['requests']}, failed_chunks={res['failed_chunks']})")
     return saved
 
 
@@ -138,7 +123,9 @@ def build_arg_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser(description="Fetch channel statistics snapshots")
     ap.add_argument("--db", default="data/rss_watch.sqlite")
     ap.add_argument("--api-key", default=os.getenv("YOUTUBE_API_KEY"))
-    ap.add_argument("--qps", type=float, default=1.0)
+    ap.add_argument("--qps", type=float, default=1.0, help="per-key requests per second")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY_DEFAULT)
+    ap.add_argument("--daily-units", type=int, default=DAILY_UNITS_DEFAULT, help="per-key daily unit budget")
     ap.add_argument("--batch-size", type=int, default=50)
     ap.add_argument("--max-channels", type=int, default=0)
     return ap
@@ -150,7 +137,9 @@ def main(argv: Optional[List[str]] = None) -> int:
     if not args.api_key:
         print("ERROR: --api-key not set (or env YOUTUBE_API_KEY)")
         return 2
-    return run_once(args.db, args.api_key, args.qps, args.batch_size, (args.max_channels or None))
+    return run_once(
+        args.db, args.api_key, args.qps, args.batch_size, (args.max_channels or None), args.concurrency, args.daily_units
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+YouTube チャンネルフィード（Atom）専用のストリーミングパーサ
+
+feedparser の汎用パースを避け、expat で必要な要素
+（yt:videoId / published / title）だけを拾う。
+フィードは新しい順に並んでいるため、既知の last_seen_video_id に到達した時点で
+パースを打ち切り、それより古いエントリはオブジェクト化しない。
+
+使い方:
+  entries, reached = parse_feed(resp.content, stop_at=last_seen_video_id)
+  # entries は古い→新しい順（stop_at 自身は含まない）
+  fp = feed_fingerprint(resp.content)  # 先頭エントリの videoId + updated の短いハッシュ
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple, Union
+from xml.parsers import expat
+
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+YT_NS = "http://www.youtube.com/xml/schemas/2015"
+
+_SEP = "|"
+_ENTRY = f"{ATOM_NS}{_SEP}entry"
+_FIELDS = {
+    f"{YT_NS}{_SEP}videoId": "video_id",
+    f"{YT_NS}{_SEP}channelId": "channel_id",
+    f"{ATOM_NS}{_SEP}id": "atom_id",
+    f"{ATOM_NS}{_SEP}published": "published",
+    f"{ATOM_NS}{_SEP}title": "title",
+}
+
+ParseError = expat.ExpatError
+
+
+class _Stop(Exception):
+    pass
+
+
+def _video_id(ent: Dict[str, Any]) -> Optional[str]:
+    vid = ent.get("video_id")
+    if vid:
+        return vid
+    aid = ent.get("atom_id")
+    # <id>yt:video:XXXXXXXXXXX</id>
+    if aid and aid.startswith("yt:video:"):
+        return aid[len("yt:video:"):] or None
+    return aid or None
+
+
+def parse_feed(data: Union[bytes, str], stop_at: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """フィードを先頭から読み、(entries, reached_stop) を返す
+
+    entries は古い→新しい順の {video_id, published, title}（yt:channelId があれば channel_id も）。
+    stop_at の動画 ID に到達したら、それ以降（=より古い）を読まずに打ち切る。
+    不正な XML は ParseError（expat.ExpatError）を送出する。
+    """
+    entries: List[Dict[str, Any]] = []
+    state: Dict[str, Any] = {"depth": 0, "entry_depth": -1, "cur": None, "field": None, "buf": []}
+    reached = False
+
+    def start(name: str, attrs: Dict[str, str]) -> None:
+        state["depth"] += 1
+        if name == _ENTRY and state["cur"] is None:
+            state["cur"] = {}
+            state["entry_depth"] = state["depth"]
+        elif state["cur"] is not None and state["depth"] == state["entry_depth"] + 1:
+            key = _FIELDS.get(name)
+            if key:
+                state["field"] = key
+                state["buf"] = []
+
+    def chars(text: str) -> None:
+        if state["field"] is not None:
+            state["buf"].append(text)
+
+    def end(name: str) -> None:
+        cur = state["cur"]
+        if cur is not None:
+            field = state["field"]
+            if field is not None and state["depth"] == state["entry_depth"] + 1:
+                cur[field] = "".join(state["buf"]).strip()
+                state["field"] = None
+                if stop_at and field == "video_id" and cur[field] == stop_at:
+                    raise _Stop()
+            elif name == _ENTRY and state["depth"] == state["entry_depth"]:
+                vid = _video_id(cur)
+                if stop_at and vid == stop_at:
+                    raise _Stop()
+                if vid:
+                    ent = {"video_id": vid, "published": cur.get("published"), "title": cur.get("title")}
+                    if cur.get("channel_id"):
+                        ent["channel_id"] = cur["channel_id"]
+                    entries.append(ent)
+                state["cur"] = None
+                state["entry_depth"] = -1
+        state["depth"] -= 1
+
+    p = expat.ParserCreate(namespace_separator=_SEP)
+    p.buffer_text = True
+    p.StartElementHandler = start
+    p.EndElementHandler = end
+    p.CharacterDataHandler = chars
+    try:
+        if isinstance(data, str):
+            p.Parse(data.encode("utf-8"), True)
+        else:
+            p.Parse(data, True)
+    except _Stop:
+        reached = True
+    entries.reverse()
+    return entries, reached
+
+
+def _between(data: bytes, start_tag: bytes, end_tag: bytes, lo: int, hi: int) -> Optional[bytes]:
+    i = data.find(start_tag, lo, hi)
+    if i < 0:
+        return None
+    i += len(start_tag)
+    j = data.find(end_tag, i, hi)
+    if j < 0:
+        return None
+    return data[i:j].strip()
+
+
+def feed_fingerprint(data: Union[bytes, str]) -> Optional[str]:
+    """先頭（=最新）エントリの yt:videoId と updated から軽量な指紋を作る
+
+    本文全体のハッシュは再生数などの統計で毎回変わるため使わない。
+    XML はパースせず bytes の検索だけで済ませる。判定できなければ None。
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    lo = data.find(b"<entry>")
+    if lo < 0:
+        # 動画ゼロのチャンネル
+        return "empty" if data.rstrip().endswith(b"</feed>") else None
+    hi = data.find(b"</entry>", lo)
+    if hi < 0:
+        return None
+    vid = _between(data, b"<yt:videoId>", b"</yt:videoId>", lo, hi)
+    updated = _between(data, b"<updated>", b"</updated>", lo, hi)
+    if not vid:
+        return None
+    return hashlib.blake2b(vid + b"|" + (updated or b""), digest_size=8).hexdigest()
@@ -16,6 +16,9 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple
 
+from .latency_ledger import ensure_latency_ledger
+from .stats_counters import ensure_counters
+
 # Ensure ytapi_snapshots schema (incl. channel_title) exists/updated
 try:
     # Local import to avoid circulars at module import time
@@ -148,6 +151,9 @@ def ensure_tables(con: sqlite3.Connection) -> None:
     except Exception:
         pass
     con.commit()
+    # /health 等が count(*) せずに済むよう行数カウンタを維持
+    ensure_counters(con, ("trending_ranks", "growth_metrics"))
+    ensure_latency_ledger(con)
 
 
 def open_db(path: str) -> sqlite3.Connection:
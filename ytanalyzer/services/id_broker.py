@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+videos.list / channels.list 共通の ID ブローカ（ytapi_id_queue）
+
+各フェッチャは取得したい ID を submit() で優先度と締め切り付きで積み、flush() で送る。
+送るときは endpoint ごとに全フェッチャの積み残しをまとめて 50 件ずつ詰めるので、
+api-fetch の端数（10 分で 7 本など）や api-refetch の再取得が同じリクエストに相乗りする。
+
+- 優先度: PRIORITY_NEW（新規検出）> PRIORITY_REFETCH（1h/3h/6h/24h の再取得）> PRIORITY_BACKFILL
+  優先度の高い順・締め切りの早い順に詰めるので、端数のチャンクには優先度の低い ID が残る
+- 満杯（batch_size 件）のチャンクは常に送る。端数のチャンクは、締め切りが now + horizon 以内の ID を
+  含むとき（次回の実行では間に合わないとき）か force のときだけ送り、それ以外は次回に持ち越す
+- 重複はまとめる: 同じ (endpoint, id) は 1 行。優先度は高い方、締め切りは早い方を採る。
+  送信済みの行は dedup_sec の間残し、その間の再 submit は無視する（同じ分に二重に取りに行かない）
+- 送信中の行は claimed_until まで他のプロセスに渡さない（異常終了しても期限が切れれば再び送られる）
+- 送信に失敗したチャンクは ytapi_client の ytapi_retry_queue に移る（ブローカからは消す）
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .ytapi_client import fetch_all
+
+PRIORITY_NEW = 0
+PRIORITY_REFETCH = 1
+PRIORITY_BACKFILL = 2
+
+DEDUP_SEC_DEFAULT = 300
+CLAIM_SEC = 600
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(microsecond=0).isoformat()
+
+
+class IdBroker:
+    def __init__(self, con: sqlite3.Connection, dedup_sec: int = DEDUP_SEC_DEFAULT):
+        self.con = con
+        self.dedup_sec = dedup_sec
+        con.execute(
+            """
+            create table if not exists ytapi_id_queue(
+              endpoint text not null,
+              id text not null,
+              priority integer not null,
+              deadline_at text not null,
+              ctx text,
+              source text,
+              enqueued_at text,
+              claimed_until text,
+              sent_at text,
+              primary key(endpoint, id)
+            ) without rowid
+            """
+        )
+        con.execute(
+            "create index if not exists idx_ytapi_id_queue_pending "
+            "on ytapi_id_queue(endpoint, priority, deadline_at) where sent_at is null"
+        )
+        con.execute(
+            "create index if not exists idx_ytapi_id_queue_sent on ytapi_id_queue(sent_at) where sent_at is not null"
+        )
+        con.commit()
+
+    def submit(
+        self,
+        endpoint: str,
+        ids: Dict[str, Any],
+        priority: int,
+        deadline_ts: float,
+        source: str = "",
+        deadlines: Optional[Dict[str, float]] = None,
+    ) -> List[str]:
+        """
+        {id: 文脈} を積む（締め切りは deadlines で ID ごとに上書き可）。
+        新たに受け付けた ID（未送信の積み残しにも、dedup_sec 以内の送信済みにも無かったもの）を返す
+        """
+        now = time.time()
+        cutoff = _iso(now - self.dedup_sec)
+        wanted = list(ids)
+        held = set()
+        for i in range(0, len(wanted), 500):
+            part = wanted[i : i + 500]
+            qmarks = ",".join("?" * len(part))
+            held.update(
+                r[0]
+                for r in self.con.execute(
+                    f"select id from ytapi_id_queue where endpoint=? and id in ({qmarks}) and (sent_at is null or sent_at >= ?)",
+                    (endpoint, *part, cutoff),
+                )
+            )
+        self.con.executemany(
+            """
+            insert into ytapi_id_queue(endpoint, id, priority, deadline_at, ctx, source, enqueued_at)
+            values(?,?,?,?,?,?,?)
+            on conflict(endpoint, id) do update set
+              priority=case when sent_at is null then min(priority, excluded.priority) else excluded.priority end,
+              deadline_at=case when sent_at is null then min(deadline_at, excluded.deadline_at) else excluded.deadline_at end,
+              source=case when sent_at is null and priority <= excluded.priority then source else excluded.source end,
+              ctx=coalesce(excluded.ctx, ctx),
+              enqueued_at=case when sent_at is null then enqueued_at else excluded.enqueued_at end,
+              claimed_until=case when sent_at is null then claimed_until else null end,
+              sent_at=null
+            where sent_at is null or sent_at < ?
+            """,
+            [
+                (
+                    endpoint, i, int(priority), _iso((deadlines or {}).get(i, deadline_ts)),
+                    json.dumps(ctx) if ctx is not None else None, source, _iso(now), cutoff,
+                )
+                for i, ctx in ids.items()
+            ],
+        )
+        self.con.commit()
+        return [i for i in wanted if i not in held]
+
+    def _pending(self, endpoint: str, limit: int, now: float) -> List[sqlite3.Row]:
+        return self.con.execute(
+            """
+            select id, ctx, deadline_at from ytapi_id_queue
+            where endpoint=? and sent_at is null and (claimed_until is null or claimed_until < ?)
+            order by priority, deadline_at
+            limit ?
+            """,
+            (endpoint, _iso(now), limit),
+        ).fetchall()
+
+    def _claim(self, endpoint: str, ids: Sequence[str], now: float) -> None:
+        self.con.executemany(
+            "update ytapi_id_queue set claimed_until=? where endpoint=? and id=?",
+            [(_iso(now + CLAIM_SEC), endpoint, i) for i in ids],
+        )
+        self.con.commit()
+
+    def take(
+        self,
+        endpoint: str,
+        batch_size: int = 50,
+        horizon_sec: float = 0,
+        force: bool = False,
+        max_chunks: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """送るチャンク（{id: 文脈} のリスト）を取り出して予約する。端数は締め切りが近いときだけ"""
+        n = max(1, min(int(batch_size), 50))
+        now = time.time()
+        self._prune(now)
+        limit = n * max_chunks if max_chunks else -1
+        rows = self._pending(endpoint, limit, now)
+        chunks = [rows[i : i + n] for i in range(0, len(rows), n)]
+        if chunks and len(chunks[-1]) < n and not force:
+            soon = _iso(now + horizon_sec)
+            if min(r[2] for r in chunks[-1]) > soon:
+                chunks.pop()
+        out = [{r[0]: (json.loads(r[1]) if r[1] is not None else None) for r in c} for c in chunks]
+        self._claim(endpoint, [i for c in out for i in c], now)
+        return out
+
+    def take_fill(self, endpoint: str, n: int) -> Dict[str, Any]:
+        """どのみち送るリクエストの空き枠 n 件を、締め切りに関係なく優先度順に埋める"""
+        if n <= 0:
+            return {}
+        now = time.time()
+        rows = self._pending(endpoint, n, now)
+        out = {r[0]: (json.loads(r[1]) if r[1] is not None else None) for r in rows}
+        self._claim(endpoint, list(out), now)
+        return out
+
+    def mark_sent(self, endpoint: str, ids: Sequence[str]) -> None:
+        """送信済みにする（行が無ければ送信済みとして作る。dedup_sec の間の再 submit を抑える）"""
+        now = _iso(time.time())
+        self.con.executemany(
+            """
+            insert into ytapi_id_queue(endpoint, id, priority, deadline_at, enqueued_at, sent_at)
+            values(?,?,?,?,?,?)
+            on conflict(endpoint, id) do update set sent_at=excluded.sent_at, claimed_until=null
+            """,
+            [(endpoint, i, PRIORITY_BACKFILL, now, now, now) for i in ids],
+        )
+        self.con.commit()
+
+    def drop_unsent(self, endpoint: str, ids: Sequence[str]) -> None:
+        """予約したのに送れなかった行を消す（ytapi_retry_queue 側で再送される）"""
+        self.con.executemany(
+            "delete from ytapi_id_queue where endpoint=? and id=? and sent_at is null", [(endpoint, i) for i in ids]
+        )
+        self.con.commit()
+
+    def _prune(self, now: float) -> None:
+        self.con.execute(
+            "delete from ytapi_id_queue where sent_at is not null and sent_at < ?", (_iso(now - self.dedup_sec),)
+        )
+
+    def pending(self, endpoint: str) -> int:
+        return self.con.execute(
+            "select count(*) from ytapi_id_queue where endpoint=? and sent_at is null", (endpoint,)
+        ).fetchone()[0]
+
+
+def flush(
+    con: sqlite3.Connection,
+    keys: Sequence[str],
+    endpoint: str,
+    part: str,
+    save: Callable[[List[Dict[str, Any]], Dict[str, Any]], int],
+    *,
+    horizon_sec: float = 0,
+    force: bool = False,
+    max_chunks: Optional[int] = None,
+    batch_size: int = 50,
+    on_unsent: Optional[Callable[[List[str]], None]] = None,
+    **fetch_kw: Any,
+) -> Dict[str, int]:
+    """
+    ブローカに積まれた endpoint の ID（全フェッチャ分）を詰めて送る。
+    ytapi_retry_queue の期限到来分も fetch_all が先に送る。戻り値は fetch_all の結果 + ids / pending。
+    on_unsent を渡すと、取り出したのに保存できなかった ID（ytapi_retry_queue に移ったもの）で呼ぶ
+    """
+    broker = IdBroker(con)
+    ids: Dict[str, Any] = {}
+    for chunk in broker.take(endpoint, batch_size, horizon_sec, force, max_chunks):
+        ids.update(chunk)
+
+    sent: set = set()
+
+    def save_sent(items: List[Dict[str, Any]], ctx: Dict[str, Any]) -> int:
+        n = save(items, ctx)
+        broker.mark_sent(endpoint, list(ctx))
+        sent.update(ctx)
+        return n
+
+    res = fetch_all(con, keys, endpoint, part, ids, save_sent, batch_size=batch_size, **fetch_kw)
+    # 失敗したチャンクは ytapi_retry_queue に移っている
+    broker.drop_unsent(endpoint, list(ids))
+    if on_unsent is not None:
+        unsent = [i for i in ids if i not in sent]
+        if unsent:
+            on_unsent(unsent)
+    res["ids"] = len(ids)
+    res["pending"] = broker.pending(endpoint)
+    return res
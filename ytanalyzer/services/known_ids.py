@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+既知の動画 ID キャッシュ（rss_watcher の書き込みスレッド用）
+
+フィードの 15 件のほとんどは既に取り込み済みなので、毎回 DB に問い合わせずに済むよう
+メモリ上で判定する。
+- hot   : 直近 hot_days 日に公開された動画の ID（完全一致の集合、上限 hot_max 件で古い順に追い出す）
+- bloom : rss_videos / rss_videos_discovered の全 ID を入れた Bloom フィルタ（偽陽性のみ、偽陰性なし）
+
+判定:
+  hot にある                 → 既知（DB に問い合わせない）
+  bloom が「無い」と言う     → 問い合わせずに挿入する
+  bloom が「あるかも」と言う → DB で確認（従来の IN 検索）
+新規かどうかは最終的に挿入の結果（insert or ignore で行が入ったか）で決まる。
+warm() の後に他のプロセス（WebSub の受信・他のシャード）が入れた ID は、ここでは「無い」と判定されても新規にならない。
+書き込みスレッドだけが触るのでロックは持たない。追加はコミット成功後に行う。
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Set, Tuple
+
+HOT_DAYS_DEFAULT = 7
+HOT_MAX_DEFAULT = 500_000
+BLOOM_FP_RATE = 0.01
+BLOOM_MIN_CAPACITY = 1_000_000
+BLOOM_GROWTH = 2.0  # 起動時の行数の何倍まで偽陽性率を保つか
+
+
+class BloomFilter:
+    """bytearray のビット列 + blake2b の二重ハッシュ（k 個の位置を h1 + i*h2 で作る）"""
+
+    def __init__(self, capacity: int, fp_rate: float = BLOOM_FP_RATE):
+        capacity = max(1, int(capacity))
+        self.nbits = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.k = max(1, round(self.nbits / capacity * math.log(2)))
+        self.bits = bytearray((self.nbits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        d = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        n = self.nbits
+        return ((h1 + i * h2) % n for i in range(self.k))
+
+    def add(self, key: str) -> None:
+        bits = self.bits
+        for p in self._positions(key):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class KnownIds:
+    def __init__(self, hot_days: int = HOT_DAYS_DEFAULT, hot_max: int = HOT_MAX_DEFAULT):
+        self.hot_days = hot_days
+        self.hot_max = max(1, int(hot_max))
+        self.hot: "OrderedDict[str, None]" = OrderedDict()
+        self.bloom = BloomFilter(BLOOM_MIN_CAPACITY)
+        self.warmed = False
+        self.counts: Dict[str, int] = {"hot": 0, "bloom_new": 0, "db_known": 0, "db_new": 0}
+
+    def warm(self, con: sqlite3.Connection) -> int:
+        """DB から読み込む。Bloom の大きさは既存の行数から決める。読み込んだ hot 件数を返す"""
+        tables = ("rss_videos", "rss_videos_discovered")
+        n = max(con.execute(f"select coalesce(max(rowid), 0) from {t}").fetchone()[0] for t in tables)
+        self.bloom = BloomFilter(max(BLOOM_MIN_CAPACITY, int(n * BLOOM_GROWTH)))
+        for table in tables:
+            for (vid,) in con.execute(f"select video_id from {table}"):
+                self.bloom.add(vid)
+        # hot は両テーブルにそろっている ID のみ（片方だけなら従来どおり DB で確かめて補完させる）
+        since = (datetime.now(timezone.utc) - timedelta(days=self.hot_days)).replace(microsecond=0).isoformat()
+        self.hot.clear()
+        for (vid,) in con.execute(
+            """
+            select v.video_id from rss_videos v
+            join rss_videos_discovered d on d.video_id = v.video_id
+            where v.published_at >= ?
+            order by v.published_at
+            """,
+            (since,),
+        ):
+            self._remember(vid)
+        self.warmed = True
+        return len(self.hot)
+
+    def _remember(self, vid: str) -> None:
+        hot = self.hot
+        if vid in hot:
+            hot.move_to_end(vid)
+            return
+        hot[vid] = None
+        if len(hot) > self.hot_max:
+            hot.popitem(last=False)
+
+    def classify(self, ids: Iterable[str]) -> Tuple[Set[str], List[str]]:
+        """(確実に既知の ID, DB で確認が必要な ID) を返す。どちらにも無いものは確実に新規"""
+        known: Set[str] = set()
+        maybe: List[str] = []
+        for vid in ids:
+            if vid in self.hot:
+                self.hot.move_to_end(vid)
+                known.add(vid)
+            elif vid in self.bloom:
+                maybe.append(vid)
+            else:
+                self.counts["bloom_new"] += 1
+        self.counts["hot"] += len(known)
+        return known, maybe
+
+    def record_lookup(self, looked_up: int, found: int) -> None:
+        self.counts["db_known"] += found
+        self.counts["db_new"] += looked_up - found
+
+    def add_many(self, ids: Iterable[str]) -> None:
+        """コミット済みの ID（新規・DB で既知と確認したもの）を覚える"""
+        for vid in ids:
+            if vid not in self.hot and vid not in self.bloom:
+                self.bloom.add(vid)
+            self._remember(vid)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hot_size": len(self.hot), "bloom_adds": self.bloom.count, "bloom_bytes": len(self.bloom.bits), **self.counts}
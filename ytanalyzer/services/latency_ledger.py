@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+検出レイテンシ台帳（published → discovered → first snapshot → ranked）
+
+video_latency に動画ごとの各段階の時刻を 1 行にまとめる。
+- discovered_at    : rss_videos_discovered への挿入時（トリガ）
+- first_snapshot_at: ytapi_snapshots への最初の挿入時（トリガ、polled_at）
+- ranked_at        : trending_ranks への最初の挿入時（トリガ）
+書き込み側のコードは変更せず、ensure_latency_ledger() が存在するテーブルにトリガを張る。
+
+レポート:
+  python -m ytanalyzer.services.latency_ledger --db data/rss_watch.sqlite --hours 24
+  python -m ytanalyzer.cli latency-report --hours 24
+  Web: /latency.json?hours=24
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+DB_DEFAULT = "data/rss_watch.sqlite"
+
+# (名前, 始点カラム, 終点カラム)
+STAGES = (
+    ("published_to_discovered", "published_at", "discovered_at"),
+    ("discovered_to_first_snapshot", "discovered_at", "first_snapshot_at"),
+    ("first_snapshot_to_ranked", "first_snapshot_at", "ranked_at"),
+    ("published_to_ranked", "published_at", "ranked_at"),
+)
+PERCENTILES = (50, 95, 99)
+
+# 台帳の時刻は ISO8601（UTC, +00:00）にそろえる。datetime('now') 形式もここで変換
+_ISO = "strftime('%Y-%m-%dT%H:%M:%S+00:00', {v})"
+
+_TRIGGERS = {
+    "rss_videos_discovered": (
+        "trg_lat_discovered",
+        """
+        create trigger if not exists trg_lat_discovered after insert on rss_videos_discovered begin
+          insert into video_latency(video_id, channel_id, published_at, discovered_at)
+          values(new.video_id, new.channel_id, new.published_at, new.discovered_at)
+          on conflict(video_id) do update set
+            published_at=coalesce(video_latency.published_at, excluded.published_at),
+            discovered_at=coalesce(video_latency.discovered_at, excluded.discovered_at);
+        end
+        """,
+    ),
+    "ytapi_snapshots": (
+        "trg_lat_snapshot",
+        f"""
+        create trigger if not exists trg_lat_snapshot after insert on ytapi_snapshots begin
+          update video_latency set first_snapshot_at={_ISO.format(v='new.polled_at')}
+          where video_id=new.video_id and first_snapshot_at is null;
+        end
+        """,
+    ),
+    "trending_ranks": (
+        "trg_lat_ranked",
+        f"""
+        create trigger if not exists trg_lat_ranked after insert on trending_ranks begin
+          update video_latency set ranked_at={_ISO.format(v="coalesce(new.updated_at, datetime('now'))")}
+          where video_id=new.video_id and ranked_at is null;
+        end
+        """,
+    ),
+}
+
+
+def ensure_latency_ledger(con: sqlite3.Connection) -> None:
+    """台帳テーブルと、存在するテーブルへのトリガを作る"""
+    con.execute(
+        """
+        create table if not exists video_latency(
+          video_id text primary key,
+          channel_id text,
+          published_at text,
+          discovered_at text,
+          first_snapshot_at text,
+          ranked_at text
+        )
+        """
+    )
+    con.execute("create index if not exists idx_video_latency_discovered on video_latency(discovered_at)")
+    for table, (_, ddl) in _TRIGGERS.items():
+        if con.execute("select 1 from sqlite_master where type='table' and name=?", (table,)).fetchone():
+            con.execute(ddl)
+    con.commit()
+
+
+def backfill(con: sqlite3.Connection, days: int = 7) -> int:
+    """直近 days 日の発見分を既存テーブルから台帳へ入れる（トリガ導入前のデータ用）"""
+    ensure_latency_ledger(con)
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).replace(microsecond=0).isoformat()
+    cur = con.execute(
+        """
+        insert or ignore into video_latency(video_id, channel_id, published_at, discovered_at)
+        select video_id, channel_id, published_at, discovered_at
+        from rss_videos_discovered where discovered_at >= ?
+        """,
+        (since,),
+    )
+    n = max(0, cur.rowcount)
+    tables = {r[0] for r in con.execute("select name from sqlite_master where type='table'")}
+    if "ytapi_snapshots" in tables:
+        con.execute(
+            f"""
+            update video_latency set first_snapshot_at=(
+              select {_ISO.format(v='min(s.polled_at)')} from ytapi_snapshots s where s.video_id=video_latency.video_id
+            )
+            where first_snapshot_at is null and discovered_at >= ?
+            """,
+            (since,),
+        )
+    if "trending_ranks" in tables:
+        # 初回ランク入りの時刻は残っていないので、現在の updated_at で近似
+        con.execute(
+            f"""
+            update video_latency set ranked_at=(
+              select {_ISO.format(v='t.updated_at')} from trending_ranks t where t.video_id=video_latency.video_id
+            )
+            where ranked_at is null and discovered_at >= ?
+            """,
+            (since,),
+        )
+    con.commit()
+    return n
+
+
+def _percentile(xs: Sequence[float], p: float) -> Optional[float]:
+    if not xs:
+        return None
+    # nearest-rank
+    k = max(0, min(len(xs) - 1, math.ceil(p / 100.0 * len(xs)) - 1))
+    return xs[k]
+
+
+def latency_report(con: sqlite3.Connection, hours: int = 24) -> Dict[str, Any]:
+    """直近 hours 時間に発見した動画について、段階ごとの遅延（秒）の p50/p95/p99 を返す"""
+    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).replace(microsecond=0).isoformat()
+    out: Dict[str, Any] = {"since": since, "hours": hours, "stages": {}}
+    try:
+        total = con.execute("select count(*) from video_latency where discovered_at >= ?", (since,)).fetchone()[0]
+    except sqlite3.OperationalError:
+        out["videos"] = 0
+        return out
+    out["videos"] = total
+    for name, a, b in STAGES:
+        rows = con.execute(
+            f"""
+            select (julianday({b}) - julianday({a})) * 86400.0
+            from video_latency
+            where discovered_at >= ? and {a} is not null and {b} is not null
+            """,
+            (since,),
+        ).fetchall()
+        xs: List[float] = sorted(max(0.0, r[0]) for r in rows if r[0] is not None)
+        stage: Dict[str, Any] = {"n": len(xs), "pending": total - len(xs)}
+        for p in PERCENTILES:
+            v = _percentile(xs, p)
+            stage[f"p{p}"] = round(v, 1) if v is not None else None
+        out["stages"][name] = stage
+    return out
+
+
+def _fmt_sec(v: Optional[float]) -> str:
+    if v is None:
+        return "-"
+    if v < 120:
+        return f"{v:.0f}s"
+    if v < 7200:
+        return f"{v / 60:.1f}m"
+    return f"{v / 3600:.1f}h"
+
+
+def format_report(rep: Dict[str, Any]) -> str:
+    lines = [f"videos discovered in last {rep['hours']}h: {rep['videos']}"]
+    lines.append(f"{'stage':<30} {'n':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, st in rep["stages"].items():
+        lines.append(
+            f"{name:<30} {st['n']:>7} {_fmt_sec(st['p50']):>8} {_fmt_sec(st['p95']):>8} {_fmt_sec(st['p99']):>8}"
+        )
+    return "\n".join(lines)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="End-to-end discovery latency report (p50/p95/p99 per stage)")
+    ap.add_argument("--db", default=DB_DEFAULT)
+    ap.add_argument("--hours", type=int, default=24, help="直近何時間に発見した動画を対象にするか")
+    ap.add_argument("--backfill-days", type=int, default=0, help="既存テーブルから直近 N 日分を台帳に取り込んでから集計")
+    ap.add_argument("--json", action="store_true", help="JSON で出力")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    con = sqlite3.connect(args.db, timeout=60)
+    ensure_latency_ledger(con)
+    if args.backfill_days:
+        n = backfill(con, args.backfill_days)
+        print(f"backfilled {n} videos")
+    rep = latency_report(con, args.hours)
+    con.close()
+    if args.json:
+        print(json.dumps(rep, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(rep))
+
+
+if __name__ == "__main__":
+    main()
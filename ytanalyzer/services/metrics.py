@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus テキスト形式のメトリクス（依存ライブラリなし）
+
+Counter / Gauge / Histogram をプロセス内の REGISTRY に登録し、
+serve_metrics(port) で GET /metrics を返す HTTP サーバをデーモンスレッドで起動する。
+イベントループと書き込みスレッドの両方から更新されるため、各メトリクスはロックで保護する。
+
+使い方:
+  REQUESTS = REGISTRY.counter("rss_requests_total", "HTTP requests by status", ["status"])
+  REQUESTS.inc(status="200")
+  FETCH = REGISTRY.histogram("rss_fetch_seconds", "Feed fetch latency", LATENCY_BUCKETS)
+  FETCH.observe(0.12)
+  serve_metrics(9108)
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+DB_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, kw: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(kw.get(n, "")) for n in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_num(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """set() で値を入れるか、set_function() でスクレイプ時に評価する関数を登録する"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._funcs: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def set_function(self, fn: Callable[[], float], **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._funcs[key] = fn
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            funcs = dict(self._funcs)
+        for key, fn in funcs.items():
+            try:
+                values[key] = float(fn())
+            except Exception:
+                continue
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_num(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, buckets: Sequence[float] = LATENCY_BUCKETS, labels: Sequence[str] = ()):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (bucket ごとの件数（非累積）, 合計, 件数)
+        self._data: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, n = self._data.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[idx] += 1
+            self._data[key] = (counts, total + value, n + 1)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._data.items())
+        out: List[str] = []
+        for key, (counts, total, n) in items:
+            acc = 0
+            for b, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = 'le="%s"' % _fmt_num(b)
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_num(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {n}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, m: _Metric) -> _Metric:
+        with self._lock:
+            # 同名は最初の登録を使う（モジュールの再読み込み対策）
+            return self._metrics.setdefault(m.name, m)
+
+    def counter(self, name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, doc, labels))  # type: ignore[return-value]
+
+    def gauge(self, name: str, doc: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, doc, labels))  # type: ignore[return-value]
+
+    def histogram(
+        self, name: str, doc: str, buckets: Sequence[float] = LATENCY_BUCKETS, labels: Sequence[str] = ()
+    ) -> Histogram:
+        return self._register(Histogram(name, doc, buckets, labels))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1", registry: Optional[Registry] = None) -> ThreadingHTTPServer:
+    """GET /metrics を返す HTTP サーバをデーモンスレッドで起動する"""
+    reg = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = reg.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # noqa: A002
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+    return server
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+YouTube Data API のクォータ台帳（キー × 太平洋時間の日付 × endpoint ごとの消費ユニット）
+
+ytapi_client.YtApiClient が 1 リクエストごとに record() で加算する（api-fetch / api-refetch /
+channel-fetch / --pipeline のすべて）。残りユニットは主キーの範囲を引くだけで求まるので、
+従来の ytapi_snapshots の count(*)（UTC の日付・videos.list のみ）による推定は使わない。
+
+- ytapi_quota_ledger(key_id, day, endpoint, units, requests, errors, updated_at)
+    key_id は API キーの SHA-256 先頭 16 桁（キーそのものは保存しない）、day は太平洋時間の YYYY-MM-DD
+- ytapi_quota_keys(key_id, label, daily_units, updated_at) … 表示名と 1 日の上限（クライアント起動時に登録）
+- API が quotaExceeded を返したキーは、その日の残りを endpoint='quota_exceeded' の行で埋める（mark_exhausted）。
+  台帳上も使い切りになるので、再起動したクライアントも太平洋時間の 0 時までそのキーを外したまま始める
+- stats_hourly の ytapi_units … UTC の時間別消費ユニット（燃焼速度の計算用）
+
+レポート:
+  python -m ytanalyzer.services.quota_ledger --db data/rss_watch.sqlite
+  python -m ytanalyzer.cli quota-report
+  Web: /quota.json、進捗 JSON（rss_dashboard.html）の quota
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from .stats_counters import ensure_counters, hour_key
+
+DB_DEFAULT = "data/rss_watch.sqlite"
+HOURLY_NAME = "ytapi_units"
+BURN_WINDOW_HOURS = 3
+EXHAUSTED_ENDPOINT = "quota_exceeded"
+
+
+def key_id(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def key_label(key: str) -> str:
+    return f"...{key[-4:]}" if len(key) > 4 else "key"
+
+
+def ensure_quota_ledger(con: sqlite3.Connection) -> None:
+    con.execute(
+        """
+        create table if not exists ytapi_quota_ledger(
+          key_id text not null,
+          day text not null,
+          endpoint text not null,
+          units integer not null default 0,
+          requests integer not null default 0,
+          errors integer not null default 0,
+          updated_at text,
+          primary key(key_id, day, endpoint)
+        ) without rowid
+        """
+    )
+    con.execute(
+        """
+        create table if not exists ytapi_quota_keys(
+          key_id text primary key,
+          label text,
+          daily_units integer,
+          updated_at text
+        )
+        """
+    )
+    con.commit()
+    # stats_hourly を用意する（トリガは張らない）
+    ensure_counters(con, ())
+
+
+def _utciso() -> str:
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+class QuotaLedger:
+    """1 接続に紐づく台帳。record() はその場でコミットする（別プロセスの残量判定にすぐ反映させる）"""
+
+    def __init__(self, con: sqlite3.Connection):
+        self.con = con
+        ensure_quota_ledger(con)
+
+    def register(self, key: str, daily_units: int) -> str:
+        kid = key_id(key)
+        self.con.execute(
+            "insert into ytapi_quota_keys(key_id, label, daily_units, updated_at) values(?,?,?,?) "
+            "on conflict(key_id) do update set label=excluded.label, daily_units=excluded.daily_units, "
+            "updated_at=excluded.updated_at",
+            (kid, key_label(key), int(daily_units), _utciso()),
+        )
+        self.con.commit()
+        return kid
+
+    def record(self, kid: str, day: str, endpoint: str, units: int, error: bool = False) -> None:
+        now = _utciso()
+        self.con.execute(
+            "insert into ytapi_quota_ledger(key_id, day, endpoint, units, requests, errors, updated_at) "
+            "values(?,?,?,?,?,?,?) on conflict(key_id, day, endpoint) do update set "
+            "units=units+excluded.units, requests=requests+excluded.requests, errors=errors+excluded.errors, "
+            "updated_at=excluded.updated_at",
+            (kid, day, endpoint, units, 0 if error else 1, 1 if error else 0, now),
+        )
+        if units:
+            self.con.execute(
+                "insert into stats_hourly(name, hour, value) values(?,?,?) "
+                "on conflict(name, hour) do update set value=value+excluded.value",
+                (HOURLY_NAME, now[:13], units),
+            )
+        self.con.commit()
+
+    def used(self, kid: str, day: str) -> int:
+        """その日の消費ユニット（主キーの範囲のみ。endpoint の数だけの行を足す）"""
+        r = self.con.execute(
+            "select coalesce(sum(units), 0) from ytapi_quota_ledger where key_id=? and day=?", (kid, day)
+        ).fetchone()
+        return int(r[0])
+
+    def remaining(self, kid: str, day: str, daily_units: int) -> int:
+        return max(0, int(daily_units) - self.used(kid, day))
+
+    def mark_exhausted(self, kid: str, day: str, daily_units: int) -> None:
+        """API 側でクォータ切れになったキーの残りを埋める（燃焼速度の stats_hourly には足さない）"""
+        short = int(daily_units) - self.used(kid, day)
+        if short <= 0:
+            return
+        self.con.execute(
+            "insert into ytapi_quota_ledger(key_id, day, endpoint, units, requests, errors, updated_at) "
+            "values(?,?,?,?,0,0,?) on conflict(key_id, day, endpoint) do update set "
+            "units=units+excluded.units, updated_at=excluded.updated_at",
+            (kid, day, EXHAUSTED_ENDPOINT, short, _utciso()),
+        )
+        self.con.commit()
+
+
+def quota_report(con: sqlite3.Connection, day: Optional[str] = None) -> Dict[str, Any]:
+    """太平洋時間 day（既定は今日）のキー別消費・残り、直近の燃焼速度（units/h）と日替わりまでの見込み"""
+    from .ytapi_client import next_pacific_reset, pacific_day
+
+    day = day or pacific_day()
+    try:
+        rows = con.execute(
+            """
+            select l.key_id, k.label, k.daily_units, l.endpoint, l.units, l.requests, l.errors
+            from ytapi_quota_ledger l left join ytapi_quota_keys k on k.key_id=l.key_id
+            where l.day=?
+            """,
+            (day,),
+        ).fetchall()
+        keys_rows = con.execute("select key_id, label, daily_units from ytapi_quota_keys").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    keys: Dict[str, Dict[str, Any]] = {}
+    for kid, label, daily in keys_rows:
+        keys[kid] = {"label": label, "daily_units": daily, "used": 0, "requests": 0, "errors": 0, "endpoints": {}}
+    for kid, label, daily, endpoint, units, reqs, errs in rows:
+        k = keys.setdefault(
+            kid, {"label": label or kid[:6], "daily_units": daily, "used": 0, "requests": 0, "errors": 0, "endpoints": {}}
+        )
+        k["used"] += units
+        k["requests"] += reqs
+        k["errors"] += errs
+        k["endpoints"][endpoint] = k["endpoints"].get(endpoint, 0) + units
+    for k in keys.values():
+        k["remaining"] = max(0, k["daily_units"] - k["used"]) if k["daily_units"] is not None else None
+    used = sum(k["used"] for k in keys.values())
+    budget = sum(k["daily_units"] or 0 for k in keys.values())
+    remaining = max(0, budget - used)
+
+    # 燃焼速度: 直近 BURN_WINDOW_HOURS 時間ぶんの時間別バケツ ÷ 最初のバケツの先頭からの経過時間
+    now = datetime.now(timezone.utc)
+    start = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=BURN_WINDOW_HOURS - 1)
+    try:
+        r = con.execute(
+            "select coalesce(sum(value), 0) from stats_hourly where name=? and hour >= ?", (HOURLY_NAME, hour_key(start))
+        ).fetchone()
+        recent = int(r[0])
+    except sqlite3.OperationalError:
+        recent = 0
+    elapsed_h = max(1.0 / 60, (now - start).total_seconds() / 3600.0)
+    burn = recent / elapsed_h
+    reset_ts = next_pacific_reset()
+    hours_to_reset = max(0.0, (reset_ts - time.time()) / 3600.0)
+    return {
+        "day": day,
+        "used": used,
+        "budget": budget,
+        "remaining": remaining,
+        "burn_per_hour": round(burn, 1),
+        "projected": int(used + burn * hours_to_reset),
+        "exhausts_in_hours": round(remaining / burn, 1) if burn > 0 else None,
+        "reset_at": datetime.fromtimestamp(reset_ts, tz=timezone.utc).replace(microsecond=0).isoformat(),
+        "keys": sorted(keys.values(), key=lambda k: k["label"] or ""),
+    }
+
+
+def format_report(rep: Dict[str, Any]) -> str:
+    if not rep:
+        return "no quota ledger yet"
+    lines = [
+        f"day (Pacific) {rep['day']}: used {rep['used']} / {rep['budget']} units, remaining {rep['remaining']}",
+        f"burn {rep['burn_per_hour']} units/h, projected {rep['projected']} by reset ({rep['reset_at']})"
+        + (f", exhausts in {rep['exhausts_in_hours']}h" if rep["exhausts_in_hours"] is not None else ""),
+        f"{'key':<10} {'used':>7} {'limit':>7} {'left':>7} {'reqs':>7} {'errs':>6}  endpoints",
+    ]
+    for k in rep["keys"]:
+        eps = " ".join(f"{e}={u}" for e, u in sorted(k["endpoints"].items()))
+        lines.append(
+            f"{k['label'] or '-':<10} {k['used']:>7} {k['daily_units'] or '-':>7} {k['remaining'] if k['remaining'] is not None else '-':>7} "
+            f"{k['requests']:>7} {k['errors']:>6}  {eps}"
+        )
+    return "\n".join(lines)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="YouTube Data API quota usage by key / day (Pacific) / endpoint")
+    ap.add_argument("--db", default=DB_DEFAULT)
+    ap.add_argument("--day", default=None, help="太平洋時間の日付 YYYY-MM-DD（既定は今日）")
+    ap.add_argument("--json", action="store_true", help="JSON で出力")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    con = sqlite3.connect(args.db, timeout=60)
+    rep = quota_report(con, args.day)
+    con.close()
+    if args.json:
+        print(json.dumps(rep, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(rep))
+
+
+if __name__ == "__main__":
+    main()
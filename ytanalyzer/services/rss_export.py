@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 """
-NDJSON エクスポート（直近ウィンドウの新着動画をファイル出力）
+NDJSON エクスポート（前回の続きから新着動画をファイル出力）
 
 仕様:
-- 集計対象: discovered_at ∈ [end - window_minutes, end)
-- 出力先: exports/rss_discovered_YYYYMMDDTHHMM.jsonl （UTC）
+- 集計対象: rss_videos_discovered の rowid がカーソル（rss_export_cursor.last_rowid）より大きい行
+  rowid は挿入順に増え（insert or ignore のみで削除しない）、書き込みは直列化されるのでコミット順にも単調。
+  discovered_at の文字列比較と違い、遅れてコミットされた行やループの遅延・スキップで取りこぼさない
+- カーソル検索は rowid の B-tree をそのまま範囲走査する（追加のインデックス不要）
+- 出力先: exports/rss_discovered_YYYYMMDDTHHMM_r<最後の rowid>.jsonl （UTC）。1 ファイル最大 --max-rows 行
 - 各行: {video_id, channel_id, title, discovered_at(ISO8601Z), published_at(ISO8601Z)}
-- 並び: discovered_at 昇順、同一ファイル内の重複 video_id は除外
-- 空ならファイル未作成で正常終了
-- 原子性: .tmp に書いてからリネーム
-- 初回大量取得のノイズ回避用: --min-published-hours で古い published を除外（既定=48h）
+- 並び: rowid（= 検出）順、同一ファイル内の重複 video_id は除外
+- 新着が無ければファイル未作成で正常終了
+- 原子性: .tmp に書いてからリネーム。書き出し前に出力予定（pending）を記録し、リネーム後にカーソルを確定する。
+  途中で止まった場合は次回起動時に、ファイルがあれば確定・無ければ同じ範囲を出し直す（各行はちょうど 1 回出力）
+- 初回（カーソル未作成）は discovered_at < 現在 - window_minutes の行を出力済みとみなす（--from-rowid で指定可）
+- 初回大量取得のノイズ回避用: --min-published-hours で古い published を除外（既定=48h、除外した行もカーソルは進める）
 
 実行例:
   # 単発
@@ -29,6 +34,9 @@ import time
 import json
 from email.utils import parsedate_to_datetime
 
+CURSOR_NAME = "rss_discovered"
+MAX_ROWS_DEFAULT = 50000
+
 
 def utcnow() -> datetime:
     return datetime.now(timezone.utc)
@@ -86,27 +94,121 @@ def open_db(path: str) -> sqlite3.Connection:
     return con
 
 
-def select_window(con: sqlite3.Connection, start_iso: str, end_iso: str) -> List[Dict[str, Any]]:
-    # 期間内の discovered を昇順で取得。published は動画テーブルから参照
+def ensure_cursor(con: sqlite3.Connection) -> None:
+    con.execute(
+        """
+        create table if not exists rss_export_cursor(
+          name text primary key,
+          last_rowid integer not null default 0,
+          pending_rowid integer,
+          pending_path text,
+          updated_at text
+        )
+        """
+    )
+    con.commit()
+
+
+def load_cursor(con: sqlite3.Connection, start_dt: datetime, from_rowid: Optional[int] = None) -> int:
+    """カーソル位置（出力済みの最大 rowid）を返す。未作成なら start_dt より前の行を出力済みとして作る"""
+    ensure_cursor(con)
+    now_iso = utcnow().replace(microsecond=0).isoformat()
+    if from_rowid is not None:
+        con.execute(
+            "insert into rss_export_cursor(name, last_rowid, updated_at) values(?,?,?) "
+            "on conflict(name) do update set last_rowid=excluded.last_rowid, pending_rowid=null, pending_path=null, "
+            "updated_at=excluded.updated_at",
+            (CURSOR_NAME, max(0, from_rowid), now_iso),
+        )
+        con.commit()
+        return max(0, from_rowid)
+    row = con.execute(
+        "select last_rowid, pending_rowid, pending_path from rss_export_cursor where name=?", (CURSOR_NAME,)
+    ).fetchone()
+    if row is None:
+        # 初回のみ全件走査（従来のウィンドウ出力の続きから始める）
+        last = con.execute(
+            "select coalesce(max(rowid), 0) from rss_videos_discovered where discovered_at < ?", (start_dt.isoformat(),)
+        ).fetchone()[0]
+        con.execute(
+            "insert into rss_export_cursor(name, last_rowid, updated_at) values(?,?,?)", (CURSOR_NAME, last, now_iso)
+        )
+        con.commit()
+        return int(last)
+    last, pending, path = row[0], row[1], row[2]
+    if pending is not None:
+        # 前回はファイル書き出し後・カーソル確定前に止まった
+        if path and os.path.exists(path):
+            last = pending
+        con.execute(
+            "update rss_export_cursor set last_rowid=?, pending_rowid=null, pending_path=null, updated_at=? where name=?",
+            (last, now_iso, CURSOR_NAME),
+        )
+        con.commit()
+    return int(last)
+
+
+def _set_cursor(con: sqlite3.Connection, last_rowid: int, pending_rowid: Optional[int] = None, pending_path: Optional[str] = None) -> None:
+    if pending_rowid is None:
+        sql = "update rss_export_cursor set last_rowid=?, pending_rowid=null, pending_path=null, updated_at=? where name=?"
+        params: Tuple[Any, ...] = (last_rowid, utcnow().replace(microsecond=0).isoformat(), CURSOR_NAME)
+    else:
+        sql = "update rss_export_cursor set pending_rowid=?, pending_path=?, updated_at=? where name=?"
+        params = (pending_rowid, pending_path, utcnow().replace(microsecond=0).isoformat(), CURSOR_NAME)
+    con.execute(sql, params)
+    con.commit()
+
+
+def select_after(con: sqlite3.Connection, after_rowid: int, limit: int) -> List[Dict[str, Any]]:
+    # カーソルより後の discovered を rowid 順に取得。published は動画テーブルから参照
     sql = (
-        "SELECT d.video_id, d.channel_id, d.title as d_title, d.discovered_at, v.published_at as v_published, v.title as v_title "
+        "SELECT d.rowid as rid, d.video_id, d.channel_id, d.title as d_title, d.discovered_at, "
+        "v.published_at as v_published, v.title as v_title "
         "FROM rss_videos_discovered d LEFT JOIN rss_videos v ON v.video_id=d.video_id "
-        "WHERE d.discovered_at >= ? AND d.discovered_at < ? "
-        "ORDER BY d.discovered_at ASC"
+        "WHERE d.rowid > ? "
+        "ORDER BY d.rowid ASC LIMIT ?"
     )
-    rows = [dict(r) for r in con.execute(sql, (start_iso, end_iso)).fetchall()]
+    rows = [dict(r) for r in con.execute(sql, (after_rowid, max(1, limit))).fetchall()]
     return rows
 
 
-def export_once(db_path: str, out_dir: str, window_minutes: int, end_time: Optional[datetime], min_published_hours: int) -> int:
+def export_once(
+    db_path: str,
+    out_dir: str,
+    window_minutes: int,
+    end_time: Optional[datetime],
+    min_published_hours: int,
+    max_rows: int = MAX_ROWS_DEFAULT,
+    from_rowid: Optional[int] = None,
+) -> int:
     end_dt = floor_to_minute(end_time or utcnow())
     start_dt = end_dt - timedelta(minutes=window_minutes)
-    start_iso = start_dt.isoformat()
-    end_iso = end_dt.isoformat()
 
     con = open_db(db_path)
-    rows = select_window(con, start_iso, end_iso)
+    try:
+        cursor = load_cursor(con, start_dt, from_rowid)
+        written = 0
+        while True:
+            rows = select_after(con, cursor, max_rows)
+            if not rows:
+                break
+            written += _export_rows(con, rows, out_dir, end_dt, min_published_hours)
+            cursor = rows[-1]["rid"]
+            if len(rows) < max_rows:
+                break
+    finally:
+        con.close()
+    if not written:
+        # 0 件ならファイルを作成しない
+        print(f"No new items after rowid {cursor}, skip file")
+    return 0
+
 
+def _export_rows(
+    con: sqlite3.Connection, rows: List[Dict[str, Any]], out_dir: str, end_dt: datetime, min_published_hours: int
+) -> int:
+    """1 ファイル分を書き出してカーソルを進める。書いた行数を返す"""
+    last_rowid = rows[-1]["rid"]
     # 去る初期巡回ノイズ: 古い published は除外（既定48h）
     pub_threshold = end_dt - timedelta(hours=max(0, min_published_hours))
 
@@ -132,35 +234,37 @@ def export_once(db_path: str, out_dir: str, window_minutes: int, end_time: Optio
         })
 
     if not items:
-        # 0 件ならファイルを作成しない
-        print(f"No items in window [{to_iso_z(start_dt)} - {to_iso_z(end_dt)}), skip file")
+        # すべて古い published だった: ファイルは作らずカーソルだけ進める
+        _set_cursor(con, last_rowid)
         return 0
 
     ensure_dir(out_dir)
     stamp = file_stamp(end_dt)
-    out_path = os.path.join(out_dir, f"rss_discovered_{stamp}.jsonl")
+    out_path = os.path.join(out_dir, f"rss_discovered_{stamp}_r{last_rowid:012d}.jsonl")
     tmp_path = out_path + ".tmp"
 
+    _set_cursor(con, last_rowid, pending_rowid=last_rowid, pending_path=out_path)
     with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
         for it in items:
             f.write(json.dumps(it, ensure_ascii=False, separators=(",", ":")))
             f.write("\n")
     os.replace(tmp_path, out_path)
+    _set_cursor(con, last_rowid)
     print(f"Wrote {len(items)} items -> {out_path}")
-    return 0
+    return len(items)
 
 
-def loop_export(db_path: str, out_dir: str, window_minutes: int, min_published_hours: int) -> int:
+def loop_export(db_path: str, out_dir: str, window_minutes: int, min_published_hours: int, max_rows: int = MAX_ROWS_DEFAULT) -> int:
     # 正時アラインで 10 分ごとに実行
     while True:
         now = utcnow()
         next_cut = ceil_to_window(now, window_minutes)
-        # 次のカットで [cut-window, cut) を出力
+        # 次のカットでカーソル以降をすべて出力（遅れても次回にまとめて出る）
         sleep_sec = (next_cut - now).total_seconds()
         if sleep_sec > 0:
             time.sleep(sleep_sec)
         try:
-            export_once(db_path, out_dir, window_minutes, next_cut, min_published_hours)
+            export_once(db_path, out_dir, window_minutes, next_cut, min_published_hours, max_rows)
         except Exception as e:
             # ログだけ出して続行
             print(f"export error: {e}")
@@ -170,8 +274,10 @@ def build_arg_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser(description="NDJSON exporter for RSS discovered videos")
     ap.add_argument("--db", required=True, help="SQLite DB (rss_watch.sqlite)")
     ap.add_argument("--out-dir", default="exports", help="出力先ディレクトリ")
-    ap.add_argument("--window-minutes", type=int, default=10, help="集計ウィンドウ（分）")
-    ap.add_argument("--now", type=str, default=None, help="単発実行のエンド時刻（UTC ISO、Z可）。未指定は現在時刻")
+    ap.add_argument("--window-minutes", type=int, default=10, help="--loop の実行間隔（分）。初回はこの分だけさかのぼって出力")
+    ap.add_argument("--now", type=str, default=None, help="単発実行の基準時刻（UTC ISO、Z可。ファイル名と published の判定に使用）。未指定は現在時刻")
+    ap.add_argument("--max-rows", type=int, default=MAX_ROWS_DEFAULT, help="1 ファイルあたりの最大行数（超えた分は続きのファイルへ）")
+    ap.add_argument("--from-rowid", type=int, default=None, help="カーソルをこの rowid に設定してから出力（0 で全件を出し直す）")
     ap.add_argument("--loop", action="store_true", help="10分ごとに繰り返し出力")
     ap.add_argument("--min-published-hours", type=int, default=48, help="この時間より古い published は除外（初回巡回対策）")
     return ap
@@ -181,9 +287,15 @@ def main(argv: Optional[List[str]] = None) -> int:
     ap = build_arg_parser()
     args = ap.parse_args(argv)
     if args.loop:
-        return loop_export(args.db, args.out_dir, args.window_minutes, args.min_published_hours) or 0
+        if args.from_rowid is not None:
+            con = open_db(args.db)
+            load_cursor(con, utcnow(), args.from_rowid)
+            con.close()
+        return loop_export(args.db, args.out_dir, args.window_minutes, args.min_published_hours, args.max_rows) or 0
     end_dt = parse_any_dt(args.now) if args.now else None
-    return export_once(args.db, args.out_dir, args.window_minutes, end_dt, args.min_published_hours) or 0
+    return export_once(
+        args.db, args.out_dir, args.window_minutes, end_dt, args.min_published_hours, args.max_rows, args.from_rowid
+    ) or 0
 
 
 if __name__ == "__main__":
@@ -5,15 +5,20 @@ YouTube RSS watcher (大規模チャンネル巡回で新着検出)
 機能:
 - 各チャンネルの RSS (https://www.youtube.com/feeds/videos.xml?channel_id=UC...) をポーリング
 - ETag / Last-Modified を活用し 304 多発で帯域節約
+- YouTube フィード専用のストリーミングパーサ（前回の最新動画に到達したら打ち切り）
+- 200 でも先頭エントリの指紋が前回と同じならパースせず 304 相当で処理
 - next_poll_at による適応スケジューリング（活動度・失敗回数で間隔を動的調整）
 - 429/5xx などは指数バックオフ + ジッタ
-- inflight 予約で二重投入防止
-- RPS（毎秒の最大リクエスト数）をトークンバケットで制御
+- 期限付きリース（lease_until / lease_owner）で二重投入防止。強制終了しても期限切れで自動回収（--scheduler heap ではメモリ上の min-heap で期限管理し、リースも書く）
+- 書き込みは専用スレッドでグループコミット（N ms / K 件ごとに 1 トランザクション）
+- RPS（毎秒の最大リクエスト数）をトークンバケットで制御。429/5xx が増えたら AIMD で全体レートを自動で絞る
+- --processes N で channel_id 空間を N シャードに分割し、プロセス間共有のトークンで合計 RPS を維持
 - 進捗を JSON に書き出し（ミニダッシュボードで可視化）
 
 使い方（例）:
   python -m ytanalyzer.services.rss_watcher --channels-file C:\\path\\yutura_channels.ndjson --once --limit 2000 --rps 10
   python -m ytanalyzer.services.rss_watcher --channels-file C:\\path\\yutura_channels.ndjson --concurrency 200 --rps 15 --batch 800 --tick 5
+  python -m ytanalyzer.services.rss_watcher --channels-file C:\\path\\yutura_channels.ndjson --processes 4 --rps 40
 
 CLI 統合（ytanalyzer.cli から）:
   python -m ytanalyzer.cli rss-watch --channels-file C:\\path\\yutura_channels.ndjson --rps 15
@@ -22,17 +27,44 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import heapq
+import math
 import json
+import multiprocessing as mp
 import os
+import queue
 import random
+import socket
 import sqlite3
+import threading
 import time
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
 from datetime import datetime, timezone, timedelta
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Sequence, Tuple, Callable
 
 import httpx
 import feedparser
 
+from .feed_parser import ParseError, feed_fingerprint, parse_feed
+from .api_pipeline import BATCH_SIZE_DEFAULT, MAX_WAIT_SEC_DEFAULT, VideoBatcher
+from .known_ids import HOT_DAYS_DEFAULT, KnownIds
+from .latency_ledger import ensure_latency_ledger
+from .quota_ledger import quota_report
+from .metrics import DB_BUCKETS, FAST_BUCKETS, LATENCY_BUCKETS, REGISTRY, WAIT_BUCKETS, serve_metrics
+from .stats_counters import POLL_UPSERT_SQL, ensure_counters, get_counters, hourly_since, poll_rows, row_count
+from .upload_profile import (
+    INCREMENT_SQL,
+    PROFILE_RELOAD_SEC,
+    UploadProfiles,
+    backfill_upload_hist,
+    ensure_upload_hist,
+    profile_interval,
+)
+from .video_store import insert_video
+from .websub import PUSH_POLL_SEC_DEFAULT, PUSHED_RELOAD_SEC, PushedChannels, ensure_websub
+
 
 UA = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -46,10 +78,58 @@ HEADERS_BASE = {
     "Cache-Control": "no-cache",
 }
 
+# フィードの URL（負荷試験ではローカルの偽サーバに向ける: --feed-url / 環境変数 RSS_FEED_URL）
+FEED_URL_DEFAULT = os.getenv("RSS_FEED_URL", "https://www.youtube.com/feeds/videos.xml")
+
 # 既存 DB とテーブル名衝突を避けるため、別 DB ファイルを既定にする
 DB_DEFAULT = os.path.join("data", "rss_watch.sqlite")
 # 進捗 JSON は data/ 配下に出力（ダッシュボードは data/rss_progress.json を参照）
 PROGRESS_JSON = os.path.join("data", "rss_progress.json")
+# 予約時に取り出す rss_channels の列（worker_loop の item になる）
+RESERVE_COLS = [
+    "channel_id",
+    "etag",
+    "last_modified",
+    "poll_interval_sec",
+    "failures",
+    "last_seen_published",
+    "last_seen_video_id",
+    "feed_fp",
+    "priority",
+    "gone_streak",
+    "retired_at",
+    "revalidations",
+]
+# 予約リースの既定有効期間（秒）。キュー待ち + タイムアウトより十分長くする
+LEASE_SEC_DEFAULT = 900
+PROFILE_MAX_AGE_SEC = 60 * 24 * 3600  # これより長く投稿が無いチャンネルは投稿時刻プロファイルを使わない
+# 優先レーン（rss_watchlist のチャンネル = priority 1）
+WATCH_SHARE_DEFAULT = 0.3  # 混雑時に watch レーンへ保証するリクエストの割合
+WATCH_MAX_INTERVAL_DEFAULT = 900  # watch レーンの巡回間隔の上限（秒）
+# 消えたチャンネルの退役（403/404/410 が連続 K 回で disabled=1、以後は間隔を倍々にして再確認）
+GONE_STATUSES = (403, 404, 410)
+RETIRE_AFTER_DEFAULT = 3
+REVALIDATE_DAYS_DEFAULT = 7  # 1 回目の再確認までの日数（2 回目以降は倍々）
+REVALIDATE_MAX_DAYS = 180
+
+# --metrics-port で公開するメトリクス（Prometheus テキスト形式）
+M_REQUESTS = REGISTRY.counter("rss_requests_total", "Feed requests by HTTP status (0 = connection error)", ["status"])
+M_FETCH = REGISTRY.histogram("rss_fetch_seconds", "Feed fetch latency (after the rate limiter)", LATENCY_BUCKETS)
+M_LIMITER_WAIT = REGISTRY.histogram("rss_limiter_wait_seconds", "Time spent waiting for the rate limiter", WAIT_BUCKETS)
+M_PARSE = REGISTRY.histogram("rss_parse_seconds", "Feed parse time (200 responses)", FAST_BUCKETS)
+M_DB_COMMIT = REGISTRY.histogram("rss_db_commit_seconds", "Writer thread flush (one transaction) latency", DB_BUCKETS)
+M_DB_OPS = REGISTRY.counter("rss_db_ops_total", "Write operations committed by the writer thread", ["kind"])
+M_QUEUE = REGISTRY.gauge("rss_queue_depth", "Items waiting in in-process queues", ["queue"])
+M_OVERDUE = REGISTRY.gauge("rss_overdue_channels", "Channels whose next_poll_at has passed")
+M_RPS = REGISTRY.gauge("rss_effective_rps", "Current request rate limit")
+M_LANE_WAIT = REGISTRY.histogram(
+    "rss_lane_wait_seconds", "Time a request waited for its priority lane's turn", WAIT_BUCKETS, ["lane"]
+)
+M_KNOWN = REGISTRY.counter(
+    "rss_known_id_checks_total",
+    "Feed entries classified by the known-ID cache (hot/bloom_new skip the DB, db_* were looked up)",
+    ["result"],
+)
 
 
 def _utcnow() -> datetime:
@@ -60,9 +140,17 @@ def _utciso() -> str:
     return _utcnow().replace(microsecond=0).isoformat()
 
 
+def shard_of(channel_id: str, nshards: int) -> int:
+    """channel_id → シャード番号（プロセス・OS をまたいで安定な crc32）"""
+    if nshards <= 1:
+        return 0
+    return zlib.crc32(str(channel_id).encode("utf-8")) % nshards
+
+
 def ensure_db(db: str) -> sqlite3.Connection:
     os.makedirs(os.path.dirname(db) or ".", exist_ok=True)
     con = sqlite3.connect(db, timeout=60)
+    con.create_function("rss_shard", 2, shard_of, deterministic=True)
     # テーブル名は衝突回避のため接頭辞 rss_
     con.execute("pragma journal_mode=WAL;")
     con.execute(
@@ -117,14 +205,84 @@ def ensure_db(db: str) -> sqlite3.Connection:
           last_seen_published text,
           last_seen_video_id text,
           inflight integer default 0,
-          disabled integer default 0
+          disabled integer default 0,
+          lease_until text,
+          lease_owner text,
+          feed_fp text
         )
         """
     )
+    cols = {r[1] for r in con.execute("pragma table_info(rss_channels)").fetchall()}
+    for name in ("lease_until", "lease_owner", "feed_fp"):
+        if name not in cols:
+            con.execute(f"alter table rss_channels add column {name} text")
+    if "priority" not in cols:
+        con.execute("alter table rss_channels add column priority integer default 0")
+    for name in ("gone_streak", "revalidations"):
+        if name not in cols:
+            con.execute(f"alter table rss_channels add column {name} integer default 0")
+    for name in ("retired_at", "revalidate_at"):
+        if name not in cols:
+            con.execute(f"alter table rss_channels add column {name} text")
+    ensure_upload_hist(con)
+    ensure_websub(con)
+    # 期限到来数を数える・予約するための部分インデックス
+    con.execute("create index if not exists idx_rss_channels_due on rss_channels(next_poll_at) where disabled=0")
+    con.execute(
+        "create index if not exists idx_rss_channels_prio_due on rss_channels(next_poll_at) where disabled=0 and priority>0"
+    )
+    con.execute(
+        "create index if not exists idx_rss_channels_retired on rss_channels(revalidate_at) where retired_at is not null"
+    )
     con.commit()
+    ensure_counters(con)
+    ensure_latency_ledger(con)
     return con
 
 
+def make_lease_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{random.getrandbits(32):08x}"
+
+
+def reclaim_leases(con: sqlite3.Connection) -> int:
+    """期限切れリースと、旧方式で残った inflight=1（リースなし）を解放する"""
+    cur = con.cursor()
+    cur.execute(
+        """
+        update rss_channels
+        set inflight=0, lease_until=null, lease_owner=null
+        where (lease_until is not null and lease_until <= ?)
+           or (lease_until is null and inflight=1)
+        """,
+        (_utciso(),),
+    )
+    n = cur.rowcount
+    con.commit()
+    return n
+
+
+def revalidate_after(revalidations: int, base_days: float = REVALIDATE_DAYS_DEFAULT) -> int:
+    """退役 n 回目（0 始まり）から再確認までの秒数: base × 2^n（上限 REVALIDATE_MAX_DAYS）"""
+    days = min(base_days * (2 ** min(max(0, revalidations), 16)), REVALIDATE_MAX_DAYS)
+    return int(days * 86400)
+
+
+def revalidate_retired(con: sqlite3.Connection) -> int:
+    """再確認の時刻が来た退役チャンネルを巡回対象に戻す（retired_at は成功するまで残す）"""
+    now = _utciso()
+    cur = con.execute(
+        """
+        update rss_channels
+        set disabled=0, next_poll_at=?
+        where retired_at is not null and disabled=1 and revalidate_at <= ?
+        """,
+        (now, now),
+    )
+    n = max(0, cur.rowcount)
+    con.commit()
+    return n
+
+
 def extract_ucid_from_url(url: str) -> Optional[str]:
     if not isinstance(url, str):
         return None
@@ -134,175 +292,807 @@ def extract_ucid_from_url(url: str) -> Optional[str]:
     return None
 
 
-def seed_channels(con: sqlite3.Connection, ndjson_path: str) -> int:
-    ucids = set()
-    with open(ndjson_path, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                row = json.loads(line)
-            except json.JSONDecodeError:
-                continue
-            url = row.get("youtube_channel_url") or row.get("channel_url") or row.get("url")
-            if not url:
-                continue
-            ucid = extract_ucid_from_url(url)
-            if ucid:
-                ucids.add(ucid)
+SEED_BATCH_DEFAULT = 5000
+SEED_INTERVAL_DEFAULT = 60
 
-    cur = con.cursor()
-    rows = []
+
+def _seed_insert(con: sqlite3.Connection, ucids: List[str]) -> int:
     now = _utcnow()
+    rows = []
     for u in ucids:
         jitter = timedelta(seconds=random.randint(0, 600))
-        rows.append(
-            (
-                u,
-                None,
-                None,
-                None,
-                None,
-                None,
-                0,
-                (now + jitter).replace(microsecond=0).isoformat(),
-                3600,
-                None,
-                None,
-                0,
-                0,
-            )
-        )
-    cur.executemany(
+        rows.append((u, 0, (now + jitter).replace(microsecond=0).isoformat(), 3600, 0, 0))
+    cur = con.executemany(
         """
         insert or ignore into rss_channels(
-          channel_id, etag, last_modified, last_checked_at, last_success_at, last_http_status,
-          failures, next_poll_at, poll_interval_sec, last_seen_published, last_seen_video_id, inflight, disabled
-        ) values(?,?,?,?,?,?,?,?,?,?,?,?,?)
+          channel_id, failures, next_poll_at, poll_interval_sec, inflight, disabled
+        ) values(?,?,?,?,?,?)
         """,
         rows,
     )
-    con.commit()
-    return len(ucids)
+    return max(0, cur.rowcount)
 
 
-def reserve_due_channels(con: sqlite3.Connection, limit: int) -> List[Dict[str, Any]]:
-    """next_poll_at <= now かつ inflight=0 を予約し取り出す"""
-    now = _utciso()
-    cur = con.cursor()
-    cur.execute(
+def seed_channels(con: sqlite3.Connection, ndjson_path: str, batch_size: int = SEED_BATCH_DEFAULT) -> int:
+    """
+    NDJSON からチャンネルを取り込み、新規に追加した件数を返す
+
+    どこまで読んだか（バイトオフセット + inode）を rss_seed_state に保存し、
+    次回は追記された行だけを読む。ファイルが差し替え・切り詰められていたら先頭から読み直す。
+    batch_size 行ずつ insert し、オフセットと同じトランザクションでコミットする。
+    書きかけ（改行で終わっていない）の最終行は次回に回す。
+    """
+    con.execute(
         """
-        select channel_id, etag, last_modified, poll_interval_sec
-        from rss_channels
-        where disabled=0 and inflight=0 and (next_poll_at is null or next_poll_at <= ?)
-        order by next_poll_at asc
-        limit ?
-        """,
-        (now, limit),
-    )
-    rows = cur.fetchall()
-    if not rows:
-        return []
-    ids = [r[0] for r in rows]
-    qmarks = ",".join("?" * len(ids))
-    cur.execute(f"update rss_channels set inflight=1 where channel_id in ({qmarks})", ids)
-    con.commit()
-    cols = ["channel_id", "etag", "last_modified", "poll_interval_sec"]
-    return [dict(zip(cols, r)) for r in rows]
+        create table if not exists rss_seed_state(
+          path text primary key,
+          inode integer,
+          offset integer,
+          updated_at text
+        )
+        """
+    )
+    key = os.path.abspath(ndjson_path)
+    row = con.execute("select inode, offset from rss_seed_state where path=?", (key,)).fetchone()
+    added = 0
+    with open(ndjson_path, "rb") as f:
+        st = os.fstat(f.fileno())
+        offset = 0
+        if row and row[0] == st.st_ino and (row[1] or 0) <= st.st_size:
+            offset = row[1] or 0
+        if offset == st.st_size and row:
+            return 0
+        f.seek(offset)
+        batch: Dict[str, None] = {}
 
+        def flush() -> None:
+            nonlocal added
+            added += _seed_insert(con, list(batch))
+            con.execute(
+                """
+                insert into rss_seed_state(path, inode, offset, updated_at) values(?,?,?,?)
+                on conflict(path) do update set inode=excluded.inode, offset=excluded.offset, updated_at=excluded.updated_at
+                """,
+                (key, st.st_ino, offset, _utciso()),
+            )
+            con.commit()
+            batch.clear()
 
-def upsert_video(
-    con: sqlite3.Connection,
-    vid: str,
-    cid: str,
-    title: Optional[str],
-    published_at: Optional[str],
-) -> bool:
-    thumb_hq = f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg"
-    thumb_max = f"https://i.ytimg.com/vi/{vid}/maxresdefault.jpg"
-    cur = con.cursor()
-    cur.execute(
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            try:
+                obj = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if not isinstance(obj, dict):
+                continue
+            url = obj.get("youtube_channel_url") or obj.get("channel_url") or obj.get("url")
+            if not url:
+                continue
+            ucid = extract_ucid_from_url(url)
+            if ucid:
+                batch[ucid] = None
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    return added
+
+
+def sync_watchlist(con: sqlite3.Connection) -> int:
+    """
+    rss_watchlist のチャンネルを priority 1 にそろえる（NDJSON に無ければ rss_channels に追加）。
+    追加した件数を返す。
+    """
+    con.execute(
+        """
+        create table if not exists rss_watchlist(
+          channel_id text primary key,
+          handle text,
+          title text,
+          added_at text
+        )
         """
-        insert or ignore into rss_videos(video_id, channel_id, title, published_at, thumb_hq, thumb_maxres)
-        values(?,?,?,?,?,?)
-        """,
-        (vid, cid, title, published_at, thumb_hq, thumb_max),
     )
-    inserted1 = cur.rowcount > 0
-    cur.execute(
+    cur = con.execute(
         """
-        insert or ignore into rss_videos_discovered(video_id, channel_id, title, published_at, discovered_at)
-        values(?,?,?,?,?)
+        insert or ignore into rss_channels(channel_id, failures, next_poll_at, poll_interval_sec, inflight, disabled, priority)
+        select channel_id, 0, ?, ?, 0, 0, 1 from rss_watchlist where channel_id like 'UC%'
         """,
-        (vid, cid, title, published_at, _utciso()),
+        (_utciso(), WATCH_MAX_INTERVAL_DEFAULT),
+    )
+    added = max(0, cur.rowcount)
+    con.execute(
+        "update rss_channels set priority=1 where priority=0 and channel_id in (select channel_id from rss_watchlist)"
+    )
+    con.execute(
+        "update rss_channels set priority=0 "
+        "where priority>0 and channel_id not in (select channel_id from rss_watchlist)"
     )
-    inserted2 = cur.rowcount > 0
     con.commit()
-    return inserted1 or inserted2
+    return added
 
 
-def finalize_channel(
+def reserve_due_channels(
     con: sqlite3.Connection,
-    cid: str,
-    next_iv: int,
-    http_status: Optional[int],
-    etag: Optional[str],
-    last_modified: Optional[str],
-    last_seen_published: Optional[str],
-    last_seen_video_id: Optional[str],
-) -> None:
-    cur = con.cursor()
-    next_at = (_utcnow() + timedelta(seconds=next_iv)).replace(microsecond=0).isoformat()
-    cur.execute(
-        """
-        update rss_channels
-        set etag=coalesce(?,etag),
-            last_modified=coalesce(?,last_modified),
-            last_checked_at=?,
-            last_success_at=case when ? between 200 and 299 or ?=304 then ? else last_success_at end,
-            last_http_status=?,
-            failures=case when ? between 200 and 299 or ?=304 then 0 else failures end,
-            last_seen_published=coalesce(?, last_seen_published),
-            last_seen_video_id=coalesce(?, last_seen_video_id),
-            next_poll_at=?,
-            poll_interval_sec=?,
-            inflight=0
-        where channel_id=?
-        """,
-        (
-            etag,
-            last_modified,
-            _utciso(),
-            http_status,
-            http_status,
-            _utciso(),
-            http_status,
-            http_status,
-            http_status,
-            last_seen_published,
-            last_seen_video_id,
-            next_at,
-            next_iv,
-            cid,
-        ),
-    )
+    limit: int,
+    owner: Optional[str] = None,
+    lease_sec: int = LEASE_SEC_DEFAULT,
+    shard: Tuple[int, int] = (0, 1),
+) -> List[Dict[str, Any]]:
+    """next_poll_at <= now かつ有効なリースが無いものを、期限付きリースで予約し取り出す
+
+    select と update を 1 つの書き込みトランザクション（begin immediate）で行うため、
+    複数プロセスが同じテーブルを共有しても同じチャンネルを二重に取らない。
+    watch レーン（priority>0）を先に取り、残りの枠を期限の古い順に埋める。
+    """
+    now = _utcnow()
+    now_iso = now.replace(microsecond=0).isoformat()
+    until = (now + timedelta(seconds=max(1, int(lease_sec)))).replace(microsecond=0).isoformat()
+    owner = owner or make_lease_owner()
+    shard_idx, nshards = shard
+    shard_sql = "and rss_shard(channel_id, ?) = ?" if nshards > 1 else ""
+    params: List[Any] = [now_iso, now_iso]
+    if nshards > 1:
+        params += [nshards, shard_idx]
     con.commit()
+    cur = con.cursor()
+    cur.execute("begin immediate")
+    try:
+        rows: List[tuple] = []
+        for lane_sql in ("and priority>0", "and priority=0"):
+            if len(rows) >= limit:
+                break
+            cur.execute(
+                f"""
+                select {", ".join(RESERVE_COLS)}
+                from rss_channels
+                where disabled=0
+                  and (lease_until is null or lease_until <= ?)
+                  and (next_poll_at is null or next_poll_at <= ?)
+                  {lane_sql}
+                  {shard_sql}
+                order by next_poll_at asc
+                limit ?
+                """,
+                (*params, limit - len(rows)),
+            )
+            rows += cur.fetchall()
+        if rows:
+            ids = [r[0] for r in rows]
+            qmarks = ",".join("?" * len(ids))
+            cur.execute(
+                f"update rss_channels set inflight=1, lease_owner=?, lease_until=? where channel_id in ({qmarks})",
+                [owner, until, *ids],
+            )
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    return [dict(zip(RESERVE_COLS, r)) for r in rows]
 
 
-def mark_error(con: sqlite3.Connection, cid: str, http_status: Optional[int], backoff: int) -> None:
-    cur = con.cursor()
-    next_at = (_utcnow() + timedelta(seconds=backoff)).replace(microsecond=0).isoformat()
-    cur.execute(
-        """
-        update rss_channels
-        set failures = coalesce(failures,0)+1,
-            last_checked_at=?,
-            last_http_status=?,
-            next_poll_at=?,
-            inflight=0
-        where channel_id=?
-        """,
-        (_utciso(), http_status, next_at, cid),
-    )
-    con.commit()
+def _iso_to_ts(s: Optional[str]) -> Optional[float]:
+    if not s:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(s).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class DbScheduler:
+    """従来方式: tick ごとに rss_channels を検索して予約する"""
+
+    def __init__(
+        self,
+        con: sqlite3.Connection,
+        owner: str,
+        lease_sec: int = LEASE_SEC_DEFAULT,
+        shard: Tuple[int, int] = (0, 1),
+    ):
+        self.con = con
+        self.owner = owner
+        self.lease_sec = lease_sec
+        self.shard = shard
+
+    def reserve(self, limit: int) -> List[Dict[str, Any]]:
+        return reserve_due_channels(self.con, limit, self.owner, self.lease_sec, self.shard)
+
+    def release(self, item: Dict[str, Any], delay_sec: int, clear: Tuple[str, ...] = (), **updates: Any) -> None:
+        # 次回時刻は FeedWriter が DB に書くので何もしない
+        pass
+
+    def drop(self, item: Dict[str, Any]) -> None:
+        # disabled=1 になれば予約の検索から外れる
+        pass
+
+    def refresh(self) -> int:
+        # 毎 tick DB を検索するので新規チャンネルも自然に拾われる
+        return 0
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class HeapScheduler:
+    """
+    メモリ上の min-heap でポーリング期限を管理するスケジューラ
+
+    起動時に rss_channels を 1 回だけ読み込み、以後は O(log n) で期限到来分を取り出す。
+    新しい next_poll_at は FeedWriter の finalize / error でまとめて永続化される。
+    起動時点で期限切れのチャンネル（停止中に溜まった分）は、
+    「超過時間 × 活動度」の大きい順に優先して消化する。
+    watch レーン（priority>0）は別の heap に入れ、期限が来ていれば常に先に取り出す。
+    取り出した分には db 方式と同じ期限付きリース（lease_until / lease_owner）を書き、
+    他のプロセス（別の heap / db 方式）が有効なリースを持つチャンネルはその期限まで heap に戻す。
+    """
+
+    def __init__(
+        self,
+        con: sqlite3.Connection,
+        shard: Tuple[int, int] = (0, 1),
+        owner: Optional[str] = None,
+        lease_sec: int = LEASE_SEC_DEFAULT,
+    ):
+        self.con = con
+        self.shard = shard
+        self.owner = owner or make_lease_owner()
+        self.lease_sec = lease_sec
+        self.leased_elsewhere = 0
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.heap: List[Tuple[float, str]] = []
+        self.watch_heap: List[Tuple[float, str]] = []
+        self.backlog: List[Tuple[float, str]] = []
+        self.inflight: set = set()
+        self.max_rowid = 0
+
+    @staticmethod
+    def _activity(last_seen_pub_iso: Optional[str], now_ts: float) -> float:
+        # 直近に投稿があるチャンネルほど 1 に近い（不明は 30 日相当）
+        ts = _iso_to_ts(last_seen_pub_iso)
+        age_h = (now_ts - ts) / 3600.0 if ts is not None else 30 * 24.0
+        return 1.0 / (1.0 + max(0.0, age_h) / 24.0)
+
+    def load(self) -> int:
+        now_ts = time.time()
+        self.items.clear()
+        self.heap.clear()
+        self.watch_heap.clear()
+        self.backlog.clear()
+        n = len(RESERVE_COLS)
+        cur = self.con.execute(
+            f"""
+            select {", ".join(RESERVE_COLS)}, next_poll_at, rowid
+            from rss_channels
+            where disabled=0
+            """
+        )
+        for r in cur:
+            self.max_rowid = max(self.max_rowid, r[n + 1])
+            it = dict(zip(RESERVE_COLS, r[:n]))
+            cid = it["channel_id"]
+            if self.shard[1] > 1 and shard_of(cid, self.shard[1]) != self.shard[0]:
+                continue
+            self.items[cid] = it
+            due_ts = _iso_to_ts(r[n]) or 0.0
+            if it.get("priority"):
+                self.watch_heap.append((due_ts, cid))
+            elif due_ts <= now_ts:
+                staleness = max(1.0, now_ts - due_ts) if due_ts else 30 * 86400.0
+                prio = staleness * self._activity(it["last_seen_published"], now_ts)
+                self.backlog.append((-prio, cid))
+            else:
+                self.heap.append((due_ts, cid))
+        heapq.heapify(self.backlog)
+        heapq.heapify(self.heap)
+        heapq.heapify(self.watch_heap)
+        return len(self.items)
+
+    def refresh(self) -> int:
+        """load 以降に追加されたチャンネル（rowid が増えた分）を取り込み、priority の変更を反映する"""
+        n = len(RESERVE_COLS)
+        cur = self.con.execute(
+            f"""
+            select {", ".join(RESERVE_COLS)}, next_poll_at, rowid
+            from rss_channels
+            where rowid > ? and disabled=0
+            order by rowid
+            """,
+            (self.max_rowid,),
+        )
+        added = 0
+        for r in cur:
+            self.max_rowid = max(self.max_rowid, r[n + 1])
+            it = dict(zip(RESERVE_COLS, r[:n]))
+            cid = it["channel_id"]
+            if cid in self.items or (self.shard[1] > 1 and shard_of(cid, self.shard[1]) != self.shard[0]):
+                continue
+            self.items[cid] = it
+            heapq.heappush(self.watch_heap if it.get("priority") else self.heap, (_iso_to_ts(r[n]) or 0.0, cid))
+            added += 1
+        # 再確認に戻された退役チャンネル（rowid は古いので別に拾う。部分インデックスの範囲のみ）
+        for r in self.con.execute(
+            f"""
+            select {", ".join(RESERVE_COLS)}, next_poll_at
+            from rss_channels
+            where retired_at is not null and disabled=0
+            """
+        ):
+            it = dict(zip(RESERVE_COLS, r[:n]))
+            cid = it["channel_id"]
+            if cid in self.items or (self.shard[1] > 1 and shard_of(cid, self.shard[1]) != self.shard[0]):
+                continue
+            self.items[cid] = it
+            heapq.heappush(self.watch_heap if it.get("priority") else self.heap, (_iso_to_ts(r[n]) or 0.0, cid))
+            added += 1
+        # priority の変更（rss_watchlist の増減）は次の release から別レーンの heap に入る
+        watch = {r[0] for r in self.con.execute("select channel_id from rss_channels where priority>0 and disabled=0")}
+        for cid, it in self.items.items():
+            if bool(it.get("priority")) != (cid in watch):
+                it["priority"] = 1 if cid in watch else 0
+        return added
+
+    def reserve(self, limit: int) -> List[Dict[str, Any]]:
+        now_ts = time.time()
+        out: List[Dict[str, Any]] = []
+        while self.watch_heap and len(out) < limit and self.watch_heap[0][0] <= now_ts:
+            _, cid = heapq.heappop(self.watch_heap)
+            self._take(cid, out)
+        while self.backlog and len(out) < limit:
+            _, cid = heapq.heappop(self.backlog)
+            self._take(cid, out)
+        while self.heap and len(out) < limit and self.heap[0][0] <= now_ts:
+            _, cid = heapq.heappop(self.heap)
+            self._take(cid, out)
+        return self._lease(out) if out else out
+
+    def _lease(self, out: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """取り出した分にリースを書く（begin immediate で確認と更新を 1 トランザクションに）"""
+        now = _utcnow()
+        now_iso = now.replace(microsecond=0).isoformat()
+        until = (now + timedelta(seconds=max(1, int(self.lease_sec)))).replace(microsecond=0).isoformat()
+        ids = [it["channel_id"] for it in out]
+        busy: Dict[str, str] = {}
+        self.con.commit()
+        cur = self.con.cursor()
+        cur.execute("begin immediate")
+        try:
+            for i in range(0, len(ids), 500):
+                part = ids[i : i + 500]
+                qmarks = ",".join("?" * len(part))
+                busy.update(
+                    cur.execute(
+                        f"""
+                        select channel_id, lease_until from rss_channels
+                        where channel_id in ({qmarks}) and lease_until > ? and lease_owner is not null and lease_owner != ?
+                        """,
+                        (*part, now_iso, self.owner),
+                    ).fetchall()
+                )
+                free = [c for c in part if c not in busy]
+                if free:
+                    cur.execute(
+                        f"update rss_channels set inflight=1, lease_owner=?, lease_until=? where channel_id in ({','.join('?' * len(free))})",
+                        (self.owner, until, *free),
+                    )
+            self.con.commit()
+        except BaseException:
+            self.con.rollback()
+            raise
+        if not busy:
+            return out
+        # 他のプロセスが巡回中: リースが切れるまで戻す（次回時刻はそのプロセスが DB に書く）
+        self.leased_elsewhere += len(busy)
+        kept = []
+        for it in out:
+            cid = it["channel_id"]
+            if cid not in busy:
+                kept.append(it)
+                continue
+            self.inflight.discard(cid)
+            heap = self.watch_heap if it.get("priority") else self.heap
+            heapq.heappush(heap, (_iso_to_ts(busy[cid]) or time.time() + self.lease_sec, cid))
+        return kept
+
+    def _take(self, cid: str, out: List[Dict[str, Any]]) -> None:
+        it = self.items.get(cid)
+        if it is None or cid in self.inflight:
+            return
+        self.inflight.add(cid)
+        out.append(dict(it))
+
+    def release(self, item: Dict[str, Any], delay_sec: int, clear: Tuple[str, ...] = (), **updates: Any) -> None:
+        """updates の None は「変更なし」。None に戻したい列は clear に渡す"""
+        cid = item["channel_id"]
+        self.inflight.discard(cid)
+        it = self.items.get(cid)
+        if it is None:
+            return
+        for k, v in updates.items():
+            if v is not None:
+                it[k] = v
+        for k in clear:
+            it[k] = None
+        heap = self.watch_heap if it.get("priority") else self.heap
+        heapq.heappush(heap, (time.time() + max(0, int(delay_sec)), cid))
+
+    def drop(self, item: Dict[str, Any]) -> None:
+        """退役したチャンネルを外す（再確認の時刻が来たら refresh で戻る）"""
+        cid = item["channel_id"]
+        self.inflight.discard(cid)
+        self.items.pop(cid, None)
+
+    def stats(self) -> Dict[str, int]:
+        now_ts = time.time()
+        due_watch = sum(1 for ts, _ in self.watch_heap if ts <= now_ts)
+        due = len(self.backlog) + due_watch + sum(1 for ts, _ in self.heap if ts <= now_ts)
+        return {
+            "channels": len(self.items),
+            "backlog": len(self.backlog),
+            "due": due,
+            "due_watch": due_watch,
+            "watch": len(self.watch_heap),
+            "inflight": len(self.inflight),
+            "leased_elsewhere": self.leased_elsewhere,
+        }
+
+
+def _set_future(loop: asyncio.AbstractEventLoop, fut: asyncio.Future, result: Any = None, exc: Optional[BaseException] = None) -> None:
+    def _apply() -> None:
+        if fut.done():
+            return
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+
+    try:
+        loop.call_soon_threadsafe(_apply)
+    except RuntimeError:
+        # ループ終了後は捨てる
+        pass
+
+
+class FeedWriter:
+    """
+    専用スレッドでのグループコミット書き込み
+
+    worker_loop からの書き込み要求（動画 upsert / チャンネル確定 / エラー記録）を
+    キューで受け取り、flush_ms ミリ秒ごと または max_ops 件ごとに 1 トランザクションへ
+    まとめて executemany で反映する。イベントループはディスク I/O で待たされない。
+    known_ids を渡すと、既知の動画 ID はメモリ上で判定して DB への問い合わせを省く（known_ids.py）。
+    新規かどうか（履歴の加算・パイプラインへの送信）は insert_video の結果で決める。
+    pipeline を渡すと、コミットした新規検出をそのまま videos.list のバッチャへ送る（api_pipeline.py）。
+    profiles / pushed（巡回側が引くメモリ上の写し）を渡すと、履歴を加算したチャンネルの投稿時間帯を
+    コミット後に更新し、全体も一定間隔で読み直す（イベントループ側は DB を引かない）。
+    """
+
+    def __init__(
+        self,
+        db: str,
+        flush_ms: int = 200,
+        max_ops: int = 2000,
+        owner: Optional[str] = None,
+        known_ids: Optional[KnownIds] = None,
+        pipeline: Optional[VideoBatcher] = None,
+        profiles: Optional[UploadProfiles] = None,
+        pushed: Optional[PushedChannels] = None,
+    ):
+        self.db = db
+        self.owner = owner
+        self.known = known_ids
+        self.pipeline = pipeline
+        self.profiles = profiles
+        self.pushed = pushed
+        self.flush_sec = max(1, int(flush_ms)) / 1000.0
+        self.max_ops = max(1, int(max_ops))
+        self.q: "queue.Queue[Optional[Tuple[str, tuple, Any]]]" = queue.Queue()
+        self.commits = 0
+        self.ops = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, name="rss-writer", daemon=True)
+
+    def start(self) -> None:
+        M_QUEUE.set_function(self.q.qsize, queue="writer")
+        if self.pipeline is not None:
+            M_QUEUE.set_function(self.pipeline.q.qsize, queue="pipeline")
+            self.pipeline.start()
+        self._thread.start()
+
+    def close(self) -> None:
+        """残りを書き切ってからスレッドを止める（パイプラインは書き込みの後に送り切る）"""
+        if self._thread.is_alive():
+            self.q.put(None)
+            self._thread.join()
+        if self.pipeline is not None:
+            self.pipeline.close()
+
+    def stats(self) -> Dict[str, int]:
+        out = {"commits": self.commits, "ops": self.ops, "errors": self.errors, "queue": self.q.qsize()}
+        if self.known is not None:
+            c = self.known.counts
+            out["id_cache_hits"] = c["hot"] + c["bloom_new"]
+            out["id_db_lookups"] = c["db_known"] + c["db_new"]
+        if self.pipeline is not None:
+            out.update({f"pipeline_{k}": v for k, v in self.pipeline.stats().items()})
+        return out
+
+    # --- producer 側（イベントループから呼ぶ） ---
+
+    def put_entries(self, cid: str, entries: List[Dict[str, Any]]) -> "asyncio.Future[bool]":
+        """動画を upsert。新規が 1 件でもあれば True で解決する Future を返す"""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.q.put(("entries", (cid, entries), (loop, fut)))
+        return fut
+
+    def put_finalize(
+        self,
+        cid: str,
+        next_iv: int,
+        http_status: Optional[int],
+        etag: Optional[str],
+        last_modified: Optional[str],
+        last_seen_published: Optional[str],
+        last_seen_video_id: Optional[str],
+        feed_fp: Optional[str] = None,
+        revived: bool = False,
+    ) -> None:
+        self.q.put(
+            (
+                "finalize",
+                (cid, next_iv, http_status, etag, last_modified, last_seen_published, last_seen_video_id, feed_fp, revived),
+                None,
+            )
+        )
+
+    def put_error(self, cid: str, http_status: Optional[int], backoff: int) -> None:
+        self.q.put(("error", (cid, http_status, backoff), None))
+
+    def put_retire(self, cid: str, http_status: int, revalidations: int, revalidate_sec: int, first: bool) -> None:
+        """disabled=1 にして revalidate_sec 秒後に再確認する（first=初めての退役）"""
+        self.q.put(("retire", (cid, http_status, revalidations, revalidate_sec, first), None))
+
+    # --- consumer 側（専用スレッド） ---
+
+    def _run(self) -> None:
+        con = sqlite3.connect(self.db, timeout=60)
+        con.execute("pragma journal_mode=WAL;")
+        con.execute("pragma synchronous=NORMAL;")
+        if self.known is not None and not self.known.warmed:
+            t0 = time.monotonic()
+            try:
+                hot = self.known.warm(con)
+                print(f"known ids: {self.known.bloom.count} rows into bloom, {hot} hot ({time.monotonic() - t0:.1f}s)")
+            except sqlite3.Error as e:
+                # 読み込みに失敗したらキャッシュなし（毎回 DB に問い合わせる）で続ける。スレッドを止めると put_entries が返らない
+                print(f"known ids: warm-up failed, continuing without the id cache: {e}")
+                self.known = None
+        next_reload = {"profiles": time.monotonic() + PROFILE_RELOAD_SEC, "pushed": time.monotonic() + PUSHED_RELOAD_SEC}
+        stop = False
+        while not stop:
+            self._reload(con, next_reload)
+            try:
+                op = self.q.get(timeout=max(0.1, min(next_reload.values()) - time.monotonic()))
+            except queue.Empty:
+                continue
+            if op is None:
+                break
+            batch = [op]
+            deadline = time.monotonic() + self.flush_sec
+            while len(batch) < self.max_ops:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                try:
+                    op = self.q.get(timeout=wait)
+                except queue.Empty:
+                    break
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+            self._flush(con, batch)
+        con.close()
+
+    def _reload(self, con: sqlite3.Connection, next_reload: Dict[str, float]) -> None:
+        now = time.monotonic()
+        for name, every in (("profiles", PROFILE_RELOAD_SEC), ("pushed", PUSHED_RELOAD_SEC)):
+            cache = getattr(self, name)
+            if cache is None or now < next_reload[name]:
+                continue
+            next_reload[name] = now + every
+            try:
+                cache.load(con)
+            except sqlite3.Error as e:
+                print(f"writer: reloading {name} failed: {e}")
+
+    def _flush(self, con: sqlite3.Connection, batch: List[Tuple[str, tuple, Any]]) -> None:
+        t0 = time.monotonic()
+        now = _utcnow()
+        now_iso = now.replace(microsecond=0).isoformat()
+        entry_ops = [op for op in batch if op[0] == "entries"]
+        results: List[bool] = []
+        try:
+            known_v, known_d = self._known_ids(con, entry_ops)
+            cur = con.cursor()
+            # 既知の判定は DB を省くためだけに使い、新規かどうかは挿入の結果で決める
+            # （WebSub の受信や他のシャードが先に入れた ID は insert or ignore が何もしない）
+            disc_rows, hist_rows = [], []
+            for _, (cid, entries), _ in entry_ops:
+                had_new = False
+                for ent in entries:
+                    vid = ent["video_id"]
+                    if vid in known_v and vid in known_d:
+                        continue
+                    title, pub = ent.get("title"), ent.get("published")
+                    new_v, new_d = insert_video(cur, vid, cid, title, pub, now_iso)
+                    known_v.add(vid)
+                    known_d.add(vid)
+                    if new_v and pub:
+                        hist_rows.append((cid, pub))
+                    if new_d:
+                        disc_rows.append((vid, cid, title, pub, now_iso))
+                    had_new = had_new or new_v or new_d
+                results.append(had_new)
+
+            # 自分のリースだけを解放する（期限切れ後に他プロセスが取った分は触らない）
+            own = (self.owner, self.owner, self.owner)
+            fin_rows, err_rows, retire_rows = [], [], []
+            lifecycle = {"lifecycle:retired": 0, "lifecycle:revived": 0}
+            for kind, args, _ in batch:
+                if kind == "finalize":
+                    cid, next_iv, st, etag, lm, lsp, lsv, fp, revived = args
+                    next_at = (now + timedelta(seconds=next_iv)).replace(microsecond=0).isoformat()
+                    ok = st is not None and (200 <= st <= 299 or st == 304)
+                    ok_flag = 1 if ok else 0
+                    fin_rows.append(
+                        (etag, lm, now_iso, now_iso if ok else None, st, *(ok_flag,) * 5, lsp, lsv, fp, next_at, next_iv, *own, cid)
+                    )
+                    lifecycle["lifecycle:revived"] += 1 if ok and revived else 0
+                elif kind == "error":
+                    cid, st, backoff = args
+                    next_at = (now + timedelta(seconds=backoff)).replace(microsecond=0).isoformat()
+                    err_rows.append((st, now_iso, st, next_at, *own, cid))
+                elif kind == "retire":
+                    cid, st, nrev, delay, first = args
+                    reval_at = (now + timedelta(seconds=delay)).replace(microsecond=0).isoformat()
+                    retire_rows.append((now_iso, st, now_iso, reval_at, nrev, *own, cid))
+                    lifecycle["lifecycle:retired"] += 1 if first else 0
+
+            if hist_rows:
+                cur.executemany(INCREMENT_SQL, hist_rows)
+            polled = [r[4] for r in fin_rows] + [r[0] for r in err_rows] + [r[1] for r in retire_rows]
+            if polled:
+                cur.executemany(POLL_UPSERT_SQL, poll_rows(polled))
+            life_rows = [(k, v) for k, v in lifecycle.items() if v]
+            if life_rows:
+                cur.executemany(POLL_UPSERT_SQL, life_rows)
+            if fin_rows:
+                cur.executemany(
+                    """
+                    update rss_channels
+                    set etag=coalesce(?,etag),
+                        last_modified=coalesce(?,last_modified),
+                        last_checked_at=?,
+                        last_success_at=coalesce(?, last_success_at),
+                        last_http_status=?,
+                        failures=case when ?=1 then 0 else failures end,
+                        gone_streak=case when ?=1 then 0 else gone_streak end,
+                        retired_at=case when ?=1 then null else retired_at end,
+                        revalidate_at=case when ?=1 then null else revalidate_at end,
+                        revalidations=case when ?=1 then 0 else revalidations end,
+                        last_seen_published=coalesce(?, last_seen_published),
+                        last_seen_video_id=coalesce(?, last_seen_video_id),
+                        feed_fp=coalesce(?, feed_fp),
+                        next_poll_at=?,
+                        poll_interval_sec=?,
+                        inflight=case when lease_owner is null or lease_owner=? then 0 else inflight end,
+                        lease_until=case when lease_owner=? then null else lease_until end,
+                        lease_owner=case when lease_owner=? then null else lease_owner end
+                    where channel_id=?
+                    """,
+                    fin_rows,
+                )
+            if err_rows:
+                cur.executemany(
+                    """
+                    update rss_channels
+                    set failures = coalesce(failures,0)+1,
+                        gone_streak = case when ? in (403, 404, 410) then coalesce(gone_streak,0)+1 else gone_streak end,
+                        last_checked_at=?,
+                        last_http_status=?,
+                        next_poll_at=?,
+                        inflight=case when lease_owner is null or lease_owner=? then 0 else inflight end,
+                        lease_until=case when lease_owner=? then null else lease_until end,
+                        lease_owner=case when lease_owner=? then null else lease_owner end
+                    where channel_id=?
+                    """,
+                    err_rows,
+                )
+            if retire_rows:
+                # 退役: 巡回対象から外し、revalidate_at に revalidate_retired で戻す
+                cur.executemany(
+                    """
+                    update rss_channels
+                    set failures = coalesce(failures,0)+1,
+                        gone_streak = coalesce(gone_streak,0)+1,
+                        last_checked_at=?,
+                        last_http_status=?,
+                        disabled=1,
+                        retired_at=coalesce(retired_at, ?),
+                        revalidate_at=?,
+                        revalidations=?,
+                        next_poll_at=null,
+                        inflight=case when lease_owner is null or lease_owner=? then 0 else inflight end,
+                        lease_until=case when lease_owner=? then null else lease_until end,
+                        lease_owner=case when lease_owner=? then null else lease_owner end
+                    where channel_id=?
+                    """,
+                    retire_rows,
+                )
+            con.commit()
+        except sqlite3.Error as e:
+            try:
+                con.rollback()
+            except sqlite3.Error:
+                pass
+            self.errors += 1
+            print(f"writer error: {e} (dropped {len(batch)} ops)")
+            for _, _, waiter in entry_ops:
+                _set_future(*waiter, exc=e)
+            return
+        self.commits += 1
+        self.ops += len(batch)
+        if self.known is not None and entry_ops:
+            # コミット後なので、このバッチの ID はすべて両テーブルに存在する
+            self.known.add_many({ent["video_id"] for _, (_, entries), _ in entry_ops for ent in entries})
+        if self.pipeline is not None and disc_rows:
+            self.pipeline.submit(disc_rows)
+        if self.profiles is not None and hist_rows:
+            try:
+                self.profiles.update(con, {r[0] for r in hist_rows})
+            except sqlite3.Error as e:
+                print(f"writer: updating upload profiles failed: {e}")
+        M_DB_COMMIT.observe(time.monotonic() - t0)
+        for kind in ("entries", "finalize", "error", "retire"):
+            n = sum(1 for op in batch if op[0] == kind)
+            if n:
+                M_DB_OPS.inc(n, kind=kind)
+        for (_, _, waiter), had_new in zip(entry_ops, results):
+            _set_future(*waiter, result=had_new)
+
+    def _known_ids(self, con: sqlite3.Connection, entry_ops: List[Tuple[str, tuple, Any]]) -> Tuple[set, set]:
+        ids = list({ent["video_id"] for _, (_, entries), _ in entry_ops for ent in entries})
+        known_v: set = set()
+        known_d: set = set()
+        if self.known is not None:
+            # キャッシュで既知と分かった ID と、Bloom が「無い」と言った ID は DB に問い合わせない
+            total = len(ids)
+            hit, ids = self.known.classify(ids)
+            known_v.update(hit)
+            known_d.update(hit)
+            M_KNOWN.inc(len(hit), result="hot")
+            M_KNOWN.inc(total - len(hit) - len(ids), result="bloom_new")
+        cur = con.cursor()
+        for i in range(0, len(ids), 500):
+            part = ids[i : i + 500]
+            qmarks = ",".join("?" * len(part))
+            known_v.update(r[0] for r in cur.execute(f"select video_id from rss_videos where video_id in ({qmarks})", part))
+            known_d.update(
+                r[0] for r in cur.execute(f"select video_id from rss_videos_discovered where video_id in ({qmarks})", part)
+            )
+        if self.known is not None and ids:
+            found = len((known_v | known_d).intersection(ids))
+            self.known.record_lookup(len(ids), found)
+            M_KNOWN.inc(found, result="db_known")
+            M_KNOWN.inc(len(ids) - found, result="db_new")
+        return known_v, known_d
 
 
 def compute_next_interval(
@@ -310,6 +1100,7 @@ def compute_next_interval(
     had_new: bool,
     failures: int,
     last_seen_pub_iso: Optional[str],
+    profile: Optional[Sequence[int]] = None,
 ) -> int:
     # 失敗時: 指数バックオフ（最大 6h）＋ジッタ
     if failures > 0:
@@ -329,18 +1120,25 @@ def compute_next_interval(
         )
     except Exception:
         return int((base_interval or 3600) * random.uniform(0.8, 1.2))
-    age = (_utcnow() - last_pub).total_seconds()
+    now = _utcnow()
+    age = (now - last_pub).total_seconds()
     if age < 24 * 3600:
-        return int(900 * random.uniform(0.8, 1.2))  # 15分
+        tier = 900  # 15分
     elif age < 7 * 24 * 3600:
-        return int(1800 * random.uniform(0.8, 1.2))  # 30分
+        tier = 1800  # 30分
     elif age < 30 * 24 * 3600:
-        return int(7200 * random.uniform(0.8, 1.2))  # 2時間
+        tier = 7200  # 2時間
     else:
-        return int(12 * 3600 * random.uniform(0.8, 1.2))  # 12時間
+        tier = 12 * 3600  # 12時間
+    # 投稿時刻の傾向があるチャンネルは、投稿時間帯の直後に寄せて巡回（休眠中は従来どおり）
+    if profile is not None and age < PROFILE_MAX_AGE_SEC:
+        iv = profile_interval(profile, now, tier)
+        if iv is not None:
+            return iv
+    return int(tier * random.uniform(0.8, 1.2))
 
 
-def parse_entries(text: str) -> List[Dict[str, Any]]:
+def parse_entries_feedparser(text: str) -> List[Dict[str, Any]]:
     f = feedparser.parse(text)
     entries = []
     for e in f.entries:
@@ -353,6 +1151,61 @@ def parse_entries(text: str) -> List[Dict[str, Any]]:
     return list(reversed(entries))
 
 
+def parse_entries(body: bytes | str, stop_at: Optional[str] = None) -> List[Dict[str, Any]]:
+    """YouTube フィード専用パーサで stop_at（前回の最新動画）より新しい分だけを返す。
+    壊れた XML などは feedparser（寛容パーサ）で全件パースにフォールバック。"""
+    try:
+        entries, _ = parse_feed(body, stop_at=stop_at)
+        return entries
+    except ParseError:
+        text = body.decode("utf-8", errors="replace") if isinstance(body, bytes) else body
+        return parse_entries_feedparser(text)
+
+
+def _parse_timed(body: bytes, stop_at: Optional[str]) -> Tuple[List[Dict[str, Any]], float]:
+    # プロセスプールでも計測できるよう、所要時間は戻り値で返す
+    t0 = time.perf_counter()
+    entries = parse_entries(body, stop_at)
+    return entries, time.perf_counter() - t0
+
+
+class ParsePool:
+    """
+    200 応答のパースを executor に逃がす（workers=0 ならイベントループ上でそのまま実行）
+
+    kind="process" は CPU を並列に使える（本文の受け渡しに pickle のコストがかかる）。
+    kind="thread" は GIL のため並列化はしないが、大きなフィードでイベントループが止まるのを防ぐ。
+    """
+
+    def __init__(self, workers: int = 0, kind: str = "thread"):
+        self.workers = max(0, int(workers))
+        self.kind = kind
+        self.inflight = 0
+        self.executor: Optional[Executor] = None
+        if self.workers and kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        elif self.workers:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rss-parse")
+
+    async def parse(self, body: bytes, stop_at: Optional[str] = None) -> List[Dict[str, Any]]:
+        if self.executor is None:
+            entries, sec = _parse_timed(body, stop_at)
+        else:
+            self.inflight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                entries, sec = await loop.run_in_executor(self.executor, _parse_timed, body, stop_at)
+            finally:
+                self.inflight -= 1
+        M_PARSE.observe(sec)
+        return entries
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
 class RateLimiter:
     """単純なトークンバケット（毎秒 RPS）"""
 
@@ -360,8 +1213,23 @@ class RateLimiter:
         self.rps = max(1.0, float(rps))
         self.tokens = self.rps
         self.last = time.monotonic()
+        self.last_cut = 0.0
         self.lock = asyncio.Lock()
 
+    def cut(self, factor: float, floor: float, cooldown: float) -> Optional[Tuple[float, float]]:
+        """rps を factor 倍に下げる（cooldown 秒以内の連続カットはしない）"""
+        now = time.monotonic()
+        if now - self.last_cut < cooldown:
+            return None
+        old = self.rps
+        self.rps = max(floor, old * factor)
+        self.tokens = min(self.tokens, self.rps)
+        self.last_cut = now
+        return old, self.rps
+
+    def probe(self, inc: float, ceiling: float) -> None:
+        self.rps = min(ceiling, self.rps + inc)
+
     async def acquire(self):
         async with self.lock:
             now = time.monotonic()
@@ -376,34 +1244,384 @@ class RateLimiter:
             self.last = time.monotonic()
 
 
+class SharedBudget:
+    """プロセス間で共有するトークンバケットの状態（親プロセスで作り子プロセスへ渡す）"""
+
+    def __init__(self, rps: float):
+        rps = max(1.0, float(rps))
+        self.rps = mp.Value("d", rps, lock=False)
+        self.tokens = mp.Value("d", rps, lock=False)
+        self.last = mp.Value("d", time.monotonic(), lock=False)
+        self.last_cut = mp.Value("d", 0.0, lock=False)
+        self.lock = mp.Lock()
+
+
+class SharedRateLimiter:
+    """SharedBudget を使うトークンバケット。全シャード合計で毎秒 rps を超えない"""
+
+    def __init__(self, budget: SharedBudget):
+        self.budget = budget
+
+    @property
+    def rps(self) -> float:
+        return self.budget.rps.value
+
+    def cut(self, factor: float, floor: float, cooldown: float) -> Optional[Tuple[float, float]]:
+        """全シャード共通の rps を下げる。同じ嵐を複数シャードが見ても cooldown 内は 1 回だけ"""
+        b = self.budget
+        with b.lock:
+            now = time.monotonic()
+            if now - b.last_cut.value < cooldown:
+                return None
+            old = b.rps.value
+            b.rps.value = max(floor, old * factor)
+            b.tokens.value = min(b.tokens.value, b.rps.value)
+            b.last_cut.value = now
+            return old, b.rps.value
+
+    def probe(self, inc: float, ceiling: float) -> None:
+        b = self.budget
+        with b.lock:
+            b.rps.value = min(ceiling, b.rps.value + inc)
+
+    def _try_take(self) -> float:
+        """取れたら 0、取れなければ次のトークンまでの待ち秒数"""
+        b = self.budget
+        with b.lock:
+            now = time.monotonic()
+            rps = b.rps.value
+            tokens = min(rps, b.tokens.value + (now - b.last.value) * rps)
+            b.last.value = now
+            if tokens >= 1.0:
+                b.tokens.value = tokens - 1.0
+                return 0.0
+            b.tokens.value = tokens
+            return (1.0 - tokens) / rps
+
+    async def acquire(self):
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class AimdLimiter:
+    """
+    AIMD（加算増・乗算減）で全体レートを自動調整するリミッタ
+
+    window_sec ごとに 429 / 5xx / 接続エラーの割合を見て、bad_ratio を超えたら
+    rps を beta 倍に下げ、問題が無ければ alpha ずつ上限（--rps）まで戻す。
+    窓の中のリクエストが min_samples 件に満たないうちは判断せず、窓を延ばして数え続ける。
+    429 が短時間に fast_cut 件たまったら窓の終わりを待たずに下げる。
+    max_concurrency を渡すと、観測レイテンシ × rps（Little の法則）から
+    同時リクエスト数の目標を決めてゲートする。
+    """
+
+    def __init__(
+        self,
+        base: "RateLimiter | SharedRateLimiter",
+        max_rps: float,
+        min_rps: float = 1.0,
+        alpha: float = 0.5,
+        beta: float = 0.5,
+        window_sec: float = 5.0,
+        bad_ratio: float = 0.02,
+        fast_cut: int = 5,
+        max_concurrency: Optional[int] = None,
+        nshards: int = 1,
+        min_samples: int = 20,
+    ):
+        self.base = base
+        self.max_rps = max(1.0, float(max_rps))
+        self.min_rps = max(0.1, min(float(min_rps), self.max_rps))
+        # シャード数ぶん並行で加算されるので 1 シャードあたりは alpha/N
+        self.alpha = alpha / max(1, nshards)
+        self.beta = beta
+        self.window_sec = window_sec
+        self.bad_ratio = bad_ratio
+        self.fast_cut = fast_cut
+        self.min_samples = max(1, int(min_samples))
+        self.max_concurrency = max_concurrency
+        self.target_concurrency = max_concurrency
+        self.inflight = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self.latency_ewma: Optional[float] = None
+        self.observed_rps = 0.0
+        self.events: "deque[Dict[str, Any]]" = deque(maxlen=20)
+        self._reset_window(time.monotonic())
+
+    @property
+    def rps(self) -> float:
+        return self.base.rps
+
+    def _reset_window(self, now: float) -> None:
+        self.win_start = now
+        self.win_total = 0
+        self.win_bad = 0
+
+    async def acquire(self):
+        if self.target_concurrency:
+            while self.inflight >= self.target_concurrency:
+                fut = asyncio.get_running_loop().create_future()
+                self._waiters.append(fut)
+                try:
+                    await fut
+                except asyncio.CancelledError:
+                    # 起こされた直後に取り消されたら、空いた枠を次の待ち手に回す
+                    if fut.done() and not fut.cancelled():
+                        self._wake()
+                    raise
+        self.inflight += 1
+        try:
+            await self.base.acquire()
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self) -> None:
+        """acquire した枠を返す（fetch_feed が finally で必ず呼ぶ。取り消されたタスクの分もここで戻る）"""
+        self.inflight = max(0, self.inflight - 1)
+        self._wake()
+
+    def _wake(self) -> None:
+        free = (self.target_concurrency or 0) - self.inflight
+        while self._waiters and free > 0:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+    def observe(self, status: int, latency: Optional[float]) -> None:
+        """1 リクエストの結果を記録（枠の返却は release）"""
+        self.win_total += 1
+        if status == 0 or status == 429 or status >= 500:
+            self.win_bad += 1
+        if latency is not None and status:
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        now = time.monotonic()
+        elapsed = now - self.win_start
+        if (elapsed >= self.window_sec and self.win_total >= self.min_samples) or self.win_bad >= self.fast_cut:
+            self._evaluate(now, elapsed)
+
+    def _evaluate(self, now: float, elapsed: float) -> None:
+        total, bad = self.win_total, self.win_bad
+        self.observed_rps = total / elapsed if elapsed > 0 else 0.0
+        if bad and bad / max(1, total) >= self.bad_ratio:
+            cut = self.base.cut(self.beta, self.min_rps, self.window_sec)
+            if cut:
+                self.events.append(
+                    {"at": _utciso(), "from_rps": round(cut[0], 2), "to_rps": round(cut[1], 2), "bad": bad, "total": total}
+                )
+        elif elapsed >= self.window_sec and self.base.rps < self.max_rps:
+            self.base.probe(self.alpha, self.max_rps)
+        if self.max_concurrency and self.latency_ewma:
+            need = math.ceil(self.base.rps * self.latency_ewma * 2.0)
+            self.target_concurrency = max(4, min(self.max_concurrency, need))
+        self._reset_window(now)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "effective_rps": round(self.base.rps, 2),
+            "observed_rps": round(self.observed_rps, 2),
+            "max_rps": self.max_rps,
+            "min_rps": self.min_rps,
+            "inflight": self.inflight,
+            "target_concurrency": self.target_concurrency,
+            "latency_ms": round(self.latency_ewma * 1000) if self.latency_ewma else None,
+            "backoff_events": list(self.events),
+        }
+
+
+class LaneLimiter:
+    """
+    優先レーン付きのリミッタ（watch = rss_watchlist のチャンネル、bulk = それ以外）
+
+    下位のリミッタ（AIMD / 共有バケット）からトークンを 1 つずつ取り、待っているレーンに配る。
+    両レーンに待ちがあるときは、直近の配分で watch が share 未満なら watch に、そうでなければ bulk に渡す。
+    片方しか待っていなければそのレーンがすべて使う（watch は share を保証、残りは bulk がベストエフォートで使う）。
+    rps / observe / cut などは下位のリミッタへ委譲する。
+    """
+
+    LANES = ("watch", "bulk")
+
+    def __init__(self, base: "RateLimiter | SharedRateLimiter | AimdLimiter", share: float = WATCH_SHARE_DEFAULT, halflife: float = 10.0):
+        self.base = base
+        self.share = min(1.0, max(0.0, float(share)))
+        self.halflife = halflife
+        self.waiting: Dict[str, "deque[asyncio.Future]"] = {lane: deque() for lane in self.LANES}
+        self.granted: Dict[str, float] = {lane: 0.0 for lane in self.LANES}
+        self.total: Dict[str, int] = {lane: 0 for lane in self.LANES}
+        self._decay_at = time.monotonic()
+        self._pump: Optional["asyncio.Task[None]"] = None
+        self._spare = False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.base, name)
+
+    async def acquire(self, lane: str = "bulk") -> None:
+        t0 = time.monotonic()
+        if self._spare:
+            self._spare = False
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            self.waiting[lane].append(fut)
+            if self._pump is None or self._pump.done():
+                self._pump = asyncio.create_task(self._run())
+            try:
+                await fut
+            except asyncio.CancelledError:
+                # トークンを渡された直後に取り消された: 使わなかったトークンは次の acquire に回す
+                if fut.done() and not fut.cancelled():
+                    self._spare = True
+                raise
+        self._count(lane)
+        M_LANE_WAIT.observe(time.monotonic() - t0, lane=lane)
+
+    async def _run(self) -> None:
+        while self._pick() is not None:
+            await self.base.acquire()
+            lane = self._pick()
+            if lane is None:
+                # 待ち手がキャンセルされた: 取ったトークンは次の acquire に回す
+                self._spare = True
+                return
+            self.waiting[lane].popleft().set_result(None)
+
+    def _pick(self) -> Optional[str]:
+        for q in self.waiting.values():
+            while q and q[0].done():
+                q.popleft()
+        w, b = bool(self.waiting["watch"]), bool(self.waiting["bulk"])
+        if w and b:
+            self._decay()
+            total = self.granted["watch"] + self.granted["bulk"]
+            return "watch" if total <= 0 or self.granted["watch"] / total < self.share else "bulk"
+        return "watch" if w else ("bulk" if b else None)
+
+    def _decay(self) -> None:
+        now = time.monotonic()
+        f = 0.5 ** ((now - self._decay_at) / self.halflife)
+        self._decay_at = now
+        for lane in self.LANES:
+            self.granted[lane] *= f
+
+    def _count(self, lane: str) -> None:
+        self._decay()
+        self.granted[lane] += 1.0
+        self.total[lane] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        base = self.base.stats() if hasattr(self.base, "stats") else {"effective_rps": round(self.base.rps, 2)}
+        total = self.granted["watch"] + self.granted["bulk"]
+        base["lanes"] = {
+            "watch_share": self.share,
+            "watch_recent": round(self.granted["watch"] / total, 3) if total else None,
+            "requests": dict(self.total),
+            "waiting": {lane: len(q) for lane, q in self.waiting.items()},
+        }
+        return base
+
+
+class LaneQueue(asyncio.Queue):
+    """watch レーンの item を先に取り出すタスクキュー（終了の合図 None は常に最後）"""
+
+    def _init(self, maxsize: int) -> None:
+        self._queue = _Lanes()
+
+    def _put(self, item: Any) -> None:
+        self._queue.put(item)
+
+    def _get(self) -> Any:
+        return self._queue.get()
+
+
+class _Lanes:
+    def __init__(self):
+        self.watch: "deque[Any]" = deque()
+        self.bulk: "deque[Any]" = deque()
+        self.stop: "deque[Any]" = deque()
+
+    def __len__(self) -> int:
+        return len(self.watch) + len(self.bulk) + len(self.stop)
+
+    def put(self, item: Any) -> None:
+        if item is None:
+            self.stop.append(item)
+        elif item.get("priority"):
+            self.watch.append(item)
+        else:
+            self.bulk.append(item)
+
+    def get(self) -> Any:
+        for q in (self.watch, self.bulk, self.stop):
+            if q:
+                return q.popleft()
+        raise IndexError("empty")
+
+
 async def fetch_feed(
     client: httpx.AsyncClient,
-    limiter: RateLimiter,
+    limiter: "RateLimiter | SharedRateLimiter | AimdLimiter | LaneLimiter",
     cid: str,
     etag: Optional[str],
     last_modified: Optional[str],
+    feed_url: str = FEED_URL_DEFAULT,
+    lane: Optional[str] = None,
 ) -> Tuple[int, Optional[httpx.Response]]:
-    await limiter.acquire()
-    url = f"https://www.youtube.com/feeds/videos.xml?channel_id={cid}"
+    t_wait = time.monotonic()
+    if lane is not None and isinstance(limiter, LaneLimiter):
+        await limiter.acquire(lane)
+    else:
+        await limiter.acquire()
+    M_LIMITER_WAIT.observe(time.monotonic() - t_wait)
+    url = f"{feed_url}?channel_id={cid}"
     headers = dict(HEADERS_BASE)
     if etag:
         headers["If-None-Match"] = etag
     if last_modified:
         headers["If-Modified-Since"] = last_modified
+    observe = getattr(limiter, "observe", None)
+    release = getattr(limiter, "release", None)
+    status, t0 = 0, time.monotonic()
+    cancelled = False
     try:
         r = await client.get(url, headers=headers, timeout=20.0)
-        return r.status_code, r
+        status = r.status_code
+        return status, r
     except httpx.HTTPError:
         return 0, None
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
+    finally:
+        elapsed = time.monotonic() - t0
+        if release is not None:
+            release()
+        # 取り消し（停止時）は接続エラーとして数えない
+        if not cancelled:
+            M_REQUESTS.inc(status=str(status))
+            M_FETCH.observe(elapsed)
+            if observe is not None:
+                observe(status, elapsed)
 
 
 async def worker_loop(
     client: httpx.AsyncClient,
-    limiter: RateLimiter,
-    con: sqlite3.Connection,
+    limiter: "RateLimiter | SharedRateLimiter | AimdLimiter",
+    writer: FeedWriter,
+    sched: "DbScheduler | HeapScheduler",
     taskq: asyncio.Queue,
     stats: Dict[str, int],
+    profiles: Optional[UploadProfiles] = None,
+    parser: Optional[ParsePool] = None,
+    feed_url: str = FEED_URL_DEFAULT,
+    pushed: Optional[PushedChannels] = None,
+    watch_max_interval: int = WATCH_MAX_INTERVAL_DEFAULT,
+    retire_after: int = RETIRE_AFTER_DEFAULT,
+    revalidate_days: float = REVALIDATE_DAYS_DEFAULT,
 ):
+    parser = parser or ParsePool()
     while True:
         item = await taskq.get()
         if item is None:
@@ -413,144 +1631,578 @@ async def worker_loop(
         etag = item.get("etag")
         last_mod = item.get("last_modified")
         base_iv = item.get("poll_interval_sec") or 3600
+        profile = profiles.get(cid) if profiles is not None else None
+        # WebSub のリースが有効なチャンネルは取りこぼし対策としてだけ巡回する
+        push_floor = pushed.floor(cid) if pushed is not None else None
+        # watch レーンは巡回間隔に上限を設ける（プッシュ購読中でも上限が優先）
+        lane = "watch" if item.get("priority") else "bulk"
+        iv_cap = watch_max_interval if lane == "watch" and watch_max_interval > 0 else None
 
-        status, resp = await fetch_feed(client, limiter, cid, etag, last_mod)
+        status, resp = await fetch_feed(client, limiter, cid, etag, last_mod, feed_url, lane)
+        # 再確認中の退役チャンネルが応答したら復帰（retired_at などを戻す）
+        revived = bool(item.get("retired_at")) and (status == 304 or (status == 200 and resp is not None))
+        if revived:
+            stats["revived"] += 1
+        alive = {"gone_streak": 0, "revalidations": 0, "clear": ("retired_at",) if revived else ()}
         if status == 304:
             stats["not_modified"] += 1
-            cur = con.cursor()
-            cur.execute(
-                "select failures, last_seen_published from rss_channels where channel_id=?",
-                (cid,),
-            )
-            row = cur.fetchone() or [0, None]
-            next_iv = compute_next_interval(base_iv, False, 0, row[1])
-            finalize_channel(
-                con,
-                cid,
-                next_iv,
-                304,
-                resp.headers.get("ETag") if resp is not None else None,
-                resp.headers.get("Last-Modified") if resp is not None else None,
-                None,
-                None,
-            )
+            next_iv = max(compute_next_interval(base_iv, False, 0, item.get("last_seen_published"), profile), push_floor or 0)
+            next_iv = min(next_iv, iv_cap or next_iv)
+            new_etag = resp.headers.get("ETag") if resp is not None else None
+            new_lm = resp.headers.get("Last-Modified") if resp is not None else None
+            writer.put_finalize(cid, next_iv, 304, new_etag, new_lm, None, None, revived=revived)
+            sched.release(item, next_iv, etag=new_etag, last_modified=new_lm, poll_interval_sec=next_iv, failures=0, **alive)
         elif status == 200 and resp is not None:
             stats["ok"] += 1
-            entries = parse_entries(resp.text)
-            had_new = False
-            last_seen_vid, last_seen_pub = None, None
-            for ent in entries:
-                v = ent["video_id"]
-                p = ent.get("published")
-                t = ent.get("title")
-                if upsert_video(con, v, cid, t, p):
-                    had_new = True
-                last_seen_vid, last_seen_pub = v, p
-            next_iv = compute_next_interval(base_iv, had_new, 0, last_seen_pub)
-            finalize_channel(
-                con,
-                cid,
+            new_etag, new_lm = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+            fp = feed_fingerprint(resp.content)
+            if fp is not None and fp == item.get("feed_fp"):
+                # 中身が前回と同じ 200（ETag 等が不安定なケース）: 304 と同じ扱いで間隔更新のみ
+                stats["unchanged"] += 1
+                next_iv = max(compute_next_interval(base_iv, False, 0, item.get("last_seen_published"), profile), push_floor or 0)
+                next_iv = min(next_iv, iv_cap or next_iv)
+                writer.put_finalize(cid, next_iv, 200, new_etag, new_lm, None, None, revived=revived)
+                sched.release(item, next_iv, etag=new_etag, last_modified=new_lm, poll_interval_sec=next_iv, failures=0, **alive)
+                taskq.task_done()
+                continue
+            entries = await parser.parse(resp.content, item.get("last_seen_video_id"))
+            last_seen_vid, last_seen_pub = None, item.get("last_seen_published")
+            if entries:
+                last_seen_vid, last_seen_pub = entries[-1]["video_id"], entries[-1].get("published")
+            try:
+                had_new = await writer.put_entries(cid, entries) if entries else False
+            except sqlite3.Error:
+                stats["error"] += 1
+                backoff = compute_next_interval(3600, False, 1, None)
+                writer.put_error(cid, status, backoff=backoff)
+                sched.release(item, backoff, failures=(item.get("failures") or 0) + 1)
+                taskq.task_done()
+                continue
+            next_iv = max(compute_next_interval(base_iv, had_new, 0, last_seen_pub, profile), push_floor or 0)
+            next_iv = min(next_iv, iv_cap or next_iv)
+            writer.put_finalize(cid, next_iv, 200, new_etag, new_lm, last_seen_pub, last_seen_vid, fp, revived=revived)
+            sched.release(
+                item,
                 next_iv,
-                200,
-                resp.headers.get("ETag"),
-                resp.headers.get("Last-Modified"),
-                last_seen_pub,
-                last_seen_vid,
+                etag=new_etag,
+                last_modified=new_lm,
+                poll_interval_sec=next_iv,
+                failures=0,
+                last_seen_published=last_seen_pub,
+                last_seen_video_id=last_seen_vid,
+                feed_fp=fp,
+                **alive,
             )
             if had_new:
                 stats["new_videos"] += 1
-        elif status in (403, 404, 410):
-            stats["gone"] += 1
-            mark_error(con, cid, status, backoff=24 * 3600)
-        elif status == 429:
-            stats["blocked"] += 1
-            mark_error(con, cid, status, backoff=int(15 * 60 * random.uniform(0.8, 1.2)))
         else:
-            stats["error"] += 1
-            cur = con.cursor()
-            cur.execute("select failures from rss_channels where channel_id=?", (cid,))
-            fails = (cur.fetchone() or [0])[0] or 0
-            backoff = compute_next_interval(3600, False, fails + 1, None)
-            mark_error(con, cid, status, backoff=backoff)
+            if status in GONE_STATUSES:
+                stats["gone"] += 1
+                streak = (item.get("gone_streak") or 0) + 1
+                if retire_after > 0 and streak >= retire_after:
+                    # K 回連続で消えている: 退役させ、再確認の間隔は退役のたびに倍にする
+                    first = not item.get("retired_at")
+                    nrev = 0 if first else (item.get("revalidations") or 0) + 1
+                    stats["retired"] += 1 if first else 0
+                    writer.put_retire(cid, status, nrev, revalidate_after(nrev, revalidate_days), first)
+                    sched.drop(item)
+                    taskq.task_done()
+                    continue
+                backoff = 24 * 3600
+                writer.put_error(cid, status, backoff=backoff)
+                sched.release(item, backoff, failures=(item.get("failures") or 0) + 1, gone_streak=streak)
+                taskq.task_done()
+                continue
+            elif status == 429:
+                stats["blocked"] += 1
+                backoff = int(15 * 60 * random.uniform(0.8, 1.2))
+            else:
+                stats["error"] += 1
+                fails = item.get("failures") or 0
+                backoff = compute_next_interval(3600, False, fails + 1, None)
+            writer.put_error(cid, status, backoff=backoff)
+            sched.release(item, backoff, failures=(item.get("failures") or 0) + 1)
         taskq.task_done()
 
 
-def write_progress(con: sqlite3.Connection, last_stats: Dict[str, int]) -> None:
+def write_progress(
+    con: sqlite3.Connection,
+    last_stats: Dict[str, int],
+    writer: Optional[FeedWriter] = None,
+    sched: "Optional[DbScheduler | HeapScheduler]" = None,
+    extra: Optional[Dict[str, Any]] = None,
+    limiter: "Optional[RateLimiter | SharedRateLimiter | AimdLimiter]" = None,
+) -> None:
     os.makedirs(os.path.dirname(PROGRESS_JSON) or ".", exist_ok=True)
-    cur = con.cursor()
-    cur.execute("select count(*) from rss_channels")
-    total = cur.fetchone()[0]
-    cur.execute("select count(*) from rss_videos_discovered")
-    discovered = cur.fetchone()[0]
-    cur.execute("select count(*) from rss_videos")
-    videos = cur.fetchone()[0]
-    cur.execute("select count(*) from rss_channels where inflight=0 and (next_poll_at <= ?)", (_utciso(),))
-    due = cur.fetchone()[0]
+    # 行数はトリガで維持している stats_counters から読む（全件 count(*) はしない）
+    total = _row_count(con, "rss_channels")
+    discovered = _row_count(con, "rss_videos_discovered")
+    videos = _row_count(con, "rss_videos")
+    sched_stats = sched.stats() if sched is not None else {}
+    if "due" in sched_stats:
+        due = sched_stats["due"]
+    else:
+        # 部分インデックス idx_rss_channels_due の範囲走査のみ（予約中も含む）
+        due = con.execute(
+            "select count(*) from rss_channels where disabled=0 and next_poll_at <= ?", (_utciso(),)
+        ).fetchone()[0]
+    M_OVERDUE.set(due)
     data = {
         "updated_at": _utciso(),
         "total_channels": total,
         "due_now": due,
         "videos_table_count": videos,
         "discovered_queue_count": discovered,
+        "discovered_last_hour": hourly_since(con, "discovered", 1),
+        "poll_status": get_counters(con, "poll:"),
+        "lifecycle": lifecycle_stats(con),
         "last_batch": last_stats,
     }
+    # API クォータ（台帳が無い DB では空）。キー別の内訳は quota-report / /quota.json で
+    quota = quota_report(con)
+    if quota:
+        data["quota"] = {k: v for k, v in quota.items() if k != "keys"}
+    if writer is not None:
+        data["writer"] = writer.stats()
+    if sched_stats:
+        data["scheduler"] = sched_stats
+    if limiter is not None:
+        data["rate"] = limiter.stats() if hasattr(limiter, "stats") else {"effective_rps": round(limiter.rps, 2)}
+    if extra:
+        data.update(extra)
     with open(PROGRESS_JSON, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
+def lifecycle_stats(con: sqlite3.Connection) -> Dict[str, int]:
+    """退役・復帰の累計（stats_counters）と、現在の退役中 / 再確認待ちの件数（部分インデックスの範囲のみ）"""
+    life = get_counters(con, "lifecycle:")
+    retired_now, revalidating = con.execute(
+        "select coalesce(sum(disabled=1), 0), coalesce(sum(disabled=0), 0) from rss_channels where retired_at is not null"
+    ).fetchone()
+    return {
+        "retired_total": life.get("retired", 0),
+        "revived_total": life.get("revived", 0),
+        "retired_now": retired_now,
+        "revalidating": revalidating,
+    }
+
+
+def _row_count(con: sqlite3.Connection, table: str) -> int:
+    n = row_count(con, table)
+    if n is None:
+        n = con.execute(f"select count(*) from {table}").fetchone()[0]
+    return n
+
+
+def make_scheduler(
+    con: sqlite3.Connection,
+    mode: str,
+    owner: str,
+    lease_sec: int = LEASE_SEC_DEFAULT,
+    shard: Tuple[int, int] = (0, 1),
+) -> "DbScheduler | HeapScheduler":
+    n = reclaim_leases(con)
+    if n:
+        print(f"reclaimed {n} expired/stale leases")
+    if mode == "heap":
+        sched = HeapScheduler(con, shard, owner, lease_sec)
+        n = sched.load()
+        print(f"heap scheduler: loaded {n} channels (backlog={len(sched.backlog)})")
+        return sched
+    return DbScheduler(con, owner, lease_sec, shard)
+
+
+def _new_stats() -> Dict[str, int]:
+    return {
+        "ok": 0, "not_modified": 0, "unchanged": 0, "new_videos": 0, "blocked": 0, "gone": 0, "error": 0,
+        "retired": 0, "revived": 0,
+    }
+
+
+def _snapshot(
+    stats: Dict[str, int],
+    writer: FeedWriter,
+    sched: "DbScheduler | HeapScheduler",
+    limiter: "RateLimiter | SharedRateLimiter | AimdLimiter",
+) -> Dict[str, Any]:
+    rate = limiter.stats() if hasattr(limiter, "stats") else {"effective_rps": round(limiter.rps, 2)}
+    sched_stats = sched.stats()
+    if "due" in sched_stats:
+        M_OVERDUE.set(sched_stats["due"])
+    return {"last_batch": dict(stats), "writer": writer.stats(), "scheduler": sched_stats, "rate": rate}
+
+
+def _revalidate(con: sqlite3.Connection) -> None:
+    n = revalidate_retired(con)
+    if n:
+        print(f"revalidate: {n} retired channels due for a recheck")
+
+
+def _load_poll_hints(
+    con: sqlite3.Connection, writer: FeedWriter, upload_profile: bool, push_poll_sec: int
+) -> Tuple[Optional[UploadProfiles], Optional[PushedChannels]]:
+    """投稿時間帯とプッシュ購読を一括で読み込む（以後の更新は書き込みスレッド。巡回側は辞書を引くだけ）"""
+    profiles = UploadProfiles() if upload_profile else None
+    pushed = PushedChannels(push_poll_sec) if push_poll_sec > 0 else None
+    if profiles is not None:
+        profiles.load(con)
+    if pushed is not None:
+        pushed.load(con)
+    writer.profiles, writer.pushed = profiles, pushed
+    return profiles, pushed
+
+
+def make_limiter(
+    rps: float,
+    concurrency: int,
+    base: "Optional[RateLimiter | SharedRateLimiter]" = None,
+    aimd: bool = True,
+    min_rps: float = 1.0,
+    adaptive_workers: bool = False,
+    nshards: int = 1,
+) -> "RateLimiter | SharedRateLimiter | AimdLimiter":
+    base = base or RateLimiter(rps)
+    if not aimd:
+        return base
+    return AimdLimiter(
+        base,
+        max_rps=rps,
+        min_rps=min_rps,
+        max_concurrency=concurrency if adaptive_workers else None,
+        nshards=nshards,
+    )
+
+
 async def run_once(
     con: sqlite3.Connection,
-    channels_file: str,
+    writer: FeedWriter,
+    channels_file: Optional[str],
     concurrency: int,
     rps: float,
     limit: int,
+    scheduler: str = "db",
+    lease_sec: int = LEASE_SEC_DEFAULT,
+    *,
+    limiter: "Optional[RateLimiter | SharedRateLimiter]" = None,
+    shard: Tuple[int, int] = (0, 1),
+    report: Optional[Callable[[Dict[str, Any]], None]] = None,
+    aimd: bool = True,
+    min_rps: float = 1.0,
+    adaptive_workers: bool = False,
+    upload_profile: bool = True,
+    parse_workers: int = 0,
+    parse_pool: str = "thread",
+    feed_url: str = FEED_URL_DEFAULT,
+    push_poll_sec: int = PUSH_POLL_SEC_DEFAULT,
+    watch_share: float = WATCH_SHARE_DEFAULT,
+    watch_max_interval: int = WATCH_MAX_INTERVAL_DEFAULT,
+    retire_after: int = RETIRE_AFTER_DEFAULT,
+    revalidate_days: float = REVALIDATE_DAYS_DEFAULT,
 ):
-    seed_channels(con, channels_file)
-    due = reserve_due_channels(con, limit or concurrency * 4)
-    stats = {"ok": 0, "not_modified": 0, "new_videos": 0, "blocked": 0, "gone": 0, "error": 0}
+    if channels_file:
+        seed_channels(con, channels_file)
+        sync_watchlist(con)
+        _revalidate(con)
+    writer.owner = writer.owner or make_lease_owner()
+    sched = make_scheduler(con, scheduler, writer.owner, lease_sec, shard)
+    due = sched.reserve(limit or concurrency * 4)
+    stats = _new_stats()
     limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
-    limiter = RateLimiter(rps)
-    async with httpx.AsyncClient(http2=True, headers=HEADERS_BASE, limits=limits, timeout=20.0) as client:
-        q: asyncio.Queue = asyncio.Queue()
-        workers = [asyncio.create_task(worker_loop(client, limiter, con, q, stats)) for _ in range(concurrency)]
-        for it in due:
-            await q.put(it)
-        for _ in range(concurrency):
-            await q.put(None)
-        await q.join()
-        for w in workers:
-            await w
-    write_progress(con, stats)
+    limiter = make_limiter(rps, concurrency, limiter, aimd, min_rps, adaptive_workers, shard[1])
+    if watch_share > 0:
+        # 起動時にウォッチリストが空でも包んでおく（後から同期されたチャンネルにも配分を保証する。空なら素通し）
+        limiter = LaneLimiter(limiter, watch_share)
+    profiles, pushed = _load_poll_hints(con, writer, upload_profile, push_poll_sec)
+    M_RPS.set_function(lambda: limiter.rps)
+    parser = ParsePool(parse_workers, parse_pool)
+    M_QUEUE.set_function(lambda: parser.inflight, queue="parse")
+    writer.start()
+    try:
+        async with httpx.AsyncClient(http2=True, headers=HEADERS_BASE, limits=limits, timeout=20.0) as client:
+            q: asyncio.Queue = LaneQueue()
+            M_QUEUE.set_function(q.qsize, queue="tasks")
+            workers = [
+                asyncio.create_task(
+                    worker_loop(
+                        client, limiter, writer, sched, q, stats, profiles, parser, feed_url, pushed, watch_max_interval,
+                        retire_after, revalidate_days,
+                    )
+                )
+                for _ in range(concurrency)
+            ]
+            for it in due:
+                await q.put(it)
+            for _ in range(concurrency):
+                await q.put(None)
+            await q.join()
+            for w in workers:
+                await w
+    finally:
+        parser.close()
+        writer.close()
+    if report is not None:
+        report(_snapshot(stats, writer, sched, limiter))
+    else:
+        write_progress(con, stats, writer, sched, limiter=limiter)
 
 
 async def run_daemon(
     con: sqlite3.Connection,
-    channels_file: str,
+    writer: FeedWriter,
+    channels_file: Optional[str],
     concurrency: int,
     rps: float,
     batch_size: int,
     tick_sec: int,
+    scheduler: str = "db",
+    lease_sec: int = LEASE_SEC_DEFAULT,
+    *,
+    limiter: "Optional[RateLimiter | SharedRateLimiter]" = None,
+    shard: Tuple[int, int] = (0, 1),
+    report: Optional[Callable[[Dict[str, Any]], None]] = None,
+    aimd: bool = True,
+    min_rps: float = 1.0,
+    adaptive_workers: bool = False,
+    upload_profile: bool = True,
+    seed_interval: int = SEED_INTERVAL_DEFAULT,
+    parse_workers: int = 0,
+    parse_pool: str = "thread",
+    feed_url: str = FEED_URL_DEFAULT,
+    push_poll_sec: int = PUSH_POLL_SEC_DEFAULT,
+    watch_share: float = WATCH_SHARE_DEFAULT,
+    watch_max_interval: int = WATCH_MAX_INTERVAL_DEFAULT,
+    retire_after: int = RETIRE_AFTER_DEFAULT,
+    revalidate_days: float = REVALIDATE_DAYS_DEFAULT,
 ):
-    seed_channels(con, channels_file)
-    stats = {"ok": 0, "not_modified": 0, "new_videos": 0, "blocked": 0, "gone": 0, "error": 0}
+    if channels_file:
+        seed_channels(con, channels_file)
+        sync_watchlist(con)
+        _revalidate(con)
+    writer.owner = writer.owner or make_lease_owner()
+    sched = make_scheduler(con, scheduler, writer.owner, lease_sec, shard)
+    next_seed = time.monotonic() + seed_interval
+    stats = _new_stats()
     limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
-    limiter = RateLimiter(rps)
+    limiter = make_limiter(rps, concurrency, limiter, aimd, min_rps, adaptive_workers, shard[1])
+    if watch_share > 0:
+        # 起動時にウォッチリストが空でも包んでおく（後から同期されたチャンネルにも配分を保証する。空なら素通し）
+        limiter = LaneLimiter(limiter, watch_share)
+    profiles, pushed = _load_poll_hints(con, writer, upload_profile, push_poll_sec)
+    M_RPS.set_function(lambda: limiter.rps)
+    parser = ParsePool(parse_workers, parse_pool)
+    M_QUEUE.set_function(lambda: parser.inflight, queue="parse")
+    writer.start()
     async with httpx.AsyncClient(http2=True, headers=HEADERS_BASE, limits=limits, timeout=20.0) as client:
-        q: asyncio.Queue = asyncio.Queue()
-        workers = [asyncio.create_task(worker_loop(client, limiter, con, q, stats)) for _ in range(concurrency)]
+        q: asyncio.Queue = LaneQueue()
+        M_QUEUE.set_function(q.qsize, queue="tasks")
+        workers = [
+            asyncio.create_task(
+                worker_loop(
+                    client, limiter, writer, sched, q, stats, profiles, parser, feed_url, pushed, watch_max_interval,
+                    retire_after, revalidate_days,
+                )
+            )
+            for _ in range(concurrency)
+        ]
         try:
             while True:
+                if seed_interval > 0 and time.monotonic() >= next_seed:
+                    # auto_discover が追記したチャンネルを再起動なしで取り込む
+                    next_seed = time.monotonic() + seed_interval
+                    added = seed_channels(con, channels_file) + sync_watchlist(con) if channels_file else 0
+                    if channels_file:
+                        _revalidate(con)
+                    picked = sched.refresh()
+                    if added or picked:
+                        print(f"seed: +{added} channels (scheduler picked up {picked})")
                 if q.qsize() < batch_size:
-                    for it in reserve_due_channels(con, batch_size - q.qsize()):
+                    for it in sched.reserve(batch_size - q.qsize()):
                         await q.put(it)
                 await asyncio.sleep(tick_sec)
-                write_progress(con, stats)
+                if report is not None:
+                    report(_snapshot(stats, writer, sched, limiter))
+                else:
+                    write_progress(con, stats, writer, sched, limiter=limiter)
         finally:
             for _ in range(concurrency):
                 await q.put(None)
             await q.join()
             for w in workers:
                 await w
+            parser.close()
+            writer.close()
+
+
+def _shard_main(
+    shard_idx: int,
+    nshards: int,
+    opts: Dict[str, Any],
+    budget: SharedBudget,
+    report_q: "mp.Queue",
+) -> None:
+    """子プロセス: 自分のシャードだけを巡回し、進捗は親へキューで送る"""
+    con = ensure_db(opts["db"])
+    writer = FeedWriter(
+        opts["db"], flush_ms=opts["commit_ms"], max_ops=opts["commit_ops"], owner=make_lease_owner(),
+        known_ids=None if opts["no_known_cache"] else KnownIds(opts["known_hot_days"]),
+        pipeline=make_pipeline(opts, nshards),
+    )
+    limiter = SharedRateLimiter(budget)
+    shard = (shard_idx, nshards)
+    if opts["metrics_port"]:
+        serve_metrics(opts["metrics_port"] + 1 + shard_idx, opts["metrics_host"])
+
+    def report(snap: Dict[str, Any]) -> None:
+        report_q.put((shard_idx, snap))
+
+    concurrency = max(1, opts["concurrency"] // nshards)
+    try:
+        if opts["once"]:
+            limit = -(-opts["limit"] // nshards) if opts["limit"] else 0
+            asyncio.run(
+                run_once(
+                    con, writer, None, concurrency, budget.rps.value, limit, opts["scheduler"], opts["lease_sec"],
+                    limiter=limiter, shard=shard, report=report,
+                    aimd=not opts["no_aimd"], min_rps=opts["min_rps"], adaptive_workers=opts["adaptive_workers"],
+                    upload_profile=not opts["no_upload_profile"],
+                    parse_workers=opts["parse_workers"], parse_pool=opts["parse_pool"], feed_url=opts["feed_url"],
+                    push_poll_sec=opts["push_poll_sec"],
+                    watch_share=opts["watch_share"], watch_max_interval=opts["watch_max_interval"],
+                    retire_after=opts["retire_after"], revalidate_days=opts["revalidate_days"],
+                )
+            )
+        else:
+            asyncio.run(
+                run_daemon(
+                    con, writer, None, concurrency, budget.rps.value, max(1, opts["batch"] // nshards), opts["tick"],
+                    opts["scheduler"], opts["lease_sec"],
+                    limiter=limiter, shard=shard, report=report,
+                    aimd=not opts["no_aimd"], min_rps=opts["min_rps"], adaptive_workers=opts["adaptive_workers"],
+                    upload_profile=not opts["no_upload_profile"], seed_interval=opts["seed_interval"],
+                    parse_workers=opts["parse_workers"], parse_pool=opts["parse_pool"], feed_url=opts["feed_url"],
+                    push_poll_sec=opts["push_poll_sec"],
+                    watch_share=opts["watch_share"], watch_max_interval=opts["watch_max_interval"],
+                    retire_after=opts["retire_after"], revalidate_days=opts["revalidate_days"],
+                )
+            )
+    except KeyboardInterrupt:
+        pass
+
+
+def make_pipeline(opts: Dict[str, Any], nshards: int = 1) -> Optional[VideoBatcher]:
+    """--pipeline 指定時のバッチャ（--processes 時は QPS をシャード数で分ける）"""
+    if not opts.get("pipeline"):
+        return None
+    return VideoBatcher(
+        opts["db"],
+        opts["api_key"],
+        batch_size=opts["pipeline_batch"],
+        max_wait_sec=opts["pipeline_wait"],
+        qps=opts["pipeline_qps"] / max(1, nshards),
+        audit_dir=opts["pipeline_audit_dir"],
+    )
+
+
+def _sum_dicts(dicts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for d in dicts:
+        for k, v in (d or {}).items():
+            if isinstance(v, (int, float)):
+                out[k] = out.get(k, 0) + v
+    return out
+
+
+def write_sharded_progress(con: sqlite3.Connection, snaps: Dict[int, Dict[str, Any]], nshards: int) -> None:
+    shards = [snaps[i] for i in sorted(snaps)]
+    extra = {
+        "processes": nshards,
+        "writer": _sum_dicts([x.get("writer") for x in shards]),
+        "shards": {str(i): snaps[i] for i in sorted(snaps)},
+    }
+    sched = _sum_dicts([x.get("scheduler") for x in shards])
+    if sched:
+        extra["scheduler"] = sched
+    rates = [x["rate"] for x in shards if x.get("rate")]
+    if rates:
+        # effective_rps は共有値なのでどのシャードでも同じ。観測値とイベントは合算
+        rate = dict(rates[0])
+        rate["observed_rps"] = round(sum(r.get("observed_rps") or 0 for r in rates), 2)
+        rate["inflight"] = sum(r.get("inflight") or 0 for r in rates)
+        events = [e for r in rates for e in (r.get("backoff_events") or [])]
+        rate["backoff_events"] = sorted(events, key=lambda e: e["at"])[-20:]
+        extra["rate"] = rate
+    write_progress(con, _sum_dicts([x.get("last_batch") for x in shards]), extra=extra)
+
+
+def _backfill_profiles(con: sqlite3.Connection) -> None:
+    """初回のみ rss_videos の履歴から投稿時刻プロファイルを作る（以降は書き込みスレッドが逐次更新）"""
+    t0 = time.monotonic()
+    n = backfill_upload_hist(con)
+    if n:
+        print(f"upload profiles: built {n} rows in {time.monotonic() - t0:.1f}s")
+
+
+def run_sharded(args: argparse.Namespace) -> None:
+    """親プロセス: シードしてから N 個のシャードプロセスを起動し、進捗を集約する"""
+    con = ensure_db(args.db)
+    seed_channels(con, args.channels_file)
+    sync_watchlist(con)
+    _revalidate(con)
+    if not args.no_upload_profile:
+        _backfill_profiles(con)
+    nshards = args.processes
+    if args.metrics_port:
+        # 親は全体の rss_overdue_channels のみ。リクエスト系はシャードごとのポートで公開
+        serve_metrics(args.metrics_port, args.metrics_host)
+    budget = SharedBudget(args.rps)
+    report_q: "mp.Queue" = mp.Queue()
+    opts = vars(args).copy()
+    procs = [
+        mp.Process(target=_shard_main, args=(i, nshards, opts, budget, report_q), name=f"rss-shard-{i}")
+        for i in range(nshards)
+    ]
+    for p in procs:
+        p.start()
+    snaps: Dict[int, Dict[str, Any]] = {}
+
+    def drain(timeout: float) -> None:
+        try:
+            shard_idx, snap = report_q.get(timeout=timeout)
+        except queue.Empty:
+            return
+        snaps[shard_idx] = snap
+        while True:
+            try:
+                shard_idx, snap = report_q.get_nowait()
+            except queue.Empty:
+                return
+            snaps[shard_idx] = snap
+
+    next_seed = time.monotonic() + args.seed_interval
+    try:
+        while any(p.is_alive() for p in procs):
+            drain(max(1, args.tick))
+            if not args.once and args.seed_interval > 0 and time.monotonic() >= next_seed:
+                # 追記分は親が取り込み、各シャードは rowid の増分から拾う
+                next_seed = time.monotonic() + args.seed_interval
+                added = seed_channels(con, args.channels_file) + sync_watchlist(con)
+                _revalidate(con)
+                if added:
+                    print(f"seed: +{added} channels")
+            if snaps:
+                write_sharded_progress(con, snaps, nshards)
+        drain(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        for p in procs:
+            p.join(timeout=10)
+    if snaps:
+        write_sharded_progress(con, snaps, nshards)
 
 
 def build_arg_parser() -> argparse.ArgumentParser:
@@ -563,17 +2215,177 @@ def build_arg_parser() -> argparse.ArgumentParser:
     ap.add_argument("--tick", type=int, default=5, help="tick 秒数（投入間隔）")
     ap.add_argument("--once", action="store_true", help="1 バッチだけ実行して終了")
     ap.add_argument("--limit", type=int, default=0, help="--once 時の最大処理件数")
+    ap.add_argument(
+        "--scheduler",
+        choices=["db", "heap"],
+        default="db",
+        help="db=tick ごとに DB 検索 / heap=起動時に読み込みメモリ上の min-heap で管理",
+    )
+    ap.add_argument("--lease-sec", type=int, default=LEASE_SEC_DEFAULT, help="予約リースの有効期間（秒）。期限切れは自動回収")
+    ap.add_argument("--commit-ms", type=int, default=200, help="書き込みスレッドのコミット間隔（ミリ秒）")
+    ap.add_argument("--commit-ops", type=int, default=2000, help="1 コミットにまとめる最大操作数")
+    ap.add_argument(
+        "--no-known-cache",
+        action="store_true",
+        help="既知の動画 ID のメモリキャッシュ（直近分の集合 + Bloom フィルタ）を使わず、毎回 DB で確認する",
+    )
+    ap.add_argument(
+        "--known-hot-days",
+        type=int,
+        default=HOT_DAYS_DEFAULT,
+        help="起動時に既知 ID の集合へ読み込む期間（公開日から何日、それ以前は Bloom フィルタで判定）",
+    )
+    ap.add_argument("--no-aimd", action="store_true", help="429/5xx に応じた全体レートの自動調整（AIMD）を無効化")
+    ap.add_argument("--min-rps", type=float, default=1.0, help="AIMD で下げるときの下限 RPS")
+    ap.add_argument(
+        "--adaptive-workers",
+        action="store_true",
+        help="観測レイテンシ × RPS から同時リクエスト数を自動調整（上限は --concurrency）",
+    )
+    ap.add_argument(
+        "--no-upload-profile",
+        action="store_true",
+        help="投稿時刻プロファイル（曜日×時間）による巡回間隔の調整を無効化",
+    )
+    ap.add_argument(
+        "--seed-interval",
+        type=int,
+        default=SEED_INTERVAL_DEFAULT,
+        help="常駐時に --channels-file の追記分を取り込む間隔（秒、0 で無効）",
+    )
+    ap.add_argument("--parse-workers", type=int, default=0, help="フィードのパースを行うプールのサイズ（0=イベントループ上で実行）")
+    ap.add_argument(
+        "--parse-pool",
+        choices=["thread", "process"],
+        default="thread",
+        help="パースプールの種類（process は複数コアを使う。--processes 時はシャードごとに作られる）",
+    )
+    ap.add_argument(
+        "--feed-url",
+        default=FEED_URL_DEFAULT,
+        help="フィードのベース URL（?channel_id= を付けて取得）。負荷試験用の偽サーバ向け",
+    )
+    ap.add_argument(
+        "--watch-share",
+        type=float,
+        default=WATCH_SHARE_DEFAULT,
+        help="混雑時に rss_watchlist のチャンネル（watch レーン）へ保証するリクエストの割合（0 でレーン無効）",
+    )
+    ap.add_argument(
+        "--watch-max-interval",
+        type=int,
+        default=WATCH_MAX_INTERVAL_DEFAULT,
+        help="watch レーンの巡回間隔の上限（秒、0 で上限なし）",
+    )
+    ap.add_argument(
+        "--retire-after",
+        type=int,
+        default=RETIRE_AFTER_DEFAULT,
+        help="403/404/410 がこの回数連続したチャンネルを退役（disabled=1）させる（0 で退役させない）",
+    )
+    ap.add_argument(
+        "--revalidate-days",
+        type=float,
+        default=REVALIDATE_DAYS_DEFAULT,
+        help=f"退役チャンネルを再確認するまでの日数（再び消えていれば倍々、上限 {REVALIDATE_MAX_DAYS} 日）",
+    )
+    ap.add_argument(
+        "--push-poll-sec",
+        type=int,
+        default=PUSH_POLL_SEC_DEFAULT,
+        help="WebSub のリースが有効なチャンネルの巡回間隔の下限（秒、0 でプッシュ状況を無視）",
+    )
+    ap.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="新規検出をプロセス内で直接 videos.list に渡す（rss-export / api-fetch を経由しない）",
+    )
+    ap.add_argument("--api-key", default=os.getenv("YOUTUBE_API_KEY"), help="--pipeline 用の YouTube API key（「,」区切りで複数可） (env YOUTUBE_API_KEY)")
+    ap.add_argument("--pipeline-batch", type=int, default=BATCH_SIZE_DEFAULT, help="videos.list 1 回あたりの ID 数（<=50）")
+    ap.add_argument(
+        "--pipeline-wait",
+        type=float,
+        default=MAX_WAIT_SEC_DEFAULT,
+        help="ID が --pipeline-batch 件そろわなくても、最初の ID からこの秒数で送る",
+    )
+    ap.add_argument("--pipeline-qps", type=float, default=1.0, help="パイプラインの videos.list 毎秒リクエスト数の上限（全体）")
+    ap.add_argument("--pipeline-audit-dir", default=None, help="送った ID を rss_pipeline_YYYYMMDD.jsonl に追記するディレクトリ（監査用）")
+    ap.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="GET /metrics（Prometheus 形式）を公開するポート。0 で無効。--processes 時はシャード i が port+1+i",
+    )
+    ap.add_argument("--metrics-host", default="127.0.0.1", help="メトリクスの待ち受けアドレス")
+    ap.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="channel_id 空間を N シャードに分けて N プロセスで巡回（--rps は全体合計、--concurrency/--batch は分割）",
+    )
     return ap
 
 
 def main(argv: Optional[List[str]] = None) -> None:
     ap = build_arg_parser()
     args = ap.parse_args(argv)
+    if args.pipeline and not args.api_key:
+        print("ERROR: --pipeline には --api-key か環境変数 YOUTUBE_API_KEY が必要です。")
+        return
+    if args.processes > 1:
+        run_sharded(args)
+        return
+    if args.metrics_port:
+        serve_metrics(args.metrics_port, args.metrics_host)
     con = ensure_db(args.db)
+    if not args.no_upload_profile:
+        _backfill_profiles(con)
+    writer = FeedWriter(
+        args.db, flush_ms=args.commit_ms, max_ops=args.commit_ops, owner=make_lease_owner(),
+        known_ids=None if args.no_known_cache else KnownIds(args.known_hot_days),
+        pipeline=make_pipeline(vars(args)),
+    )
     if args.once:
-        asyncio.run(run_once(con, args.channels_file, args.concurrency, args.rps, args.limit))
+        asyncio.run(
+            run_once(
+                con, writer, args.channels_file, args.concurrency, args.rps, args.limit, args.scheduler, args.lease_sec,
+                aimd=not args.no_aimd, min_rps=args.min_rps, adaptive_workers=args.adaptive_workers,
+                upload_profile=not args.no_upload_profile,
+                parse_workers=args.parse_workers, parse_pool=args.parse_pool, feed_url=args.feed_url,
+                push_poll_sec=args.push_poll_sec,
+                watch_share=args.watch_share,
+                watch_max_interval=args.watch_max_interval,
+                retire_after=args.retire_after,
+                revalidate_days=args.revalidate_days,
+            )
+        )
     else:
-        asyncio.run(run_daemon(con, args.channels_file, args.concurrency, args.rps, args.batch, args.tick))
+        asyncio.run(
+            run_daemon(
+                con,
+                writer,
+                args.channels_file,
+                args.concurrency,
+                args.rps,
+                args.batch,
+                args.tick,
+                args.scheduler,
+                args.lease_sec,
+                aimd=not args.no_aimd,
+                min_rps=args.min_rps,
+                adaptive_workers=args.adaptive_workers,
+                upload_profile=not args.no_upload_profile,
+                seed_interval=args.seed_interval,
+                parse_workers=args.parse_workers,
+                parse_pool=args.parse_pool,
+                feed_url=args.feed_url,
+                push_poll_sec=args.push_poll_sec,
+                watch_share=args.watch_share,
+                watch_max_interval=args.watch_max_interval,
+                retire_after=args.retire_after,
+                revalidate_days=args.revalidate_days,
+            )
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+ytapi_snapshots の圧縮（古い時系列を日次に間引く）
+
+ytapi_snapshots は 1 動画 × 1 取得で 1 行ずつ増え続け、channel_title / category_id / duration_seconds も
+毎行に繰り返し入っている。ランキング（growth-rank）が細かい時系列を使うのは公開後 48 時間だけなので、
+取得から keep_hours（既定 72 時間）より古い行を次のようにまとめる。
+
+- ytapi_snapshots_daily(video_id, day, ...) … UTC の日ごとに 1 行（その日の最初/最後の時刻と再生数、
+  最後の高評価・コメント数、点数）。同じ日に後から来た行も足し込める
+- ytapi_video_static(video_id, ...) … channel_id / channel_title / category_id / duration_seconds と
+  最初/最後の取得時刻（動画ごとに 1 行。日次の行には持たせない）
+- 動画ごとの最新の 1 行は ytapi_snapshots に残す（popular_ranker など「最新のスナップショット」を読む側のため）。
+  それ以外の古い行は日次に足し込んでから削除する
+- 実行ごとに ytapi_compaction_log に対象動画数・削除行数・日次行数・解放バイト数を記録する。
+  処理済みの位置（ytapi_snapshots.id）もここに残し、次回はその続きから見る
+- auto_vacuum=INCREMENTAL の DB では最後に incremental_vacuum で空きページをファイルから返す。
+  それ以外の DB では空きページは次の挿入で再利用される（ファイルは増えなくなる）。
+  --enable-auto-vacuum で 1 回だけ VACUUM して INCREMENTAL に切り替えられる（DB 全体の書き直しなので時間がかかる）
+
+実行例:
+  python -m ytanalyzer.services.snapshot_compactor --db data/rss_watch.sqlite --keep-hours 72
+  python -m ytanalyzer.cli snapshot-compact
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+DB_DEFAULT = "data/rss_watch.sqlite"
+KEEP_HOURS_DEFAULT = 72
+BATCH_ROWS_DEFAULT = 5000
+
+
+def _utciso(dt: Optional[datetime] = None) -> str:
+    return (dt or datetime.now(timezone.utc)).replace(microsecond=0).isoformat()
+
+
+def ensure_tables(con: sqlite3.Connection) -> None:
+    con.execute(
+        """
+        create table if not exists ytapi_snapshots_daily(
+          video_id text not null,
+          day text not null,
+          first_at text,
+          last_at text,
+          first_views integer,
+          last_views integer,
+          last_likes integer,
+          last_comments integer,
+          points integer not null default 0,
+          primary key(video_id, day)
+        ) without rowid
+        """
+    )
+    con.execute(
+        """
+        create table if not exists ytapi_video_static(
+          video_id text primary key,
+          channel_id text,
+          channel_title text,
+          category_id text,
+          duration_seconds integer,
+          first_polled_at text,
+          last_polled_at text
+        )
+        """
+    )
+    con.execute(
+        """
+        create table if not exists ytapi_compaction_log(
+          id integer primary key autoincrement,
+          ran_at text,
+          cutoff text,
+          last_id integer,
+          videos integer,
+          rows_deleted integer,
+          daily_rows integer,
+          bytes_before integer,
+          bytes_after integer,
+          freelist_pages integer,
+          seconds real
+        )
+        """
+    )
+    # 動画ごとの時系列と、時刻の範囲引き（growth_ranker / api_refetch / 本処理）
+    con.execute("create index if not exists idx_ytapi_snapshots_vid_time on ytapi_snapshots(video_id, polled_at)")
+    con.execute("create index if not exists idx_ytapi_snapshots_polled on ytapi_snapshots(polled_at)")
+    con.commit()
+
+
+def _db_bytes(con: sqlite3.Connection) -> Tuple[int, int]:
+    """(ファイル上のバイト数, 空きページ数)"""
+    size = con.execute("pragma page_size").fetchone()[0]
+    pages = con.execute("pragma page_count").fetchone()[0]
+    free = con.execute("pragma freelist_count").fetchone()[0]
+    return int(size) * int(pages), int(free)
+
+
+_DAILY_UPSERT = """
+insert into ytapi_snapshots_daily(video_id, day, first_at, last_at, first_views, last_views, last_likes, last_comments, points)
+values(?,?,?,?,?,?,?,?,?)
+on conflict(video_id, day) do update set
+  first_views=case when excluded.first_at < first_at then excluded.first_views else first_views end,
+  first_at=min(first_at, excluded.first_at),
+  last_views=case when excluded.last_at > last_at then excluded.last_views else last_views end,
+  last_likes=case when excluded.last_at > last_at then excluded.last_likes else last_likes end,
+  last_comments=case when excluded.last_at > last_at then excluded.last_comments else last_comments end,
+  last_at=max(last_at, excluded.last_at),
+  points=points+excluded.points
+"""
+
+_STATIC_UPSERT = """
+insert into ytapi_video_static(video_id, channel_id, channel_title, category_id, duration_seconds, first_polled_at, last_polled_at)
+values(?,?,?,?,?,?,?)
+on conflict(video_id) do update set
+  channel_id=coalesce(excluded.channel_id, channel_id),
+  channel_title=coalesce(excluded.channel_title, channel_title),
+  category_id=coalesce(excluded.category_id, category_id),
+  duration_seconds=coalesce(excluded.duration_seconds, duration_seconds),
+  first_polled_at=min(coalesce(first_polled_at, excluded.first_polled_at), excluded.first_polled_at),
+  last_polled_at=max(coalesce(last_polled_at, excluded.last_polled_at), excluded.last_polled_at)
+"""
+
+
+def _compact_video(con: sqlite3.Connection, vid: str, cutoff: str) -> Tuple[List[int], List[Tuple], Tuple]:
+    """1 動画分: (削除する id, 日次の行, 静的属性の行)。最新の 1 行と cutoff 以降の行は残す"""
+    rows = con.execute(
+        """
+        select id, polled_at, view_count, like_count, comment_count,
+               channel_id, channel_title, category_id, duration_seconds
+        from ytapi_snapshots where video_id=? order by polled_at, id
+        """,
+        (vid,),
+    ).fetchall()
+    # 静的属性は新しい行の値を優先（None は古い行で埋める）
+    static: List[Any] = [None, None, None, None]
+    for r in reversed(rows):
+        for i in range(4):
+            if static[i] is None and r[5 + i] is not None:
+                static[i] = r[5 + i]
+    static_row = (vid, *static, rows[0][1], rows[-1][1])
+    days: Dict[str, List[Any]] = {}
+    drop: List[int] = []
+    for r in rows[:-1]:
+        if r[1] >= cutoff:
+            break
+        drop.append(r[0])
+        d = days.get(r[1][:10])
+        if d is None:
+            days[r[1][:10]] = [r[1], r[1], r[2], r[2], r[3], r[4], 1]
+        else:
+            d[1], d[3], d[4], d[5] = r[1], r[2], r[3], r[4]
+            d[6] += 1
+    daily = [(vid, day, *d) for day, d in days.items()]
+    return drop, daily, static_row
+
+
+def compact(
+    con: sqlite3.Connection,
+    keep_hours: float = KEEP_HOURS_DEFAULT,
+    batch_rows: int = BATCH_ROWS_DEFAULT,
+    vacuum_pages: int = 0,
+) -> Dict[str, Any]:
+    t0 = time.time()
+    ensure_tables(con)
+    cutoff = _utciso(datetime.now(timezone.utc) - timedelta(hours=keep_hours))
+    bytes_before, _ = _db_bytes(con)
+    last_id = con.execute("select coalesce(max(last_id), 0) from ytapi_compaction_log").fetchone()[0]
+    # cutoff より前の最後の行（polled_at の索引を 1 回引くだけ）。id は挿入順なのでここまでが対象
+    r = con.execute(
+        "select id from ytapi_snapshots where polled_at < ? order by polled_at desc limit 1", (cutoff,)
+    ).fetchone()
+    hi_id = int(r[0]) if r else last_id
+    out = {"cutoff": cutoff, "videos": 0, "rows_deleted": 0, "daily_rows": 0}
+    pos = last_id
+    while pos < hi_id:
+        batch = con.execute(
+            "select id, video_id from ytapi_snapshots where id > ? and id <= ? order by id limit ?",
+            (pos, hi_id, max(1, batch_rows)),
+        ).fetchall()
+        if not batch:
+            pos = hi_id
+            break
+        vids = list(dict.fromkeys(b[1] for b in batch if b[1]))
+        con.execute("begin immediate")
+        try:
+            for vid in vids:
+                drop, daily, static_row = _compact_video(con, vid, cutoff)
+                con.execute(_STATIC_UPSERT, static_row)
+                if daily:
+                    con.executemany(_DAILY_UPSERT, daily)
+                if drop:
+                    con.executemany("delete from ytapi_snapshots where id=?", [(i,) for i in drop])
+                out["rows_deleted"] += len(drop)
+                out["daily_rows"] += len(daily)
+            out["videos"] += len(vids)
+            con.commit()
+        except sqlite3.Error:
+            con.rollback()
+            raise
+        pos = batch[-1][0]
+    if (con.execute("pragma auto_vacuum").fetchone()[0] or 0) == 2:
+        # INCREMENTAL のときだけ空きページをファイルから返す（0 = 全部）。WAL ではチェックポイントで本体が縮む
+        # execute() だと 1 ステップ（1 ページ）で止まるので executescript で最後まで回す
+        con.executescript(f"pragma incremental_vacuum({max(0, int(vacuum_pages))});")
+        con.execute("pragma wal_checkpoint(TRUNCATE)").fetchall()
+    bytes_after, free = _db_bytes(con)
+    out.update(
+        last_id=pos,
+        bytes_before=bytes_before,
+        bytes_after=bytes_after,
+        freelist_pages=free,
+        seconds=round(time.time() - t0, 2),
+    )
+    con.execute(
+        """
+        insert into ytapi_compaction_log(ran_at, cutoff, last_id, videos, rows_deleted, daily_rows,
+                                         bytes_before, bytes_after, freelist_pages, seconds)
+        values(?,?,?,?,?,?,?,?,?,?)
+        """,
+        (_utciso(), cutoff, pos, out["videos"], out["rows_deleted"], out["daily_rows"],
+         bytes_before, bytes_after, free, out["seconds"]),
+    )
+    con.commit()
+    return out
+
+
+def enable_incremental_vacuum(con: sqlite3.Connection) -> None:
+    """auto_vacuum を INCREMENTAL に切り替える（VACUUM で DB 全体を書き直す。1 回だけでよい）"""
+    con.execute("pragma auto_vacuum=INCREMENTAL")
+    con.execute("vacuum")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Compact old ytapi_snapshots rows into daily rollups")
+    ap.add_argument("--db", default=DB_DEFAULT)
+    ap.add_argument("--keep-hours", type=float, default=KEEP_HOURS_DEFAULT, help="この時間より新しいスナップショットはそのまま残す")
+    ap.add_argument("--batch-rows", type=int, default=BATCH_ROWS_DEFAULT, help="1 トランザクションで見る ytapi_snapshots の行数")
+    ap.add_argument("--vacuum-pages", type=int, default=0, help="incremental_vacuum で返すページ数の上限（0=全部）")
+    ap.add_argument("--enable-auto-vacuum", action="store_true", help="先に auto_vacuum=INCREMENTAL へ切り替える（VACUUM を 1 回実行）")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    con = sqlite3.connect(args.db, timeout=60)
+    con.isolation_level = None  # begin immediate / commit を自前で管理する
+    if args.enable_auto_vacuum and (con.execute("pragma auto_vacuum").fetchone()[0] or 0) != 2:
+        print("switching auto_vacuum to INCREMENTAL (full VACUUM) ...")
+        enable_incremental_vacuum(con)
+    res = compact(con, args.keep_hours, args.batch_rows, args.vacuum_pages)
+    con.close()
+    freed = res["bytes_before"] - res["bytes_after"]
+    print(
+        f"compacted {res['videos']} videos: deleted {res['rows_deleted']} rows into {res['daily_rows']} daily rows "
+        f"(cutoff {res['cutoff']}); file {res['bytes_before']:,} -> {res['bytes_after']:,} bytes "
+        f"(freed {freed:,}, free pages {res['freelist_pages']:,}) in {res['seconds']}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+行数・ポーリング結果・時間別件数のカウンタ（count(*) の全件走査を避ける）
+
+- stats_counters(name, value)
+    rows:<table>   … トリガで挿入 +1 / 削除 -1（導入時に 1 回だけ count(*) で初期化）
+    poll:<status>  … rss_watcher の書き込みスレッドが HTTP ステータス別に加算（0 は poll:error）
+- stats_hourly(name, hour, value)
+    discovered … rss_videos_discovered.discovered_at の時間別件数（hour は 'YYYY-MM-DDTHH'、UTC）
+    snapshots  … ytapi_snapshots.polled_at の時間別件数
+
+ensure_counters() は各サービスの ensure_tables から呼ばれ、存在するテーブルにだけトリガを張る。
+読み出し側（write_progress / scripts/db_status.py / scripts/quick_counts.py / /health）は
+row_count() などを使い、カウンタが無い古い DB では None を受けて従来の count(*) に戻る。
+"""
+from __future__ import annotations
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+TRACKED_TABLES = (
+    "rss_channels",
+    "rss_videos",
+    "rss_videos_discovered",
+    "ytapi_snapshots",
+    "trending_ranks",
+    "growth_metrics",
+)
+
+# テーブル → (stats_hourly.name, 時刻カラム)
+HOURLY_TABLES = {
+    "rss_videos_discovered": ("discovered", "discovered_at"),
+    "ytapi_snapshots": ("snapshots", "polled_at"),
+}
+
+_UPSERT = "insert into stats_counters(name, value) values({name}, {delta}) on conflict(name) do update set value=value+({delta})"
+_UPSERT_HOURLY = (
+    "insert into stats_hourly(name, hour, value) select '{name}', substr(new.{col}, 1, 13), 1 "
+    "where new.{col} is not null on conflict(name, hour) do update set value=value+1"
+)
+
+
+def _has_table(con: sqlite3.Connection, name: str) -> bool:
+    return con.execute("select 1 from sqlite_master where type='table' and name=?", (name,)).fetchone() is not None
+
+
+def _has_trigger(con: sqlite3.Connection, name: str) -> bool:
+    return con.execute("select 1 from sqlite_master where type='trigger' and name=?", (name,)).fetchone() is not None
+
+
+def _install(con: sqlite3.Connection, table: str) -> None:
+    key = f"'rows:{table}'"
+    ins = [_UPSERT.format(name=key, delta=1)]
+    hourly = HOURLY_TABLES.get(table)
+    if hourly:
+        name, col = hourly
+        ins.append(_UPSERT_HOURLY.format(name=name, col=col))
+    con.execute(
+        f"create trigger if not exists trg_cnt_ins_{table} after insert on {table} begin "
+        + "; ".join(ins)
+        + "; end"
+    )
+    con.execute(
+        f"create trigger if not exists trg_cnt_del_{table} after delete on {table} begin "
+        + _UPSERT.format(name=key, delta=-1)
+        + "; end"
+    )
+    n = con.execute(f"select count(*) from {table}").fetchone()[0]
+    con.execute(
+        "insert into stats_counters(name, value, updated_at) values(?,?,?) "
+        "on conflict(name) do update set value=excluded.value, updated_at=excluded.updated_at",
+        (f"rows:{table}", n, _utciso()),
+    )
+    if hourly:
+        name, col = hourly
+        con.execute(
+            f"""
+            insert into stats_hourly(name, hour, value)
+            select ?, substr({col}, 1, 13) as h, count(*) from {table}
+            where {col} is not null
+            group by h
+            on conflict(name, hour) do update set value=excluded.value
+            """,
+            (name,),
+        )
+
+
+def _utciso() -> str:
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def ensure_counters(con: sqlite3.Connection, tables: Iterable[str] = TRACKED_TABLES) -> None:
+    """カウンタ用テーブルと、未導入のテーブルへのトリガを作る（導入時の初期値はトリガと同じトランザクションで数える）"""
+    con.execute(
+        """
+        create table if not exists stats_counters(
+          name text primary key,
+          value integer not null default 0,
+          updated_at text
+        )
+        """
+    )
+    con.execute(
+        """
+        create table if not exists stats_hourly(
+          name text not null,
+          hour text not null,
+          value integer not null default 0,
+          primary key(name, hour)
+        ) without rowid
+        """
+    )
+    con.commit()
+    todo = [t for t in tables if _has_table(con, t) and not _has_trigger(con, f"trg_cnt_ins_{t}")]
+    if not todo:
+        return
+    con.execute("begin immediate")
+    try:
+        for t in todo:
+            # 別プロセスが先に導入していたら何もしない
+            if not _has_trigger(con, f"trg_cnt_ins_{t}"):
+                _install(con, t)
+        con.commit()
+    except sqlite3.Error:
+        con.rollback()
+        raise
+
+
+def get_counters(con: sqlite3.Connection, prefix: str = "") -> Dict[str, int]:
+    try:
+        rows = con.execute(
+            "select name, value from stats_counters where substr(name, 1, ?) = ?", (len(prefix), prefix)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return {r[0][len(prefix):]: int(r[1]) for r in rows}
+
+
+def row_count(con: sqlite3.Connection, table: str) -> Optional[int]:
+    """トリガで維持している行数。カウンタが無ければ None"""
+    try:
+        r = con.execute("select value from stats_counters where name=?", (f"rows:{table}",)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return int(r[0]) if r else None
+
+
+def hour_key(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H")
+
+
+def hourly_since(con: sqlite3.Connection, name: str, hours: int = 1) -> Optional[int]:
+    """直近 hours 時間の合計（時単位で切り捨てるので最大 hours+1 時間分）。未導入なら None"""
+    table = next((t for t, (n, _) in HOURLY_TABLES.items() if n == name), None)
+    if table is None or row_count(con, table) is None:
+        return None
+    since = hour_key(datetime.now(timezone.utc) - timedelta(hours=hours))
+    try:
+        r = con.execute(
+            "select coalesce(sum(value), 0) from stats_hourly where name=? and hour >= ?", (name, since)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return int(r[0])
+
+
+def hourly_series(con: sqlite3.Connection, name: str, hours: int = 24) -> Dict[str, int]:
+    since = hour_key(datetime.now(timezone.utc) - timedelta(hours=hours))
+    try:
+        rows = con.execute(
+            "select hour, value from stats_hourly where name=? and hour > ? order by hour", (name, since)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return {r[0]: int(r[1]) for r in rows}
+
+
+def poll_rows(statuses: Iterable[Optional[int]]) -> Tuple[Tuple[str, int], ...]:
+    """HTTP ステータスの列 → (name, delta) の行（executemany 用）"""
+    counts: Dict[str, int] = {}
+    for st in statuses:
+        key = f"poll:{st}" if st else "poll:error"
+        counts[key] = counts.get(key, 0) + 1
+    return tuple(counts.items())
+
+
+POLL_UPSERT_SQL = (
+    "insert into stats_counters(name, value, updated_at) values(?, ?, datetime('now')) "
+    "on conflict(name) do update set value=value+excluded.value, updated_at=excluded.updated_at"
+)
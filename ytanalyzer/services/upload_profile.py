@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+チャンネルごとの投稿時刻プロファイル（曜日×時間の 168 区分ヒストグラム）
+
+rss_upload_hist(channel_id, how, n) に「週の何時台（UTC, 日曜0時=0）に何本投稿したか」を持つ。
+初回は rss_videos.published_at から一括で作り、以降は新着動画の挿入と同じトランザクションで
+n を +1 する（FeedWriter）。
+
+profile_interval() は、よく投稿される時間帯（とその直後 1 時間）は短い間隔で、
+それ以外は長めの間隔で巡回し、ただし次の投稿時間帯の開始は飛び越さないように次回間隔を決める。
+サンプルが少ない・最近投稿していないチャンネルは None を返し、従来の階層に任せる。
+
+巡回側（イベントループ）は DB を引かない。UploadProfiles がチャンネルごとの「投稿時間帯」だけを
+メモリに持ち、起動時に一括で読み込み、以後は FeedWriter のスレッドが更新する。
+"""
+from __future__ import annotations
+
+import random
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+HOURS_OF_WEEK = 168
+
+# published_at（ISO8601、タイムゾーン付き）→ 週の何時台か（UTC、日曜 0 時 = 0）
+HOW_SQL = "(cast(strftime('%w', {col}) as integer) * 24 + cast(strftime('%H', {col}) as integer))"
+
+MIN_SAMPLES = 8  # これ未満はプロファイルを使わない
+HOT_FACTOR = 3.0  # 一様分布の何倍以上を「投稿時間帯」とみなすか
+HOT_MIN_COUNT = 2
+DENSE_SEC = 600  # 投稿時間帯とその直後 1 時間の巡回間隔
+SPARSE_FACTOR = 2.0  # それ以外は従来間隔の何倍まで伸ばすか
+SPARSE_MAX_SEC = 24 * 3600
+WAKE_OFFSET_SEC = 120  # 投稿時間帯の開始から少し後に起きる
+PROFILE_RELOAD_SEC = 3600  # 他のプロセス（WebSub の受信）が加算した分も拾うため、全体を読み直す間隔
+
+
+def ensure_upload_hist(con: sqlite3.Connection) -> None:
+    con.execute(
+        """
+        create table if not exists rss_upload_hist(
+          channel_id text not null,
+          how integer not null,
+          n integer not null default 0,
+          primary key(channel_id, how)
+        ) without rowid
+        """
+    )
+
+
+def backfill_upload_hist(con: sqlite3.Connection) -> int:
+    """rss_upload_hist が空なら rss_videos の全履歴から作る。作った行数を返す"""
+    ensure_upload_hist(con)
+    if con.execute("select 1 from rss_upload_hist limit 1").fetchone():
+        return 0
+    how = HOW_SQL.format(col="published_at")
+    cur = con.execute(
+        f"""
+        insert into rss_upload_hist(channel_id, how, n)
+        select channel_id, {how} as h, count(*)
+        from rss_videos
+        where channel_id is not null and published_at is not null and {how} is not null
+        group by channel_id, h
+        """
+    )
+    con.commit()
+    return cur.rowcount or 0
+
+
+# FeedWriter が executemany で使う（引数: channel_id, published_at）
+INCREMENT_SQL = f"""
+    insert into rss_upload_hist(channel_id, how, n)
+    select ?1, {HOW_SQL.format(col='?2')}, 1
+    where {HOW_SQL.format(col='?2')} is not null
+    on conflict(channel_id, how) do update set n = n + 1
+"""
+
+
+def hour_of_week(dt: datetime) -> int:
+    """HOW_SQL と同じ番号付け（UTC の datetime を渡す）"""
+    return (dt.isoweekday() % 7) * 24 + dt.hour
+
+
+class UploadProfiles:
+    """チャンネル → 投稿時間帯（hot_hours の結果）のメモリ上の写し。get() は辞書を引くだけ"""
+
+    def __init__(self):
+        self.hot: Dict[str, Tuple[int, ...]] = {}
+
+    def load(self, con: sqlite3.Connection) -> int:
+        """全チャンネル分を読み直す（集計は SQL 側で行い、投稿時間帯の行だけを受け取る）"""
+        hot: Dict[str, List[int]] = {}
+        for cid, how in con.execute(
+            f"""
+            with t as (
+              select channel_id, sum(n) as total from rss_upload_hist group by channel_id having sum(n) >= {MIN_SAMPLES}
+            )
+            select h.channel_id, h.how from rss_upload_hist h join t on t.channel_id = h.channel_id
+            where h.n >= max({HOT_MIN_COUNT}, {HOT_FACTOR} * t.total / {HOURS_OF_WEEK}.0)
+            """
+        ):
+            if 0 <= how < HOURS_OF_WEEK:
+                hot.setdefault(cid, []).append(how)
+        self.hot = {cid: tuple(sorted(hs)) for cid, hs in hot.items()}
+        return len(self.hot)
+
+    def update(self, con: sqlite3.Connection, channel_ids: Iterable[str]) -> None:
+        """履歴が増えたチャンネルだけ読み直す（FeedWriter がコミット後に呼ぶ）"""
+        for cid in channel_ids:
+            hist = [0] * HOURS_OF_WEEK
+            for how, n in con.execute("select how, n from rss_upload_hist where channel_id=?", (cid,)):
+                if 0 <= how < HOURS_OF_WEEK:
+                    hist[how] = n
+            hot = hot_hours(hist)
+            if hot:
+                self.hot[cid] = tuple(hot)
+            else:
+                self.hot.pop(cid, None)
+
+    def get(self, channel_id: str) -> Optional[Tuple[int, ...]]:
+        return self.hot.get(channel_id)
+
+
+def hot_hours(hist: Sequence[int]) -> List[int]:
+    total = sum(hist)
+    if total < MIN_SAMPLES:
+        return []
+    threshold = max(HOT_MIN_COUNT, HOT_FACTOR * total / HOURS_OF_WEEK)
+    return [h for h, n in enumerate(hist) if n >= threshold]
+
+
+def profile_interval(hours: Optional[Sequence[int]], now: datetime, fallback_iv: int) -> Optional[int]:
+    """投稿時間帯（UploadProfiles.get の値）に基づく次回間隔（秒）。使えなければ None"""
+    if not hours:
+        return None
+    hot = set(hours)
+    cur = hour_of_week(now)
+    # 投稿時間帯の最中か直後 1 時間（公開が数十分ずれることがある）
+    if cur in hot or (cur - 1) % HOURS_OF_WEEK in hot:
+        return int(DENSE_SEC * random.uniform(0.8, 1.2))
+    into_hour = now.minute * 60 + now.second
+    until_hot = None
+    for k in range(1, HOURS_OF_WEEK + 1):
+        if (cur + k) % HOURS_OF_WEEK in hot:
+            until_hot = k * 3600 - into_hour + WAKE_OFFSET_SEC
+            break
+    sparse = int(min(SPARSE_MAX_SEC, fallback_iv * SPARSE_FACTOR) * random.uniform(0.8, 1.2))
+    if until_hot is None:
+        return sparse
+    return max(DENSE_SEC // 2, min(sparse, until_hot))
+
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+rss_videos / rss_videos_discovered への動画の挿入（rss_watcher の FeedWriter と websub の受信で共用）
+
+どちらのテーブルも insert or ignore で入れ、実際に行が入ったかを返す。
+新規かどうかはこの結果だけで決める（他のプロセスが先に入れた ID は新規にならない）。
+コミットは呼び出し側で行う。
+"""
+from __future__ import annotations
+
+import sqlite3
+from typing import Optional, Tuple
+
+VIDEO_INSERT_SQL = """
+    insert or ignore into rss_videos(video_id, channel_id, title, published_at, thumb_hq, thumb_maxres)
+    values(?,?,?,?,?,?)
+"""
+DISCOVERED_INSERT_SQL = """
+    insert or ignore into rss_videos_discovered(video_id, channel_id, title, published_at, discovered_at)
+    values(?,?,?,?,?)
+"""
+
+
+def insert_video(
+    cur: sqlite3.Cursor,
+    vid: str,
+    cid: str,
+    title: Optional[str],
+    published_at: Optional[str],
+    discovered_at: str,
+) -> Tuple[bool, bool]:
+    """(rss_videos に入った, rss_videos_discovered に入った) を返す"""
+    cur.execute(
+        VIDEO_INSERT_SQL,
+        (
+            vid,
+            cid,
+            title,
+            published_at,
+            f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg",
+            f"https://i.ytimg.com/vi/{vid}/maxresdefault.jpg",
+        ),
+    )
+    new_v = cur.rowcount > 0
+    cur.execute(DISCOVERED_INSERT_SQL, (vid, cid, title, published_at, discovered_at))
+    return new_v, cur.rowcount > 0
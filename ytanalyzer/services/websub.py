@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+WebSub（PubSubHubbub）によるプッシュ受信
+
+YouTube はチャンネルフィードの更新を hub（pubsubhubbub.appspot.com）経由でプッシュ配信する。
+このサービスは
+- 購読: rss_channels のチャンネルを hub に subscribe（最近投稿のあるチャンネルから、--max-subscriptions 件まで）
+- 検証: hub からの GET（hub.challenge）に応答し、rss_websub にリース期限を記録
+- 更新: リース期限の --renew-margin 秒前に再購読。検証が来ないまま時間が経った購読も再送
+- 受信: POST された Atom を parse_feed でパースし、insert_video（video_store.py）で rss_videos / rss_videos_discovered に入れる。
+  プッシュの最新動画は rss_websub.last_push_* に残し、巡回側の打ち切り位置（rss_channels.last_seen_*）は動かさない。
+  hub が届け損ねた古い動画は、次の巡回がプッシュ済みの動画より先までパースして拾う（二重には数えない）
+を 1 プロセスで行う。--secret を指定すると X-Hub-Signature（HMAC-SHA1）を検証する。
+
+rss_watcher はリースが有効なチャンネルの巡回間隔を --push-poll-sec まで伸ばし、
+取りこぼし対策としてのみ巡回する（PushedChannels）。受信側が止まればリースが切れて通常の巡回に戻る。
+
+使い方:
+  python -m ytanalyzer.services.websub --callback-url https://example.com/websub --port 8088 --secret XXXX
+  ローカル試験: python -m ytanalyzer.tools.fake_hub --port 8090 と組み合わせ、--hub-url http://127.0.0.1:8090/subscribe
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from .feed_parser import ParseError, parse_feed
+from .upload_profile import INCREMENT_SQL
+from .video_store import insert_video
+
+DB_DEFAULT = "data/rss_watch.sqlite"
+HUB_DEFAULT = os.getenv("WEBSUB_HUB_URL", "https://pubsubhubbub.appspot.com/subscribe")
+TOPIC_BASE = "https://www.youtube.com/xml/feeds/videos.xml?channel_id="
+LEASE_SEC_DEFAULT = 5 * 24 * 3600
+RENEW_MARGIN_SEC = 12 * 3600
+PENDING_RETRY_SEC = 3600  # 検証が来ないまま何秒経ったら再送するか
+PUSH_POLL_SEC_DEFAULT = 12 * 3600  # rss_watcher: プッシュ購読中のチャンネルの巡回間隔（安全網）
+PUSHED_RELOAD_SEC = 300  # rss_watcher: リース期限を読み直す間隔
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.replace(microsecond=0).isoformat()
+
+
+def ensure_websub(con: sqlite3.Connection) -> None:
+    """
+    state: pending（subscribe 送信済み・検証待ち）/ subscribed / denied / failed（hub が 2xx 以外）
+    """
+    con.execute(
+        """
+        create table if not exists rss_websub(
+          channel_id text primary key,
+          state text not null,
+          requested_at text,
+          verified_at text,
+          lease_expires_at text,
+          last_push_at text,
+          last_push_published text,
+          last_push_video_id text,
+          pushes integer not null default 0,
+          last_error text
+        )
+        """
+    )
+    cols = {r[1] for r in con.execute("pragma table_info(rss_websub)").fetchall()}
+    for name in ("last_push_published", "last_push_video_id"):
+        if name not in cols:
+            con.execute(f"alter table rss_websub add column {name} text")
+    con.execute("create index if not exists idx_rss_websub_lease on rss_websub(lease_expires_at) where state='subscribed'")
+    con.commit()
+
+
+def topic_for(channel_id: str) -> str:
+    return TOPIC_BASE + channel_id
+
+
+def channel_from_topic(topic: str) -> Optional[str]:
+    cid = (parse_qs(urlparse(topic).query).get("channel_id") or [""])[0]
+    return cid if cid.startswith("UC") else None
+
+
+def parse_lease_seconds(value: Optional[str]) -> int:
+    """hub.lease_seconds（数字でない・0 以下なら既定値）"""
+    try:
+        lease = int(value or "")
+    except ValueError:
+        return LEASE_SEC_DEFAULT
+    return lease if lease > 0 else LEASE_SEC_DEFAULT
+
+
+def sign(secret: str, body: bytes) -> str:
+    return "sha1=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha1).hexdigest()
+
+
+class PushedChannels:
+    """
+    rss_watcher 用: プッシュのリースが有効なチャンネルの巡回間隔の下限
+
+    リース期限はメモリ上の辞書に持ち、巡回ごとには DB を引かない。
+    load() は起動時と、FeedWriter のスレッドから PUSHED_RELOAD_SEC ごとに呼ばれる（部分インデックスの範囲のみ）。
+    """
+
+    def __init__(self, poll_sec: int = PUSH_POLL_SEC_DEFAULT):
+        self.poll_sec = poll_sec
+        self.leases: Dict[str, float] = {}
+
+    def load(self, con: sqlite3.Connection) -> int:
+        leases: Dict[str, float] = {}
+        for cid, exp in con.execute(
+            "select channel_id, lease_expires_at from rss_websub where state='subscribed' and lease_expires_at > ?",
+            (_iso(_utcnow()),),
+        ):
+            try:
+                leases[cid] = datetime.fromisoformat(exp).timestamp()
+            except (TypeError, ValueError):
+                continue
+        self.leases = leases
+        return len(leases)
+
+    def active(self, channel_id: str) -> bool:
+        exp = self.leases.get(channel_id)
+        return exp is not None and exp > time.time()
+
+    def floor(self, channel_id: str) -> Optional[int]:
+        """購読中なら次回巡回までの最短秒数（ジッタ付き）、そうでなければ None"""
+        if self.poll_sec <= 0 or not self.active(channel_id):
+            return None
+        return int(self.poll_sec * random.uniform(0.8, 1.2))
+
+
+# --- 受信 ---
+
+
+def ingest(con: sqlite3.Connection, body: bytes) -> Tuple[int, int]:
+    """通知の Atom を取り込み、(エントリ数, 新規数) を返す。FeedWriter と同じ insert_video を使う"""
+    entries, _ = parse_feed(body)
+    now = _iso(_utcnow())
+    new = 0
+    # チャンネルごとの最新エントリ (published, video_id)
+    latest: Dict[str, Tuple[str, str]] = {}
+    cur = con.cursor()
+    for ent in entries:
+        cid = ent.get("channel_id")
+        if not cid:
+            continue
+        pub = ent.get("published")
+        latest.setdefault(cid, ("", ""))
+        if pub and pub > latest[cid][0]:
+            latest[cid] = (pub, ent["video_id"])
+        new_v, new_d = insert_video(cur, ent["video_id"], cid, ent.get("title"), pub, now)
+        if new_v and pub:
+            cur.execute(INCREMENT_SQL, (cid, pub))
+        if new_v or new_d:
+            new += 1
+    for cid, (pub, vid) in latest.items():
+        # プッシュ側の最新位置はここだけに持つ。rss_channels.last_seen_* は巡回の結果だけで進める
+        # （進めると次の巡回がプッシュ済みの動画で打ち切り、hub が届け損ねた古い動画を拾えなくなる）
+        cur.execute(
+            """
+            update rss_websub set last_push_at=?, pushes=pushes+1,
+              last_push_video_id=case when ? != '' and (last_push_published is null or last_push_published < ?) then ? else last_push_video_id end,
+              last_push_published=case when ? != '' and (last_push_published is null or last_push_published < ?) then ? else last_push_published end
+            where channel_id=?
+            """,
+            (now, pub, pub, vid, pub, pub, pub, cid),
+        )
+    con.commit()
+    return len(entries), new
+
+
+def make_handler(db: str, secret: Optional[str], path: str, stats: Dict[str, int]):
+    # 受信は少量なので接続は 1 本をロックで共有する
+    lock = threading.Lock()
+    stats_lock = threading.Lock()
+    con = sqlite3.connect(db, timeout=60, check_same_thread=False)
+    con.execute("pragma journal_mode=WAL;")
+
+    def bump(key: str, n: int = 1) -> None:
+        with stats_lock:
+            stats[key] = stats.get(key, 0) + n
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: bytes = b"") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_GET(self):  # noqa: N802
+            u = urlparse(self.path)
+            if u.path != path:
+                self._reply(404)
+                return
+            q = {k: v[0] for k, v in parse_qs(u.query).items()}
+            mode, topic, challenge = q.get("hub.mode"), q.get("hub.topic", ""), q.get("hub.challenge", "")
+            cid = channel_from_topic(topic)
+            if cid is None:
+                self._reply(404)
+                return
+            now = _utcnow()
+            with lock:
+                row = con.execute("select state from rss_websub where channel_id=?", (cid,)).fetchone()
+                if mode == "subscribe" and row and row[0] in ("pending", "subscribed") and challenge:
+                    lease = parse_lease_seconds(q.get("hub.lease_seconds"))
+                    con.execute(
+                        "update rss_websub set state='subscribed', verified_at=?, lease_expires_at=?, last_error=null "
+                        "where channel_id=?",
+                        (_iso(now), _iso(now + timedelta(seconds=lease)), cid),
+                    )
+                    con.commit()
+                    bump("verified")
+                    self._reply(200, challenge.encode("utf-8"))
+                    return
+                if mode == "unsubscribe" and challenge and (not row or row[0] != "subscribed"):
+                    # こちらが購読を望んでいない場合だけ解除を承認する
+                    bump("unsubscribed")
+                    self._reply(200, challenge.encode("utf-8"))
+                    return
+                if mode == "denied" and row:
+                    con.execute(
+                        "update rss_websub set state='denied', last_error=? where channel_id=?",
+                        (q.get("hub.reason") or "denied", cid),
+                    )
+                    con.commit()
+                    bump("denied")
+                    self._reply(200)
+                    return
+            self._reply(404)
+
+        def do_POST(self):  # noqa: N802
+            u = urlparse(self.path)
+            if u.path != path:
+                self._reply(404)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if secret:
+                got = self.headers.get("X-Hub-Signature") or ""
+                if not hmac.compare_digest(got, sign(secret, body)):
+                    # 仕様上 2xx を返して破棄する（hub に再送させない）
+                    bump("bad_signature")
+                    self._reply(202)
+                    return
+            try:
+                with lock:
+                    n, new = ingest(con, body)
+            except ParseError:
+                bump("bad_body")
+                self._reply(400)
+                return
+            except sqlite3.Error as e:
+                bump("db_error")
+                print(f"websub ingest error: {e}")
+                self._reply(500)
+                return
+            bump("notifications")
+            bump("entries", n)
+            bump("new_videos", new)
+            self._reply(204)
+
+        def log_message(self, format, *args):  # noqa: A002
+            pass
+
+    return Handler
+
+
+# --- 購読・更新 ---
+
+
+def due_subscriptions(con: sqlite3.Connection, limit: int, max_subscriptions: int, margin_sec: int) -> List[str]:
+    """今回 subscribe を送るチャンネル（期限が近い購読 → 検証待ちのまま古い購読 → 未購読の活発なチャンネル）"""
+    now = _utcnow()
+    retry_before = _iso(now - timedelta(seconds=PENDING_RETRY_SEC))
+    out = [
+        r[0]
+        for r in con.execute(
+            "select channel_id from rss_websub where state='subscribed' and lease_expires_at < ? "
+            "and (requested_at is null or requested_at < ?) order by lease_expires_at limit ?",
+            (_iso(now + timedelta(seconds=margin_sec)), retry_before, limit),
+        )
+    ]
+    if len(out) < limit:
+        out += [
+            r[0]
+            for r in con.execute(
+                "select channel_id from rss_websub where state in ('pending', 'failed') and requested_at < ? "
+                "order by requested_at limit ?",
+                (retry_before, limit - len(out)),
+            )
+        ]
+    if len(out) < limit:
+        have = con.execute("select count(*) from rss_websub where state in ('pending', 'subscribed')").fetchone()[0]
+        room = min(limit - len(out), max(0, max_subscriptions - have))
+        if room:
+            out += [
+                r[0]
+                for r in con.execute(
+                    """
+                    select c.channel_id from rss_channels c
+                    where c.disabled=0 and not exists (select 1 from rss_websub w where w.channel_id=c.channel_id)
+                    order by c.last_seen_published desc
+                    limit ?
+                    """,
+                    (room,),
+                )
+            ]
+    return out
+
+
+def subscribe(
+    client: httpx.Client,
+    hub_url: str,
+    callback_url: str,
+    channel_id: str,
+    lease_sec: int,
+    secret: Optional[str] = None,
+    mode: str = "subscribe",
+) -> Tuple[bool, str]:
+    data = {
+        "hub.callback": callback_url,
+        "hub.topic": topic_for(channel_id),
+        "hub.verify": "async",
+        "hub.mode": mode,
+        "hub.lease_seconds": str(lease_sec),
+    }
+    if secret:
+        data["hub.secret"] = secret
+    try:
+        r = client.post(hub_url, data=data, timeout=20.0)
+    except httpx.HTTPError as e:
+        return False, f"{type(e).__name__}: {e}"
+    if r.status_code in (202, 204):
+        return True, ""
+    return False, f"HTTP {r.status_code}: {r.text[:200]}"
+
+
+def renew_round(
+    con: sqlite3.Connection,
+    client: httpx.Client,
+    args: argparse.Namespace,
+) -> Tuple[int, int]:
+    """1 回分の subscribe 送信。(成功, 失敗) を返す"""
+    ok = ng = 0
+    interval = 1.0 / args.subscribe_rps if args.subscribe_rps > 0 else 0.0
+    for cid in due_subscriptions(con, args.subscribe_batch, args.max_subscriptions, args.renew_margin):
+        sent, err = subscribe(client, args.hub_url, args.callback_url, cid, args.lease_sec, args.secret)
+        now = _iso(_utcnow())
+        # 再購読中（失敗した場合も）はリースが残っている間 subscribed のまま。検証が来れば延長される
+        con.execute(
+            """
+            insert into rss_websub(channel_id, state, requested_at, last_error) values(?, ?, ?, ?)
+            on conflict(channel_id) do update set
+              state=case when rss_websub.state='subscribed' then rss_websub.state else excluded.state end,
+              requested_at=excluded.requested_at,
+              last_error=excluded.last_error
+            """,
+            (cid, "pending" if sent else "failed", now, err or None),
+        )
+        con.commit()
+        if sent:
+            ok += 1
+        else:
+            ng += 1
+        if interval:
+            time.sleep(interval)
+    return ok, ng
+
+
+def websub_status(con: sqlite3.Connection) -> Dict[str, int]:
+    out = {r[0]: r[1] for r in con.execute("select state, count(*) from rss_websub group by state")}
+    out["active_leases"] = con.execute(
+        "select count(*) from rss_websub where state='subscribed' and lease_expires_at > ?", (_iso(_utcnow()),)
+    ).fetchone()[0]
+    return out
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="WebSub (PubSubHubbub) push receiver and subscription manager")
+    ap.add_argument("--db", default=DB_DEFAULT)
+    ap.add_argument(
+        "--callback-url",
+        default=os.getenv("WEBSUB_CALLBACK_URL"),
+        help="hub から到達できるコールバック URL（例: https://example.com/websub）。env WEBSUB_CALLBACK_URL",
+    )
+    ap.add_argument("--hub-url", default=HUB_DEFAULT, help="subscribe を送る hub の URL")
+    ap.add_argument("--host", default="127.0.0.1", help="受信サーバの待ち受けアドレス")
+    ap.add_argument("--port", type=int, default=8088)
+    ap.add_argument("--path", default=None, help="受信パス（省略時は --callback-url のパス）")
+    ap.add_argument("--secret", default=os.getenv("WEBSUB_SECRET"), help="hub.secret（X-Hub-Signature を検証）。env WEBSUB_SECRET")
+    ap.add_argument("--lease-sec", type=int, default=LEASE_SEC_DEFAULT, help="要求するリース期間（秒）")
+    ap.add_argument("--renew-margin", type=int, default=RENEW_MARGIN_SEC, help="リース期限の何秒前に再購読するか")
+    ap.add_argument("--renew-every", type=int, default=60, help="購読・更新の確認間隔（秒）")
+    ap.add_argument("--subscribe-batch", type=int, default=500, help="1 回の確認で送る subscribe の上限")
+    ap.add_argument("--subscribe-rps", type=float, default=5.0, help="subscribe 送信の上限（毎秒）")
+    ap.add_argument("--max-subscriptions", type=int, default=200000, help="購読するチャンネル数の上限（最近投稿のあった順）")
+    ap.add_argument("--no-subscribe", action="store_true", help="受信のみ（購読・更新は送らない）")
+    ap.add_argument("--status", action="store_true", help="購読状況を表示して終了")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    con = sqlite3.connect(args.db, timeout=60)
+    con.execute("pragma journal_mode=WAL;")
+    ensure_websub(con)
+    if args.status:
+        print(websub_status(con))
+        return
+    if not args.callback_url:
+        raise SystemExit("--callback-url (or WEBSUB_CALLBACK_URL) is required")
+    path = args.path or urlparse(args.callback_url).path or "/"
+    stats: Dict[str, int] = {}
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.db, args.secret, path, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="websub-http", daemon=True).start()
+    print(f"websub receiver on http://{args.host}:{server.server_address[1]}{path} (callback {args.callback_url})", flush=True)
+    try:
+        with httpx.Client(headers={"User-Agent": "ytanalyzer-websub/1.0"}) as client:
+            last: Dict[str, int] = {}
+            while True:
+                if not args.no_subscribe:
+                    ok, ng = renew_round(con, client, args)
+                    if ok or ng:
+                        print(f"subscribe: sent {ok}, failed {ng}; {websub_status(con)}", flush=True)
+                if stats != last:
+                    last = dict(stats)
+                    print(f"push: {dict(sorted(last.items()))}", flush=True)
+                time.sleep(args.renew_every)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
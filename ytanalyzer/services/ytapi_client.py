@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+YouTube Data API v3 の共通非同期クライアント（videos.list / channels.list）
+
+api_fetcher / api_refetch / channel_fetcher / api_pipeline が共有する。
+- 複数の API キーを順に使う（キーごとに QPS と 1 日のユニット上限を持つ。1 リクエスト = 1 ユニット）
+- httpx.AsyncClient で最大 concurrency 件を同時に送る（各キーの QPS は発射時刻の予約で守る）
+- 消費ユニットは quota_ledger.QuotaLedger に 1 リクエストごとに記録し、残りはそこから引く
+  （同じ DB を使う別プロセス・別フェッチャの消費も含めて判定する）
+- quotaExceeded / dailyLimitExceeded を返したキーは、太平洋時間の 0 時（クォータのリセット）まで外す。
+  台帳にも使い切りとして残すので、起動時に台帳で今日の上限に達しているキーも同じく外した状態で始める
+- 429 / 5xx / rateLimitExceeded は指数バックオフで別のキーも含めて再試行する
+- 再試行しても失敗したチャンク（全キーがクォータ切れの場合も含む）は ytapi_retry_queue に残し、
+  次回の実行で同じ endpoint の呼び出し元が先に取り出して再送する（従来のように捨てない）
+
+キーの指定: --api-key に「,」区切りで複数、または環境変数 YOUTUBE_API_KEY（同じく「,」区切り可）
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import httpx
+
+from .quota_ledger import QuotaLedger, key_id, key_label
+
+API_BASE = os.getenv("YOUTUBE_API_BASE", "https://www.googleapis.com/youtube/v3")
+UNITS = {"videos": 1, "channels": 1}
+DAILY_UNITS_DEFAULT = 10000
+CONCURRENCY_DEFAULT = 4
+MAX_ATTEMPTS = 4
+RETRY_MAX_ATTEMPTS = 10  # ytapi_retry_queue で諦めるまでの回数
+RETRY_BASE_SEC = 300
+RETRY_MAX_SEC = 6 * 3600
+
+QUOTA_REASONS = {"quotaExceeded", "dailyLimitExceeded"}
+RATE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+KEY_REASONS = {"keyInvalid", "keyExpired", "accessNotConfigured", "ipRefererBlocked"}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+try:
+    from zoneinfo import ZoneInfo
+
+    _PACIFIC: Optional[Any] = ZoneInfo("America/Los_Angeles")
+except Exception:  # tzdata が無い環境（Windows など）
+    _PACIFIC = None
+
+
+def parse_keys(value: Optional[str]) -> List[str]:
+    return [k.strip() for k in (value or "").split(",") if k.strip()]
+
+
+def _pacific_offset(dt: datetime) -> timedelta:
+    """太平洋時間の UTC オフセット。zoneinfo が使えなければ米国の夏時間規則で計算"""
+    if _PACIFIC is not None:
+        return dt.astimezone(_PACIFIC).utcoffset() or timedelta(hours=-8)
+    y = dt.year
+    # 3 月第 2 日曜 2:00 PST（10:00 UTC）〜 11 月第 1 日曜 2:00 PDT（09:00 UTC）
+    mar1 = datetime(y, 3, 1, tzinfo=timezone.utc)
+    start = mar1 + timedelta(days=(6 - mar1.weekday()) % 7 + 7, hours=10)
+    nov1 = datetime(y, 11, 1, tzinfo=timezone.utc)
+    end = nov1 + timedelta(days=(6 - nov1.weekday()) % 7, hours=9)
+    return timedelta(hours=-7) if start <= dt < end else timedelta(hours=-8)
+
+
+def pacific_day(ts: Optional[float] = None) -> str:
+    """クォータの「日」（太平洋時間の日付 YYYY-MM-DD）"""
+    dt = datetime.fromtimestamp(time.time() if ts is None else ts, tz=timezone.utc)
+    return (dt + _pacific_offset(dt)).strftime("%Y-%m-%d")
+
+
+def next_pacific_reset(ts: Optional[float] = None) -> float:
+    """次の太平洋時間 0 時（UTC の epoch 秒）"""
+    dt = datetime.fromtimestamp(time.time() if ts is None else ts, tz=timezone.utc)
+    local = dt + _pacific_offset(dt)
+    midnight = (local + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    guess = midnight - _pacific_offset(dt)
+    # 夏時間の切り替え日をまたぐ場合はオフセットを取り直す
+    return (midnight - _pacific_offset(guess)).timestamp()
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, reason: Optional[str], message: str = ""):
+        super().__init__(f"HTTP {status} {reason or ''} {message}".strip())
+        self.status = status
+        self.reason = reason
+
+
+class QuotaExhausted(Exception):
+    """使えるキーが残っていない（全キーがクォータ切れ / 上限到達 / 無効）"""
+
+
+class _Key:
+    def __init__(self, key: str, qps: float, daily_units: int, ledger: Optional[QuotaLedger] = None):
+        self.key = key
+        self.ledger = ledger
+        self.id = ledger.register(key, daily_units) if ledger is not None else key_id(key)
+        self.interval = 1.0 / max(qps, 0.01)
+        self.daily_units = daily_units
+        self.next_slot = 0.0
+        self.day = pacific_day()
+        self.used = 0
+        self.parked_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        if ledger is not None and self.remaining() <= 0:
+            # 別のプロセス（や前回の実行）が今日の分を使い切っている
+            self.parked_until = next_pacific_reset()
+
+    def remaining(self) -> int:
+        day = pacific_day()
+        if self.ledger is not None:
+            # 台帳から読む（主キーの範囲のみ）。他プロセスの消費もここで反映される
+            self.day, self.used = day, self.ledger.used(self.id, day)
+        elif day != self.day:
+            self.day, self.used = day, 0
+        return self.daily_units - self.used
+
+    def charge(self, endpoint: str, units: int) -> None:
+        self.used += units
+        self.requests += 1
+        if self.ledger is not None:
+            self.ledger.record(self.id, self.day, endpoint, units)
+
+    def fail(self, endpoint: str) -> None:
+        self.errors += 1
+        if self.ledger is not None:
+            self.ledger.record(self.id, self.day, endpoint, 0, error=True)
+
+    def park_exhausted(self) -> None:
+        """API がクォータ切れを返した: 太平洋時間の 0 時まで外し、台帳にも使い切りとして残す"""
+        self.parked_until = next_pacific_reset()
+        if self.ledger is not None:
+            self.ledger.mark_exhausted(self.id, self.day, self.daily_units)
+
+    def usable(self, units: int, now: float) -> bool:
+        return self.parked_until <= now and self.remaining() >= units
+
+    def label(self) -> str:
+        return key_label(self.key)
+
+
+def _error_reason(resp: httpx.Response) -> Tuple[Optional[str], str]:
+    try:
+        err = resp.json().get("error") or {}
+    except ValueError:
+        return None, resp.text[:200]
+    reasons = [e.get("reason") for e in err.get("errors") or [] if e.get("reason")]
+    return (reasons[0] if reasons else None), str(err.get("message") or "")[:200]
+
+
+class YtApiClient:
+    """
+    使い方:
+      async with YtApiClient(keys, qps_per_key=1.0) as api:
+          items = await api.list("videos", ids, "snippet,statistics,contentDetails")
+    """
+
+    def __init__(
+        self,
+        keys: Sequence[str],
+        qps_per_key: float = 1.0,
+        daily_units: int = DAILY_UNITS_DEFAULT,
+        concurrency: int = CONCURRENCY_DEFAULT,
+        max_attempts: int = MAX_ATTEMPTS,
+        timeout: float = 30.0,
+        base_url: str = API_BASE,
+        ledger: Optional[QuotaLedger] = None,
+    ):
+        if not keys:
+            raise ValueError("no API keys")
+        self.keys = [_Key(k, qps_per_key, daily_units, ledger) for k in keys]
+        for k in self.keys:
+            if k.parked_until > time.time():
+                print(f"ytapi: key {k.label()} has no units left today in the ledger; parked until Pacific midnight")
+        self.sem = asyncio.Semaphore(max(1, int(concurrency)))
+        self.max_attempts = max(1, int(max_attempts))
+        self.timeout = timeout
+        self.base_url = base_url.rstrip("/")
+        self.http: Optional[httpx.AsyncClient] = None
+        self.counts: Dict[str, int] = {"requests": 0, "units": 0, "retries": 0, "quota_parked": 0, "failed": 0}
+
+    async def __aenter__(self) -> "YtApiClient":
+        self.http = httpx.AsyncClient(timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+    async def _acquire(self, endpoint: str, units: int) -> _Key:
+        """使えるキーのうち最も早く撃てるものを選び、発射時刻を予約して待つ"""
+        now = time.monotonic()
+        wall = time.time()
+        usable = [k for k in self.keys if k.usable(units, wall)]
+        if not usable:
+            raise QuotaExhausted("all API keys are parked or out of daily units")
+        k = min(usable, key=lambda x: x.next_slot)
+        slot = max(now, k.next_slot)
+        k.next_slot = slot + k.interval
+        k.charge(endpoint, units)
+        self.counts["requests"] += 1
+        self.counts["units"] += units
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        return k
+
+    async def list(self, endpoint: str, ids: Sequence[str], part: str) -> List[Dict[str, Any]]:
+        """videos.list / channels.list を 1 回（最大 50 ID）。失敗は再試行し、最後は ApiError / QuotaExhausted"""
+        assert self.http is not None, "use 'async with YtApiClient(...)'"
+        units = UNITS.get(endpoint, 1)
+        last: Optional[Exception] = None
+        attempt = 0
+        async with self.sem:
+            while attempt < self.max_attempts:
+                k = await self._acquire(endpoint, units)
+                params = {"part": part, "id": ",".join(ids), "key": k.key, "maxResults": 50}
+                try:
+                    r = await self.http.get(f"{self.base_url}/{endpoint}", params=params)
+                except httpx.HTTPError as e:
+                    k.fail(endpoint)
+                    last = e
+                else:
+                    if r.status_code == 200:
+                        return r.json().get("items", [])
+                    k.fail(endpoint)
+                    reason, msg = _error_reason(r)
+                    last = ApiError(r.status_code, reason, msg)
+                    if reason in QUOTA_REASONS:
+                        # このキーは太平洋時間の 0 時まで使わない（試行回数には数えない）
+                        k.park_exhausted()
+                        self.counts["quota_parked"] += 1
+                        print(f"ytapi: key {k.label()} quota exceeded; parked until Pacific midnight")
+                        continue
+                    if reason in KEY_REASONS:
+                        k.parked_until = float("inf")
+                        print(f"ytapi: key {k.label()} rejected ({reason}); disabled for this run")
+                        continue
+                    if r.status_code not in RETRY_STATUSES and reason not in RATE_REASONS:
+                        raise last
+                attempt += 1
+                if attempt < self.max_attempts:
+                    self.counts["retries"] += 1
+                    await asyncio.sleep(min(60.0, 2.0 ** attempt) * random.uniform(0.5, 1.0))
+        assert last is not None
+        raise last
+
+    async def list_many(
+        self,
+        endpoint: str,
+        chunks: Iterable[Sequence[str]],
+        part: str,
+        on_items: Callable[[Sequence[str], List[Dict[str, Any]]], None],
+    ) -> List[Tuple[Sequence[str], Exception]]:
+        """チャンクを並行に送り、成功したものから on_items を呼ぶ。失敗した (チャンク, 例外) を返す"""
+        failed: List[Tuple[Sequence[str], Exception]] = []
+
+        async def one(ids: Sequence[str]) -> None:
+            try:
+                items = await self.list(endpoint, ids, part)
+            except (ApiError, QuotaExhausted, httpx.HTTPError) as e:
+                self.counts["failed"] += 1
+                failed.append((ids, e))
+                return
+            on_items(ids, items)
+
+        await asyncio.gather(*(one(c) for c in chunks))
+        return failed
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        keys = {
+            k.label(): {"used": k.used, "remaining": k.remaining(), "requests": k.requests, "errors": k.errors,
+                        "parked": k.parked_until > now}
+            for k in self.keys
+        }
+        return {**self.counts, "keys": keys}
+
+
+class RetryQueue:
+    """失敗したチャンクの永続キュー（ytapi_retry_queue）。ids_json は {id: 文脈（channel_id など）}"""
+
+    def __init__(self, con: sqlite3.Connection):
+        self.con = con
+        con.execute(
+            """
+            create table if not exists ytapi_retry_queue(
+              id integer primary key autoincrement,
+              endpoint text not null,
+              ids_json text not null,
+              attempts integer not null default 0,
+              next_at text,
+              last_error text,
+              created_at text
+            )
+            """
+        )
+        con.execute("create index if not exists idx_ytapi_retry_due on ytapi_retry_queue(endpoint, next_at)")
+        con.commit()
+
+    @staticmethod
+    def _iso(ts: float) -> str:
+        return datetime.fromtimestamp(ts, tz=timezone.utc).replace(microsecond=0).isoformat()
+
+    def _next_iso(self, attempts: int, next_ts: Optional[float]) -> str:
+        if next_ts is None:
+            next_ts = time.time() + min(RETRY_MAX_SEC, RETRY_BASE_SEC * 2 ** attempts)
+        return self._iso(next_ts)
+
+    def push(self, endpoint: str, ids: Dict[str, Any], error: str, next_ts: Optional[float] = None) -> None:
+        self.con.execute(
+            "insert into ytapi_retry_queue(endpoint, ids_json, attempts, next_at, last_error, created_at) values(?,?,?,?,?,?)",
+            (endpoint, json.dumps(ids), 1, self._next_iso(1, next_ts), error[:500], self._iso(time.time())),
+        )
+
+    def due(self, endpoint: str, limit: int = 1000) -> List[Tuple[int, Dict[str, Any], int]]:
+        """期限の来たチャンク (id, {id: 文脈}, これまでの試行回数)。行は成功するまで残す"""
+        rows = self.con.execute(
+            "select id, ids_json, attempts from ytapi_retry_queue where endpoint=? and next_at <= ? order by next_at limit ?",
+            (endpoint, self._iso(time.time()), limit),
+        ).fetchall()
+        return [(r[0], json.loads(r[1]), int(r[2])) for r in rows]
+
+    def done(self, row_id: int) -> None:
+        self.con.execute("delete from ytapi_retry_queue where id=?", (row_id,))
+
+    def reschedule(self, row_id: int, attempts: int, error: str, next_ts: Optional[float] = None) -> None:
+        self.con.execute(
+            "update ytapi_retry_queue set attempts=?, next_at=?, last_error=? where id=?",
+            (attempts, self._next_iso(attempts, next_ts), error[:500], row_id),
+        )
+
+    def pending(self) -> int:
+        return self.con.execute("select count(*) from ytapi_retry_queue").fetchone()[0]
+
+
+def chunk_ids(ids: Sequence[str], n: int = 50) -> List[List[str]]:
+    n = max(1, min(int(n), 50))
+    return [list(ids[i : i + n]) for i in range(0, len(ids), n)]
+
+
+def fetch_all(
+    con: sqlite3.Connection,
+    keys: Sequence[str],
+    endpoint: str,
+    part: str,
+    ids: Dict[str, Any],
+    save: Callable[[List[Dict[str, Any]], Dict[str, Any]], int],
+    *,
+    qps: float = 1.0,
+    daily_units: int = DAILY_UNITS_DEFAULT,
+    concurrency: int = CONCURRENCY_DEFAULT,
+    batch_size: int = 50,
+) -> Dict[str, int]:
+    """
+    同期の呼び出し元向け: ytapi_retry_queue の期限到来分 + ids を batch_size 件ずつ並行に取得し、
+    成功したチャンクごとに save(items, {id: 文脈}) を呼ぶ。失敗したチャンクはキューに戻す。
+    """
+    rq = RetryQueue(con)
+    # (文脈, キューの行 id または None, これまでの試行回数)
+    jobs: List[Tuple[Dict[str, Any], Optional[int], int]] = [(ctx, row_id, n) for row_id, ctx, n in rq.due(endpoint)]
+    out = {"requests": 0, "saved": 0, "failed_chunks": 0, "retried_chunks": len(jobs), "dropped_chunks": 0}
+    queued = {i for ctx, _, _ in jobs for i in ctx}
+    for chunk in chunk_ids([i for i in ids if i not in queued], batch_size):
+        jobs.append(({i: ids[i] for i in chunk}, None, 0))
+    if not jobs:
+        return out
+    by_key = {tuple(job[0]): job for job in jobs}
+
+    def on_items(chunk: Sequence[str], items: List[Dict[str, Any]]) -> None:
+        ctx, row_id, _ = by_key[tuple(chunk)]
+        out["saved"] += save(items, ctx)
+        if row_id is not None:
+            rq.done(row_id)
+            con.commit()
+
+    async def run() -> Tuple[List[Tuple[Sequence[str], Exception]], Dict[str, Any]]:
+        async with YtApiClient(keys, qps, daily_units, concurrency, ledger=QuotaLedger(con)) as api:
+            failed = await api.list_many(endpoint, [list(job[0]) for job in jobs], part, on_items)
+            return failed, api.stats()
+
+    failed, st = asyncio.run(run())
+    out["requests"] = st["requests"]
+    for chunk, err in failed:
+        ctx, row_id, attempts = by_key[tuple(chunk)]
+        # クォータ切れは次のリセット後に、それ以外は指数バックオフで再送
+        next_ts = next_pacific_reset() if isinstance(err, QuotaExhausted) else None
+        if row_id is None:
+            rq.push(endpoint, ctx, str(err), next_ts)
+        elif attempts + 1 >= RETRY_MAX_ATTEMPTS:
+            rq.done(row_id)
+            out["dropped_chunks"] += 1
+            print(f"ytapi: giving up on {len(ctx)} ids after {attempts + 1} attempts: {err}")
+            continue
+        else:
+            rq.reschedule(row_id, attempts + 1, str(err), next_ts)
+        out["failed_chunks"] += 1
+    con.commit()
+    return out
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+rss_watcher のスループット計測（回帰テスト用ハーネス）
+
+fake_feed_server を子プロセスで起動し、一時 DB に N チャンネルを登録して全件を即時巡回対象にしたうえで、
+run_daemon を --duration 秒だけ動かす。終了後に以下を表示する。
+- channels/s : 処理したチャンネル数（200/304/エラーを含む）÷ 経過秒
+- commits/s  : 書き込みスレッドのコミット数 ÷ 経過秒
+- cpu%       : このプロセス（イベントループ + 書き込みスレッド + パーススレッド）の CPU 時間 ÷ 経過秒
+- loop lag   : 50ms ごとの sleep の超過時間の p50/p99（イベントループが詰まっていないか）
+偽サーバは別プロセスなので CPU% には含まれない。
+
+使い方:
+  python -m ytanalyzer.tools.bench_watch --channels 20000 --duration 30 --rps 2000 --concurrency 200
+  python -m ytanalyzer.cli bench-watch --channels 20000 --duration 30 --p429 0.01 --json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..services import rss_watcher
+from ..services.known_ids import KnownIds
+from .fake_feed_server import FEED_PATH, write_channels_ndjson
+
+LAG_PROBE_SEC = 0.05
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "ytanalyzer.tools.fake_feed_server",
+        "--port", str(port),
+        "--channels", str(args.channels),
+        "--upload-rate", str(args.upload_rate),
+        "--etag", args.etag,
+        "--p429", str(args.p429),
+        "--p5xx", str(args.p5xx),
+        "--latency-ms", str(args.latency_ms),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"fake feed server exited: {proc.stderr.read().decode(errors='replace')}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=1).read()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("fake feed server did not start")
+
+
+def server_stats(port: int) -> Dict[str, int]:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=2) as r:
+            return json.loads(r.read())
+    except OSError:
+        return {}
+
+
+def _percentile(xs: List[float], p: float) -> Optional[float]:
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[max(0, min(len(xs) - 1, math.ceil(p / 100.0 * len(xs)) - 1))]
+
+
+async def _lag_probe(lags: List[float]) -> None:
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(LAG_PROBE_SEC)
+        lags.append(max(0.0, time.perf_counter() - t0 - LAG_PROBE_SEC))
+
+
+async def _bench(args: argparse.Namespace, db: str, feed_url: str) -> Dict[str, Any]:
+    con = rss_watcher.ensure_db(db)
+    writer = rss_watcher.FeedWriter(
+        db, flush_ms=args.commit_ms, max_ops=args.commit_ops, owner=rss_watcher.make_lease_owner(),
+        known_ids=None if args.no_known_cache else KnownIds(),
+    )
+    # (経過秒, CPU 秒, スナップショット)。停止時の後片付けは計測に含めないよう、最後の tick の値を使う
+    snaps: List[Tuple[float, float, Dict[str, Any]]] = []
+    lags: List[float] = []
+    probe = asyncio.create_task(_lag_probe(lags))
+    cpu0, t0 = time.process_time(), time.monotonic()
+
+    def report(snap: Dict[str, Any]) -> None:
+        snaps.append((time.monotonic() - t0, time.process_time() - cpu0, snap))
+
+    try:
+        await asyncio.wait_for(
+            rss_watcher.run_daemon(
+                con, writer, None, args.concurrency, args.rps, args.batch, 1, args.scheduler,
+                report=report,
+                aimd=not args.no_aimd,
+                upload_profile=False,
+                seed_interval=0,
+                parse_workers=args.parse_workers,
+                parse_pool=args.parse_pool,
+                feed_url=feed_url,
+            ),
+            timeout=args.duration,
+        )
+    except asyncio.TimeoutError:
+        pass
+    probe.cancel()
+    con.close()
+
+    wall, cpu, last = snaps[-1] if snaps else (time.monotonic() - t0, time.process_time() - cpu0, {})
+    batch = last.get("last_batch", {})
+    polled = sum(v for k, v in batch.items() if k not in ("new_videos", "unchanged", "retired", "revived"))
+    w = last.get("writer") or writer.stats()
+    p50, p99 = _percentile(lags, 50), _percentile(lags, 99)
+    return {
+        "channels": args.channels,
+        "duration_sec": round(wall, 2),
+        "channels_polled": polled,
+        "channels_per_sec": round(polled / wall, 1) if wall else 0.0,
+        "commits": w["commits"],
+        "commits_per_sec": round(w["commits"] / wall, 2) if wall else 0.0,
+        "ops_per_commit": round(w["ops"] / w["commits"], 1) if w["commits"] else 0.0,
+        "cpu_percent": round(100.0 * cpu / wall, 1) if wall else 0.0,
+        "loop_lag_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+        "loop_lag_p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+        "effective_rps": last.get("rate", {}).get("effective_rps"),
+        "last_batch": batch,
+    }
+
+
+def prepare_db(db: str, channels_file: str) -> int:
+    """チャンネルを登録し、全件を今すぐ巡回対象にする"""
+    con = rss_watcher.ensure_db(db)
+    n = rss_watcher.seed_channels(con, channels_file)
+    con.execute("update rss_channels set next_poll_at=?", (rss_watcher._utciso(),))
+    con.commit()
+    con.close()
+    return n
+
+
+def format_result(res: Dict[str, Any]) -> str:
+    lines = [
+        f"channels/s   {res['channels_per_sec']:>10}  ({res['channels_polled']} in {res['duration_sec']}s)",
+        f"commits/s    {res['commits_per_sec']:>10}  ({res['ops_per_commit']} ops/commit)",
+        f"cpu%         {res['cpu_percent']:>10}",
+        f"loop lag p99 {res['loop_lag_p99_ms']:>10} ms  (p50 {res['loop_lag_p50_ms']} ms)",
+        f"rps (eff.)   {res['effective_rps']:>10}",
+        f"statuses     {res.get('server_statuses', {})}",
+    ]
+    return "\n".join(lines)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Benchmark rss_watcher against a local fake feed server")
+    ap.add_argument("--channels", type=int, default=5000)
+    ap.add_argument("--duration", type=float, default=30.0, help="計測秒数")
+    ap.add_argument("--rps", type=float, default=1000.0)
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--batch", type=int, default=2000, help="1 tick（1 秒）で投入する最大件数")
+    ap.add_argument("--scheduler", choices=["db", "heap"], default="heap")
+    ap.add_argument("--commit-ms", type=int, default=200)
+    ap.add_argument("--commit-ops", type=int, default=2000)
+    ap.add_argument("--parse-workers", type=int, default=0)
+    ap.add_argument("--parse-pool", choices=["thread", "process"], default="thread")
+    ap.add_argument("--no-aimd", action="store_true")
+    ap.add_argument("--no-known-cache", action="store_true", help="既知 ID キャッシュを使わない（比較用）")
+    ap.add_argument("--upload-rate", type=float, default=0.5, help="偽サーバ: 1 チャンネルあたり 1 時間の投稿本数")
+    ap.add_argument("--etag", choices=["on", "off", "unstable"], default="on", help="偽サーバ: ETag/304 の挙動")
+    ap.add_argument("--p429", type=float, default=0.0, help="偽サーバ: 429 を返す確率")
+    ap.add_argument("--p5xx", type=float, default=0.0, help="偽サーバ: 5xx を返す確率")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="偽サーバ: 平均応答遅延（ミリ秒）")
+    ap.add_argument("--port", type=int, default=0, help="偽サーバのポート（0 で空きポート）")
+    ap.add_argument("--keep-db", default=None, help="計測に使った DB をこのパスに残す")
+    ap.add_argument("--json", action="store_true", help="JSON で出力")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    port = args.port or _free_port()
+    with tempfile.TemporaryDirectory(prefix="bench_watch_") as tmp:
+        db = args.keep_db or os.path.join(tmp, "bench.sqlite")
+        channels_file = write_channels_ndjson(os.path.join(tmp, "channels.ndjson"), args.channels)
+        prepare_db(db, channels_file)
+        server = start_server(args, port)
+        try:
+            res = asyncio.run(_bench(args, db, f"http://127.0.0.1:{port}{FEED_PATH}"))
+            res["server_statuses"] = server_stats(port)
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+    if args.json:
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+    else:
+        print(format_result(res))
+
+
+if __name__ == "__main__":
+    main()
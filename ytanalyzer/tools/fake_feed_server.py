@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+ローカルの偽 YouTube フィードサーバ（rss_watcher の負荷試験用）
+
+GET /feeds/videos.xml?channel_id=UC... に対し、合成した Atom フィードを返す。
+- チャンネル i の動画本数は時刻の関数 floor(経過秒 × upload_rate/3600 + 位相_i) で決まり、
+  プロセスを再起動しても同じ入力なら同じフィードになる（最新 15 件を新しい順に返す）
+- ETag は動画本数から作り、If-None-Match が一致すれば 304（--etag off で無効、unstable で毎回変える）
+- --p429 / --p5xx の確率でエラーを返す。--latency-ms（平均、指数分布）で応答を遅らせる
+- 未知の channel_id（--channels の範囲外）は 404
+
+使い方:
+  python -m ytanalyzer.tools.fake_feed_server --port 8765 --channels 20000 --upload-rate 0.5 --p429 0.01
+  python -m ytanalyzer.services.rss_watcher --channels-file data/fake_channels.ndjson --feed-url http://127.0.0.1:8765/feeds/videos.xml
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+FEED_PATH = "/feeds/videos.xml"
+ENTRIES_PER_FEED = 15
+
+_FEED_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" '
+    'xmlns:media="http://search.yahoo.com/mrss/" xmlns="http://www.w3.org/2005/Atom">\n'
+    ' <link rel="self" href="http://www.youtube.com/feeds/videos.xml?channel_id={cid}"/>\n'
+    " <id>yt:channel:{cid_short}</id>\n"
+    " <yt:channelId>{cid}</yt:channelId>\n"
+    " <title>Fake channel {idx}</title>\n"
+    " <published>2015-01-01T00:00:00+00:00</published>\n"
+)
+_ENTRY = (
+    " <entry>\n"
+    "  <id>yt:video:{vid}</id>\n"
+    "  <yt:videoId>{vid}</yt:videoId>\n"
+    "  <yt:channelId>{cid}</yt:channelId>\n"
+    "  <title>Synthetic video {k} of channel {idx}</title>\n"
+    '  <link rel="alternate" href="https://www.youtube.com/watch?v={vid}"/>\n'
+    "  <published>{pub}</published>\n"
+    "  <updated>{pub}</updated>\n"
+    "  <media:group>\n"
+    "   <media:title>Synthetic video {k}</media:title>\n"
+    '   <media:thumbnail url="https://i1.ytimg.com/vi/{vid}/hqdefault.jpg" width="480" height="360"/>\n'
+    "   <media:description>{desc}</media:description>\n"
+    '   <media:community><media:starRating count="0" average="0.00" min="1" max="5"/>'
+    '<media:statistics views="{views}"/></media:community>\n'
+    "  </media:group>\n"
+    " </entry>\n"
+)
+_DESC = "lorem ipsum dolor sit amet " * 12
+
+
+def channel_id(idx: int) -> str:
+    """index → UC + 22 文字（決定的）"""
+    h = hashlib.blake2b(str(idx).encode(), digest_size=16).hexdigest()
+    return "UC" + (f"{idx:06d}" + h)[:22]
+
+
+def channel_index(cid: str) -> Optional[int]:
+    if not cid.startswith("UC") or len(cid) != 24:
+        return None
+    try:
+        idx = int(cid[2:8])
+    except ValueError:
+        return None
+    return idx if channel_id(idx) == cid else None
+
+
+def write_channels_ndjson(path: str, n: int) -> str:
+    """rss_watcher --channels-file 互換の NDJSON を書き出す"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            f.write(json.dumps({"youtube_channel_url": f"https://www.youtube.com/channel/{channel_id(i)}"}) + "\n")
+    return path
+
+
+class FakeFeeds:
+    def __init__(
+        self,
+        channels: int,
+        upload_rate: float = 0.5,
+        etag: str = "on",
+        p429: float = 0.0,
+        p5xx: float = 0.0,
+        latency_ms: float = 0.0,
+        start: Optional[float] = None,
+    ):
+        self.channels = channels
+        self.rate = max(0.0, upload_rate) / 3600.0  # 1 チャンネルあたり毎秒の投稿数
+        self.etag = etag
+        self.p429 = p429
+        self.p5xx = p5xx
+        self.latency = latency_ms / 1000.0
+        self.start = time.time() if start is None else start
+        self.counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, status: int) -> None:
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def _phase(self, idx: int) -> float:
+        # 起動直後から 15 本以上あるように、チャンネルごとに 20〜200 本分ずらす
+        return 20.0 + (idx * 7919 % 180)
+
+    def n_videos(self, idx: int, now: float) -> int:
+        return int((now - self.start) * self.rate + self._phase(idx))
+
+    def render(self, idx: int, n: int) -> bytes:
+        cid = channel_id(idx)
+        parts: List[str] = [_FEED_HEAD.format(cid=cid, cid_short=cid[2:], idx=idx)]
+        for k in range(n - 1, max(-1, n - 1 - ENTRIES_PER_FEED), -1):
+            vid = (cid[2:8] + f"{k:05d}")[-11:]
+            # 投稿時刻: 本数が k+1 になった時刻
+            ts = self.start + (k + 1 - self._phase(idx)) / self.rate if self.rate else self.start - (n - k) * 86400
+            pub = datetime.fromtimestamp(ts, tz=timezone.utc).replace(microsecond=0).isoformat()
+            parts.append(_ENTRY.format(vid=vid, cid=cid, k=k, idx=idx, pub=pub, desc=_DESC, views=(n - k) * 137))
+        parts.append("</feed>\n")
+        return "".join(parts).encode("utf-8")
+
+    def etag_for(self, idx: int, n: int) -> Optional[str]:
+        if self.etag == "off":
+            return None
+        if self.etag == "unstable":
+            return f'"{idx}-{n}-{random.getrandbits(32):08x}"'
+        return f'"{idx}-{n}"'
+
+
+def make_handler(feeds: FakeFeeds):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None) -> None:
+            feeds.count(status)
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_GET(self):  # noqa: N802
+            u = urlparse(self.path)
+            if u.path == "/stats":
+                body = json.dumps({str(k): v for k, v in sorted(feeds.counts.items())}).encode()
+                self._reply(200, body, {"Content-Type": "application/json"})
+                return
+            if u.path != FEED_PATH:
+                self._reply(404)
+                return
+            if feeds.latency:
+                time.sleep(random.expovariate(1.0 / feeds.latency))
+            r = random.random()
+            if r < feeds.p429:
+                self._reply(429, b"Too Many Requests", {"Retry-After": "60"})
+                return
+            if r < feeds.p429 + feeds.p5xx:
+                self._reply(random.choice((500, 502, 503)))
+                return
+            cid = (parse_qs(u.query).get("channel_id") or [""])[0]
+            idx = channel_index(cid)
+            if idx is None or idx >= feeds.channels:
+                self._reply(404)
+                return
+            n = feeds.n_videos(idx, time.time())
+            etag = feeds.etag_for(idx, n)
+            if etag and self.headers.get("If-None-Match") == etag:
+                self._reply(304, headers={"ETag": etag})
+                return
+            headers = {"Content-Type": "text/xml; charset=UTF-8"}
+            if etag:
+                headers["ETag"] = etag
+            self._reply(200, feeds.render(idx, n), headers)
+
+        def log_message(self, format, *args):  # noqa: A002
+            pass
+
+    return Handler
+
+
+def serve(feeds: FakeFeeds, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(feeds))
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    return server
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Fake YouTube channel feed server for load testing rss_watcher")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--channels", type=int, default=10000, help="チャンネル数（channel_id は決定的に生成）")
+    ap.add_argument("--upload-rate", type=float, default=0.5, help="1 チャンネルあたり 1 時間の投稿本数")
+    ap.add_argument("--etag", choices=["on", "off", "unstable"], default="on", help="ETag/304 の挙動")
+    ap.add_argument("--p429", type=float, default=0.0, help="429 を返す確率")
+    ap.add_argument("--p5xx", type=float, default=0.0, help="5xx を返す確率")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="平均応答遅延（ミリ秒、指数分布）")
+    ap.add_argument("--write-ndjson", default=None, help="チャンネル一覧 NDJSON を書き出すパス")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    if args.write_ndjson:
+        write_channels_ndjson(args.write_ndjson, args.channels)
+        print(f"wrote {args.channels} channels -> {args.write_ndjson}")
+    feeds = FakeFeeds(args.channels, args.upload_rate, args.etag, args.p429, args.p5xx, args.latency_ms)
+    server = serve(feeds, args.port, args.host)
+    print(f"fake feed server on http://{args.host}:{server.server_address[1]}{FEED_PATH}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"responses: {dict(sorted(feeds.counts.items()))}")
+
+
+if __name__ == "__main__":
+    main()
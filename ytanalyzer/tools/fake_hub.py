@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+ローカルの WebSub hub の代役（services/websub.py の試験用）
+
+- POST /subscribe : hub.mode / hub.topic / hub.callback / hub.lease_seconds / hub.secret を受け取り 202。
+                    別スレッドでコールバックに GET（hub.challenge）して検証し、応答が一致したら購読として登録
+- POST /publish?channel_id=UC... : そのチャンネルの購読者へ合成の新着通知（Atom）を送る（secret があれば X-Hub-Signature 付き）
+- GET  /stats     : 購読数・送信数
+--auto-per-min を指定すると、購読中のチャンネルからランダムに選んで毎分その件数の新着を送る。
+
+使い方:
+  python -m ytanalyzer.tools.fake_hub --port 8090 --auto-per-min 30
+  python -m ytanalyzer.services.websub --hub-url http://127.0.0.1:8090/subscribe --callback-url http://127.0.0.1:8088/websub
+  curl -X POST "http://127.0.0.1:8090/publish?channel_id=UCxxxx"
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import httpx
+
+_NOTIFY = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">\n'
+    ' <link rel="hub" href="{hub}"/>\n'
+    ' <link rel="self" href="{topic}"/>\n'
+    " <title>YouTube video feed</title>\n"
+    " <updated>{now}</updated>\n"
+    " <entry>\n"
+    "  <id>yt:video:{vid}</id>\n"
+    "  <yt:videoId>{vid}</yt:videoId>\n"
+    "  <yt:channelId>{cid}</yt:channelId>\n"
+    "  <title>Pushed video {vid}</title>\n"
+    '  <link rel="alternate" href="https://www.youtube.com/watch?v={vid}"/>\n'
+    "  <author><name>Fake channel</name><uri>https://www.youtube.com/channel/{cid}</uri></author>\n"
+    "  <published>{now}</published>\n"
+    "  <updated>{now}</updated>\n"
+    " </entry>\n"
+    "</feed>\n"
+)
+
+
+class FakeHub:
+    def __init__(self, base_url: str, verify_delay: float = 0.0):
+        self.base_url = base_url
+        self.verify_delay = verify_delay
+        # topic -> (callback, secret, expires_at)
+        self.subs: Dict[str, Tuple[str, Optional[str], float]] = {}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def verify(self, mode: str, topic: str, callback: str, lease: int, secret: Optional[str]) -> None:
+        if self.verify_delay:
+            time.sleep(self.verify_delay)
+        challenge = secrets.token_hex(8)
+        sep = "&" if urlparse(callback).query else "?"
+        q = urlencode({"hub.mode": mode, "hub.topic": topic, "hub.challenge": challenge, "hub.lease_seconds": lease})
+        try:
+            r = httpx.get(callback + sep + q, timeout=10.0)
+        except httpx.HTTPError:
+            self.bump("verify_error")
+            return
+        if not (200 <= r.status_code < 300 and r.text == challenge):
+            self.bump("verify_rejected")
+            return
+        with self._lock:
+            if mode == "subscribe":
+                self.subs[topic] = (callback, secret, time.time() + lease)
+            else:
+                self.subs.pop(topic, None)
+        self.bump(f"verified_{mode}")
+
+    def publish(self, topic: str) -> Optional[int]:
+        with self._lock:
+            sub = self.subs.get(topic)
+        if sub is None or sub[2] < time.time():
+            return None
+        callback, secret, _ = sub
+        cid = (parse_qs(urlparse(topic).query).get("channel_id") or [""])[0]
+        vid = secrets.token_urlsafe(8)[:11]
+        now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+        body = _NOTIFY.format(hub=self.base_url, topic=topic, now=now, vid=vid, cid=cid).encode("utf-8")
+        headers = {"Content-Type": "application/atom+xml"}
+        if secret:
+            headers["X-Hub-Signature"] = "sha1=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha1).hexdigest()
+        try:
+            r = httpx.post(callback, content=body, headers=headers, timeout=10.0)
+        except httpx.HTTPError:
+            self.bump("push_error")
+            return 0
+        self.bump(f"push_{r.status_code}")
+        return r.status_code
+
+    def topics(self) -> List[str]:
+        now = time.time()
+        with self._lock:
+            return [t for t, (_, _, exp) in self.subs.items() if exp > now]
+
+
+def make_handler(hub: FakeHub):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: bytes = b"") -> None:
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_GET(self):  # noqa: N802
+            if urlparse(self.path).path == "/stats":
+                with hub._lock:
+                    data = {"subscriptions": len(hub.subs), **hub.counts}
+                self._reply(200, json.dumps(data).encode())
+                return
+            self._reply(404)
+
+        def do_POST(self):  # noqa: N802
+            u = urlparse(self.path)
+            if u.path == "/subscribe":
+                n = int(self.headers.get("Content-Length") or 0)
+                form = {k: v[0] for k, v in parse_qs(self.rfile.read(n).decode("utf-8")).items()}
+                mode, topic, callback = form.get("hub.mode"), form.get("hub.topic"), form.get("hub.callback")
+                if mode not in ("subscribe", "unsubscribe") or not topic or not callback:
+                    self._reply(400, b"bad request")
+                    return
+                lease = int(form.get("hub.lease_seconds") or 432000)
+                hub.bump(f"requested_{mode}")
+                threading.Thread(
+                    target=hub.verify, args=(mode, topic, callback, lease, form.get("hub.secret")), daemon=True
+                ).start()
+                self._reply(202)
+                return
+            if u.path == "/publish":
+                cid = (parse_qs(u.query).get("channel_id") or [""])[0]
+                st = hub.publish(f"https://www.youtube.com/xml/feeds/videos.xml?channel_id={cid}")
+                self._reply(200 if st else 404, str(st).encode())
+                return
+            self._reply(404)
+
+        def log_message(self, format, *args):  # noqa: A002
+            pass
+
+    return Handler
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Local stand-in WebSub hub for testing the push receiver")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8090)
+    ap.add_argument("--verify-delay", type=float, default=0.0, help="subscribe 受付から検証 GET までの遅延（秒）")
+    ap.add_argument("--auto-per-min", type=float, default=0.0, help="購読中のチャンネルへ毎分送る合成通知の件数")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    hub = FakeHub(f"http://{args.host}:{args.port}/subscribe", args.verify_delay)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(hub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-hub", daemon=True).start()
+    print(f"fake hub on http://{args.host}:{server.server_address[1]}/subscribe", flush=True)
+    try:
+        while True:
+            if args.auto_per_min > 0:
+                time.sleep(random.expovariate(args.auto_per_min / 60.0))
+                topics = hub.topics()
+                if topics:
+                    hub.publish(random.choice(topics))
+            else:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(json.dumps({"subscriptions": len(hub.subs), **hub.counts}))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,9 @@ from urllib.parse import quote_plus
 import time
 from datetime import datetime, timezone, timedelta
 from ..config import Config
+from ..services.latency_ledger import latency_report
+from ..services.quota_ledger import quota_report
+from ..services.stats_counters import get_counters, hourly_since, row_count
 import traceback
 
 
@@ -281,10 +284,41 @@ def create_app(cfg: Config | None = None) -> Flask:
     def health():
         try:
             con = _rss_con(); cur = con.cursor()
-            n = cur.execute("select count(*) from trending_ranks").fetchone()[0]
+            # stats_counters（トリガで維持）から読む。カウンタ未導入の DB のみ count(*)
+            n = row_count(con, "trending_ranks")
+            if n is None:
+                n = cur.execute("select count(*) from trending_ranks").fetchone()[0]
+            extra = {
+                "channels": row_count(con, "rss_channels"),
+                "videos": row_count(con, "rss_videos"),
+                "discovered_last_hour": hourly_since(con, "discovered", 1),
+                "poll_status": get_counters(con, "poll:"),
+            }
         except Exception:
-            n = 0
-        return jsonify({"ok": True, "trending": int(n)}), 200
+            n, extra = 0, {}
+        return jsonify({"ok": True, "trending": int(n), **extra}), 200
+
+    @app.route("/latency.json")
+    def latency_json():
+        # 検出レイテンシ（published→discovered→first snapshot→ranked）の p50/p95/p99（秒）
+        # 数字でない ?hours= は既定の 24 時間（type=int は変換できなければ既定値を返す）
+        hours = max(1, min(24 * 30, request.args.get("hours", 24, type=int)))
+        con = _rss_con_ro()
+        try:
+            rep = latency_report(con, hours)
+        finally:
+            con.close()
+        return jsonify(rep)
+
+    @app.route("/quota.json")
+    def quota_json():
+        # YouTube API のキー別消費・残り・燃焼速度（太平洋時間の日付。?day=YYYY-MM-DD で過去日）
+        con = _rss_con_ro()
+        try:
+            rep = quota_report(con, request.args.get("day") or None)
+        finally:
+            con.close()
+        return jsonify(rep)
 
     @app.route("/trending.json")
     def trending_json():